@@ -16,4 +16,29 @@
 
 # Just for the name
 class EncryptionException(Exception):
-    pass
\ No newline at end of file
+    """
+    Base of all LocSec errors.
+     Message may be a format string with its arguments passed after it, it is formatted only when it's shown
+     (rejecting lots of bad chunks doesn't spend time on messages nobody reads)
+    """
+
+    def __str__(self):
+        if len(self.args) > 1:
+            return self.args[0].format(*self.args[1:])
+        return super().__str__()
+
+
+class MalformedChunkException(EncryptionException):
+    """Data is not a LocSec chunk (or stream): bad length, magic, version, flags or framing"""
+
+
+class HashMismatchException(EncryptionException):
+    """Data integrity check failed: sha256 (CBC) or GCM tag mismatch"""
+
+
+class BadKeyException(EncryptionException):
+    """Encryption key is bad, doesn't fit the chunk or is missing"""
+
+
+class OversizeException(EncryptionException):
+    """Data (or a frame, or decompressed data) is bigger than LocSec supports"""
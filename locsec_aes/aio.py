@@ -0,0 +1,223 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import asyncio
+import functools
+import os
+import weakref
+
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException
+from locsec_aes.encryption import LocSecCipher, _failure
+from locsec_aes.streaming import default_segment_size, _stream_header, _frame_header, _check_segment_size, \
+    _new_stream_header, _parse_stream_header, _parse_frame_header, _segment_data, _check_segment
+
+'''
+asyncio API. Small data is encrypted/decrypted right in the event loop (handing it to a thread would cost more
+ than the work itself), bigger data (and containers, their size isn't known before encoding) goes to an executor,
+ so the loop isn't blocked for milliseconds.
+ A semaphore limits the amount of data pieces being processed in the executor at once.
+Streams use the same format as locsec_aes.streaming.
+'''
+
+# Data up to this size (in bytes) is processed in the event loop
+default_inline_length = 65536
+default_max_in_flight = os.cpu_count() or 1
+
+
+class AsyncCipher:
+    """
+    LocSecCipher for asyncio code.
+    """
+
+    def __init__(self, encryption_key, executor=None, max_in_flight=default_max_in_flight,
+                 inline_length=default_inline_length, **cipher_options):
+        """
+        :param encryption_key: Encryption key
+        :param executor: concurrent.futures.Executor for big data (default executor of the loop if not specified)
+        :param max_in_flight: Max amount of data pieces processed in the executor at once (per event loop)
+        :param inline_length: Data up to this size (in bytes) is processed in the event loop
+        :param cipher_options: LocSecCipher options (mode, typed, compression, padding...)
+        """
+        if max_in_flight < 1:
+            raise EncryptionException("Bad max_in_flight: should be at least 1.")
+        self.cipher = LocSecCipher(encryption_key, **cipher_options)
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self.inline_length = inline_length
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def encrypt(self, data, **options):
+        """
+        Encrypting data (see LocSecCipher.encrypt)
+        :param data: Data to encrypt
+        :param options: LocSecCipher.encrypt options (initial_vector, mode, typed, compression, padding...)
+        :return: Encrypted LocSec chunk
+        """
+        return await self._run(_data_length(data), functools.partial(self.cipher.encrypt, data, **options))
+
+    async def decrypt(self, data_to_dec, return_raw=False):
+        """
+        Decrypting data (see LocSecCipher.decrypt)
+        :param data_to_dec: Data to decrypt
+        :param return_raw: Whether to return raw (bytearray) data or stringified (or decoded, if it was typed)
+        :return: decrypted data
+        """
+        return await self._run(_data_length(data_to_dec),
+                               functools.partial(self.cipher.decrypt, data_to_dec, return_raw))
+
+    async def _run(self, data_length, function):
+        if data_length is not None and data_length <= self.inline_length:
+            return function()
+        async with self._semaphore():
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function)
+
+    def _semaphore(self):
+        # asyncio primitives belong to one event loop
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_in_flight)
+        return semaphore
+
+
+@functools.lru_cache(maxsize=16)
+def _async_cipher_for_key(encryption_key):
+    return AsyncCipher(encryption_key)
+
+
+async def encrypt(data, encryption_key, **options):
+    """
+    Encrypting data without blocking the event loop for long (default AsyncCipher settings).
+    :param data: Data to encrypt
+    :param encryption_key: Encryption key
+    :param options: LocSecCipher.encrypt options (initial_vector, mode, typed, compression, padding...)
+    :return: Encrypted LocSec chunk
+    """
+    return await _async_cipher_for_key(encryption_key).encrypt(data, **options)
+
+
+async def decrypt(data_to_dec, encryption_key, return_raw=False):
+    """
+    Decrypting data without blocking the event loop for long (default AsyncCipher settings).
+    :param data_to_dec: Data to decrypt
+    :param encryption_key: Encryption key
+    :param return_raw: Whether to return raw (bytearray) data or stringified (or decoded, if it was typed)
+    :return: decrypted data
+    """
+    return await _async_cipher_for_key(encryption_key).decrypt(data_to_dec, return_raw)
+
+
+async def encrypt_stream(reader, writer, encryption_key, segment_size=default_segment_size, mode=None,
+                         compression=None):
+    """
+    Encrypting an asyncio stream segment by segment (same format as locsec_aes.streaming.encrypt_stream).
+    :param reader: asyncio.StreamReader with data to encrypt
+    :param writer: asyncio.StreamWriter for the encrypted stream (not closed)
+    :param encryption_key: Encryption key or an AsyncCipher
+    :param segment_size: Amount of data (in bytes) that goes to one LocSec chunk
+    :param mode: Encryption mode ("cbc" or "gcm", default of the cipher if not specified)
+    :param compression: Compression method for segments before encryption ("zlib", "lzma", "bz2" or False,
+     default of the cipher if not specified)
+    :return: Amount of data (in bytes) read from reader
+    """
+    _check_segment_size(segment_size)
+    cipher = _async_cipher(encryption_key)
+    stream_id, header = _new_stream_header()
+    writer.write(header)
+    total = 0
+    index = 0
+    segment = await _read_exact(reader, segment_size)
+    while True:
+        # Reading one segment ahead: the last one is marked final
+        next_segment = await _read_exact(reader, segment_size) if len(segment) == segment_size else b""
+        chunk = await cipher.encrypt(_segment_data(stream_id, index, not next_segment, segment), mode=mode,
+                                     compression=compression)
+        writer.write(_frame_header.pack(len(chunk)))
+        writer.write(chunk)
+        # Not reading further than the other side can take
+        await writer.drain()
+        total += len(segment)
+        if not next_segment:
+            break
+        segment = next_segment
+        index += 1
+    writer.write(_frame_header.pack(0))
+    await writer.drain()
+    return total
+
+
+async def decrypt_stream(reader, writer, encryption_key):
+    """
+    Decrypting an asyncio stream created by encrypt_stream (or locsec_aes.streaming.encrypt_stream).
+    :param reader: asyncio.StreamReader with the encrypted stream
+    :param writer: asyncio.StreamWriter for decrypted data (not closed)
+    :param encryption_key: Encryption key or an AsyncCipher
+    :return: Amount of data (in bytes) written to writer
+    """
+    stream_id = _parse_stream_header(await _read_exact(reader, _stream_header.size))
+    cipher = _async_cipher(encryption_key)
+    total = 0
+    index = 0
+    final = False
+    while True:
+        frame_length = _parse_frame_header(await _read_exact(reader, _frame_header.size), final)
+        if frame_length == 0:
+            return total
+        chunk = bytearray(await _read_exact(reader, frame_length))
+        if len(chunk) < frame_length:
+            raise MalformedChunkException("Could not decrypt stream: stream is truncated.")
+        try:
+            segment = await cipher.decrypt(chunk, return_raw=True)
+        except Exception as e:
+            raise _failure("decrypting stream", e)
+        final = _check_segment(segment, stream_id, index)
+        index += 1
+        total += len(segment)
+        writer.write(segment)
+        await writer.drain()
+
+
+def _async_cipher(encryption_key):
+    if isinstance(encryption_key, AsyncCipher):
+        return encryption_key
+    return _async_cipher_for_key(encryption_key)
+
+
+async def _read_exact(reader, size):
+    """
+    Reading exactly size bytes from reader (less only if the stream has ended)
+    """
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+
+
+def _data_length(data):
+    """
+    :return: Size of data (in bytes, roughly for str and int), None if it isn't known without encoding the data
+     (containers and other objects: they go to the executor, encoding them can take as long as encrypting)
+    """
+    if isinstance(data, str):
+        return len(data)
+    if isinstance(data, int):
+        return data.bit_length() // 8
+    if isinstance(data, float) or data is None:
+        return 0
+    try:
+        return memoryview(data).nbytes
+    except TypeError:
+        return None
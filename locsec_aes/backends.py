@@ -0,0 +1,198 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import threading
+import time
+
+from Cryptodome.Cipher import AES
+
+from locsec_aes.EncryptionException import EncryptionException
+from locsec_aes.logger import get_logger
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+
+logger = get_logger()
+
+'''
+AES implementations LocSec-AES can run on. Every backend produces exactly the same bytes,
+ only speed differs (pycryptodomex is always there, OpenSSL-backed cryptography is optional).
+
+Backend contexts (returned by cbc/gcm/ctr of a backend):
+ process(data, output) - encrypts or decrypts data (AES-block aligned for CBC) to a writable buffer of the same length
+ GCM contexts also have tag() (after encryption) and verify(tag) (after decryption, raises ValueError on mismatch)
+
+Backend is picked by set_backend(), LOCSEC_AES_BACKEND environment variable or (by default)
+ by a short benchmark of the available backends on first use.
+'''
+
+backend_env_var = "LOCSEC_AES_BACKEND"
+# Amount of data each backend encrypts when picking the fastest one
+benchmark_data_length = 262144
+benchmark_rounds = 3
+
+
+class _CryptodomeContext:
+    def __init__(self, aes, decrypt):
+        self.aes = aes
+        self.process = aes.decrypt if decrypt else aes.encrypt
+
+    def tag(self):
+        return self.aes.digest()
+
+    def verify(self, tag):
+        self.aes.verify(tag)
+
+
+class CryptodomeBackend:
+    name = "pycryptodomex"
+
+    def cbc(self, key, initial_vector, decrypt=False):
+        return _CryptodomeContext(AES.new(key, AES.MODE_CBC, initial_vector), decrypt)
+
+    def gcm(self, key, nonce, header, tag_length, decrypt=False):
+        aes = AES.new(key, AES.MODE_GCM, nonce=nonce, mac_len=tag_length)
+        aes.update(header)
+        return _CryptodomeContext(aes, decrypt)
+
+    def ctr(self, key, nonce, initial_value):
+        return _CryptodomeContext(AES.new(key, AES.MODE_CTR, nonce=bytes(nonce), initial_value=initial_value), False)
+
+
+class _CryptographyContext:
+    def __init__(self, context):
+        self.context = context
+
+    def process(self, data, output):
+        self.context.update_into(data, output)
+
+    def tag(self):
+        self.context.finalize()
+        return self.context.tag
+
+    def verify(self, tag):
+        try:
+            self.context.finalize_with_tag(bytes(tag))
+        except InvalidTag:
+            raise ValueError("MAC check failed")
+
+
+class _CryptographyCBCContext(_CryptographyContext):
+    def process(self, data, output):
+        # update_into wants block_size - 1 spare bytes in output, so the last block goes separately
+        data = memoryview(data)
+        output = memoryview(output)
+        last_block = len(data) - AES.block_size
+        if last_block > 0:
+            self.context.update_into(data[:last_block], output[:len(data) - 1])
+        output[last_block:len(data)] = self.context.update(data[last_block:])
+
+
+class CryptographyBackend:
+    name = "cryptography"
+
+    def cbc(self, key, initial_vector, decrypt=False):
+        cipher = Cipher(algorithms.AES(key), modes.CBC(bytes(initial_vector)))
+        return _CryptographyCBCContext(cipher.decryptor() if decrypt else cipher.encryptor())
+
+    def gcm(self, key, nonce, header, tag_length, decrypt=False):
+        cipher = Cipher(algorithms.AES(key), modes.GCM(bytes(nonce), min_tag_length=tag_length))
+        context = cipher.decryptor() if decrypt else cipher.encryptor()
+        context.authenticate_additional_data(bytes(header))
+        return _CryptographyContext(context)
+
+    def ctr(self, key, nonce, initial_value):
+        counter_block = bytes(nonce) + initial_value.to_bytes(AES.block_size - len(nonce), "big")
+        return _CryptographyContext(Cipher(algorithms.AES(key), modes.CTR(counter_block)).encryptor())
+
+
+_backend_classes = {CryptodomeBackend.name: CryptodomeBackend, CryptographyBackend.name: CryptographyBackend}
+_backends = {}
+_selected = None
+_fastest = None
+_lock = threading.Lock()
+
+
+def available_backends():
+    """
+    :return: Names of backends that can be used here
+    """
+    return [name for name in _backend_classes if name != CryptographyBackend.name or Cipher is not None]
+
+
+def get_backend(name=None):
+    """
+    Getting a backend
+    :param name: Backend name. If not specified: backend set by set_backend, by LOCSEC_AES_BACKEND environment
+     variable or the fastest one
+    :return: Backend object
+    """
+    if name is None:
+        name = _selected or os.environ.get(backend_env_var) or _fastest_backend()
+    backend = _backends.get(name)
+    if backend is None:
+        if name not in available_backends():
+            raise EncryptionException("AES backend \"{}\" is not available. Available backends: {}"
+                                      .format(name, ", ".join(available_backends())))
+        backend = _backends.setdefault(name, _backend_classes[name]())
+    return backend
+
+
+def set_backend(name):
+    """
+    Forcing a backend for ciphers created from now on
+    :param name: Backend name (None to pick one automatically again)
+    """
+    global _selected
+    if name is not None:
+        get_backend(name)
+    _selected = name
+
+
+def _fastest_backend():
+    global _fastest
+    with _lock:
+        if _fastest is None:
+            names = available_backends()
+            if len(names) == 1:
+                _fastest = names[0]
+            else:
+                timings = {name: _benchmark(get_backend(name)) for name in names}
+                _fastest = min(timings, key=timings.get)
+                logger.debug("AES backend timings: {}, using \"{}\"".format(timings, _fastest))
+        return _fastest
+
+
+def _benchmark(backend):
+    # Long CBC run and a few small GCM chunks: both per-byte speed and per-chunk setup cost matter
+    key = bytes(32)
+    data = bytearray(benchmark_data_length)
+    output = bytearray(benchmark_data_length)
+    best = None
+    for _ in range(benchmark_rounds):
+        started = time.perf_counter()
+        backend.cbc(key, bytes(AES.block_size)).process(data, output)
+        for _ in range(16):
+            context = backend.gcm(key, bytes(12), b"", 16)
+            context.process(data[:4096], output[:4096])
+            context.tag()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
@@ -0,0 +1,121 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import logging
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+from locsec_aes.encryption import LocSecCipher, default_mode, default_padding
+from locsec_aes.EncryptionException import EncryptionException
+from locsec_aes.logger import get_logger, log_limited
+from locsec_aes import logger as logger_settings
+
+logger = get_logger()
+
+executors = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+# Every task gets a few items, so that per-task overhead (futures, pickling for processes) is paid less often
+tasks_per_worker = 4
+
+
+def encrypt_many(items, encryption_key, workers=None, executor="thread", chunksize=None, mode=default_mode,
+                 typed=False, compression=None, padding=default_padding):
+    """
+    Encrypting many independent pieces of data in parallel.
+    :param items: Iterable with data to encrypt
+    :param encryption_key: Encryption key
+    :param workers: Amount of workers (CPU count if not specified)
+    :param executor: "thread", "process" or an existing concurrent.futures.Executor
+    :param chunksize: Amount of items sent to a worker at once (calculated if not specified)
+    :param mode: Encryption mode ("cbc" or "gcm")
+    :param typed: Whether to encrypt items with their types (see locsec_aes.codec)
+    :param compression: Compression method for items before encryption ("zlib", "lzma", "bz2" or None)
+    :param padding: Padding policy ("bucket256", "pow2", "block" or a list of bucket sizes)
+    :return: List of encrypted LocSec chunks in the order of items.
+     Items that could not be encrypted get an EncryptionException in their place
+    """
+    cipher = LocSecCipher(encryption_key, mode, typed, compression, padding=padding)
+    return _run_many(_encrypt_slice, items, cipher, (), workers, executor, chunksize)
+
+
+def decrypt_many(items, encryption_key, return_raw=False, workers=None, executor="thread", chunksize=None):
+    """
+    Decrypting many independent LocSec chunks in parallel.
+    :param items: Iterable with LocSec chunks
+    :param encryption_key: Encryption key
+    :param return_raw: Whether to return raw (bytearray) data or stringified
+    :param workers: Amount of workers (CPU count if not specified)
+    :param executor: "thread", "process" or an existing concurrent.futures.Executor
+    :param chunksize: Amount of items sent to a worker at once (calculated if not specified)
+    :return: List of decrypted data in the order of items.
+     Items that could not be decrypted get an EncryptionException in their place
+    """
+    return _run_many(_decrypt_slice, items, LocSecCipher(encryption_key), (return_raw,), workers, executor, chunksize)
+
+
+def _run_many(function, items, cipher, args, workers, executor, chunksize):
+    items = list(items)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise EncryptionException("Bad amount of workers: should be at least 1.")
+    if chunksize is None:
+        chunksize = max(1, -(-len(items) // (workers * tasks_per_worker)))
+    slices = [(start, items[start:start + chunksize]) for start in range(0, len(items), chunksize)]
+
+    # Nothing to parallelize, pool startup would only slow things down
+    if len(slices) <= 1 or workers == 1 and not isinstance(executor, Executor):
+        return [result for start, items_slice in slices for result in function(cipher, start, items_slice, *args)]
+
+    if isinstance(executor, Executor):
+        return _map_slices(executor, function, slices, cipher, args)
+    if executor not in executors:
+        raise EncryptionException("Unknown executor: \"{}\". Supported executors are: {}."
+                                  .format(executor, ", ".join(executors)))
+    with executors[executor](max_workers=workers) as pool:
+        return _map_slices(pool, function, slices, cipher, args)
+
+
+def _map_slices(pool, function, slices, cipher, args):
+    futures = [pool.submit(function, cipher, start, items_slice, *args) for start, items_slice in slices]
+    return [result for future in futures for result in future.result()]
+
+
+def _encrypt_slice(cipher, start, items_slice):
+    results = []
+    for index, item in enumerate(items_slice, start):
+        try:
+            results.append(cipher.encrypt(item))
+        except Exception as e:
+            results.append(_item_error("encrypting", index, e))
+    return results
+
+
+def _decrypt_slice(cipher, start, items_slice, return_raw):
+    results = []
+    for index, item in enumerate(items_slice, start):
+        try:
+            results.append(cipher.decrypt(item, return_raw))
+        except Exception as e:
+            results.append(_item_error("decrypting", index, e))
+    return results
+
+
+def _item_error(action, index, error):
+    if not logger_settings.quiet_rejections or not isinstance(error, EncryptionException):
+        log_limited(logger, logging.ERROR, "Error while %s item %d: %s", action, index, error)
+    exception_class = type(error) if isinstance(error, EncryptionException) else EncryptionException
+    return exception_class("Error while {} item {}: {}", action, index, error)
@@ -0,0 +1,66 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import argparse
+import sys
+
+from locsec_aes.benchmarks.suite import run_suite, save_baseline, load_baseline, compare, default_threshold, \
+    default_min_time
+from locsec_aes.benchmarks.timing import print_table
+
+_columns = ["case", "ops/s", "MB/s", "p50 us", "p99 us", "peak KiB"]
+
+
+def _row(name, result):
+    return [name, "{:.0f}".format(result.ops_s), "{:.1f}".format(result.mb_s), "{:.1f}".format(result.p50_us),
+            "{:.1f}".format(result.p99_us), "{:.0f}".format(result.peak_kib)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m locsec_aes.benchmarks",
+                                     description="LocSec-AES benchmark suite (single benchmarks are bench_*.py)")
+    parser.add_argument("-k", "--filter", help="run only cases with names containing this substring")
+    parser.add_argument("-t", "--time", type=float, default=default_min_time,
+                        help="seconds per case (default: %(default)s)")
+    parser.add_argument("--save", metavar="PATH", help="save results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare results with a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=default_threshold,
+                        help="allowed relative regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.filter, args.time,
+                        lambda name, result: print(" | ".join(_row(name, result)), file=sys.stderr))
+    if not results:
+        print("No cases matched \"{}\"".format(args.filter), file=sys.stderr)
+        return 2
+    print_table(_columns, [_row(name, result) for name, result in results.items()])
+    if args.save:
+        save_baseline(results, args.save)
+        print("Baseline saved to {}".format(args.save))
+    if args.compare:
+        regressions = compare(results, load_baseline(args.compare), args.threshold)
+        if regressions:
+            print("\nRegressions (more than {:.0%} worse than {}):".format(args.threshold, args.compare))
+            print_table(["case", "metric", "baseline", "now"],
+                        [[name, metric, "{:.1f}".format(expected), "{:.1f}".format(actual)]
+                         for name, metric, expected, actual in regressions])
+            return 1
+        print("\nNo regressions against {}".format(args.compare))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
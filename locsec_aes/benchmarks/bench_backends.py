@@ -0,0 +1,47 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Throughput of available AES backends (see locsec_aes.backends) per mode and payload size.
+#  Run with: python -m locsec_aes.benchmarks.bench_backends
+
+import os
+
+from locsec_aes import backends
+from locsec_aes.benchmarks.timing import ops_per_second, print_table, bench_key
+from locsec_aes.encryption import LocSecCipher, modes
+
+payload_sizes = [100, 4096, 1048576]
+
+
+def main():
+    rows = []
+    for size in payload_sizes:
+        payload = bytearray(os.urandom(size))
+        for mode in modes:
+            for backend in backends.available_backends():
+                cipher = LocSecCipher(bench_key, mode, backend=backend)
+                chunk = cipher.encrypt(payload)
+                encrypt_ops = ops_per_second(lambda: cipher.encrypt(payload))
+                decrypt_ops = ops_per_second(lambda: cipher.decrypt(chunk, return_raw=True))
+                rows.append([size, mode, backend,
+                             "{:.0f}".format(encrypt_ops), "{:.1f}".format(encrypt_ops * size / 1048576),
+                             "{:.0f}".format(decrypt_ops), "{:.1f}".format(decrypt_ops * size / 1048576)])
+    print_table(["bytes", "mode", "backend", "enc ops/s", "enc MB/s", "dec ops/s", "dec MB/s"], rows)
+    print("Picked automatically: {}".format(backends.get_backend().name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Scaling of encrypt_many/decrypt_many (thread and process pools) against a serial encrypt_data loop.
+#  Run with: python -m locsec_aes.benchmarks.bench_batch
+
+import os
+import time
+
+from locsec_aes.batch import encrypt_many, decrypt_many
+from locsec_aes.benchmarks.timing import print_table, bench_key
+from locsec_aes.encryption import encrypt_data, decrypt_data
+
+workloads = [("100 B", 100, 20000), ("1 MiB", 1048576, 64)]
+worker_counts = [1, 2, 4, 8]
+
+
+def _timed(func):
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def main():
+    print("CPUs: {}".format(os.cpu_count()))
+    for name, size, count in workloads:
+        items = [bytearray(os.urandom(size)) for _ in range(count)]
+        chunks = [encrypt_data(item, bench_key) for item in items]
+        serial_encrypt = _timed(lambda: [encrypt_data(item, bench_key) for item in items])
+        serial_decrypt = _timed(lambda: [decrypt_data(chunk, bench_key, return_raw=True) for chunk in chunks])
+        rows = [["serial loop", "-", "{:.0f}".format(count / serial_encrypt), "1.00",
+                 "{:.0f}".format(count / serial_decrypt), "1.00"]]
+        for executor in ("thread", "process"):
+            for workers in worker_counts:
+                encrypt_time = _timed(lambda: encrypt_many(items, bench_key, workers=workers, executor=executor))
+                decrypt_time = _timed(lambda: decrypt_many(chunks, bench_key, True, workers=workers,
+                                                           executor=executor))
+                rows.append([executor, workers,
+                             "{:.0f}".format(count / encrypt_time), "{:.2f}".format(serial_encrypt / encrypt_time),
+                             "{:.0f}".format(count / decrypt_time), "{:.2f}".format(serial_decrypt / decrypt_time)])
+        print("\n{} x {} items".format(count, name))
+        print_table(["executor", "workers", "enc items/s", "enc speedup", "dec items/s", "dec speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Per-call cost of key setup: deriving the key on every call vs a reusable LocSecCipher
+#  (module-level functions keep a few recently used ciphers).
+#  Run with: python -m locsec_aes.benchmarks.bench_cipher
+
+import os
+
+from locsec_aes.benchmarks.timing import ops_per_second, print_table, bench_key
+from locsec_aes.encryption import LocSecCipher, encrypt_data, decrypt_data
+
+payload_size = 100
+
+
+def main():
+    payload = bytearray(os.urandom(payload_size))
+    cipher = LocSecCipher(bench_key)
+    chunk = cipher.encrypt(payload)
+
+    results = [
+        ("encrypt, key setup per call", ops_per_second(lambda: LocSecCipher(bench_key).encrypt(payload))),
+        ("encrypt_data", ops_per_second(lambda: encrypt_data(payload, bench_key))),
+        ("LocSecCipher.encrypt", ops_per_second(lambda: cipher.encrypt(payload))),
+        ("decrypt, key setup per call", ops_per_second(lambda: LocSecCipher(bench_key).decrypt(chunk, True))),
+        ("decrypt_data", ops_per_second(lambda: decrypt_data(chunk, bench_key, return_raw=True))),
+        ("LocSecCipher.decrypt", ops_per_second(lambda: cipher.decrypt(chunk, return_raw=True))),
+    ]
+    print("{}-byte payloads".format(payload_size))
+    print_table(["call", "ops/s", "us/op"],
+                [[name, "{:.0f}".format(ops), "{:.2f}".format(1e6 / ops)] for name, ops in results])
+
+
+if __name__ == "__main__":
+    main()
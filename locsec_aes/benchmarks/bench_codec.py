@@ -0,0 +1,53 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Dict-heavy payloads: today's JSON path (encrypt_data(dict) -> decrypt -> json.loads)
+#  against typed encryption (decrypt returns the dict right away).
+#  Run with: python -m locsec_aes.benchmarks.bench_codec
+
+import json
+import logging
+
+from locsec_aes.benchmarks.timing import ops_per_second, print_table, bench_key
+from locsec_aes.encryption import LocSecCipher
+from locsec_aes.logger import get_logger
+
+payloads = {
+    "flat dict": {"id": 12345, "name": "user", "active": True, "score": 0.75, "tags": ["a", "b"]},
+    "100 records": {"records": [{"id": i, "name": "record {}".format(i), "value": i * 0.5, "ok": i % 2 == 0}
+                                for i in range(100)]},
+    "int": 1234567890,
+}
+
+
+def main():
+    # Untyped path warns about non-string data on every call, that is not what is measured here
+    get_logger().setLevel(logging.ERROR)
+    cipher = LocSecCipher(bench_key)
+    rows = []
+    for name, payload in payloads.items():
+        if isinstance(payload, (dict, list)):
+            json_ops = ops_per_second(lambda: json.loads(cipher.decrypt(cipher.encrypt(payload))))
+        else:
+            json_ops = ops_per_second(lambda: int(cipher.decrypt(cipher.encrypt(payload))))
+        typed_ops = ops_per_second(lambda: cipher.decrypt(cipher.encrypt(payload, typed=True)))
+        rows.append([name, "{:.0f}".format(json_ops), "{:.0f}".format(typed_ops),
+                     "{:.2f}x".format(typed_ops / json_ops)])
+    print_table(["payload", "str/json ops/s", "typed ops/s", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
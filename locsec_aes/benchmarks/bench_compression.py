@@ -0,0 +1,58 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Compression ratio and encrypt/decrypt throughput per compression method and level,
+#  for log-like text, JSON and random (incompressible) data.
+#  Run with: python -m locsec_aes.benchmarks.bench_compression
+
+import json
+import os
+
+from locsec_aes.benchmarks.timing import ops_per_second, print_table, bench_key
+from locsec_aes.encryption import LocSecCipher
+
+payload_size = 1048576
+levels = {None: [None], "zlib": [1, 6, 9], "lzma": [0, 6], "bz2": [1, 9]}
+
+
+def payloads():
+    logs = "".join("2022-05-{:02} INFO request {} from 10.0.{}.{} took {} ms\n"
+                   .format(i % 28 + 1, i, i % 7, i % 256, i % 97) for i in range(payload_size // 40))
+    records = json.dumps([{"id": i, "user": "user{}".format(i % 500), "active": i % 3 == 0, "score": i * 0.25}
+                          for i in range(payload_size // 50)])
+    return {"logs": bytearray(logs[:payload_size], "utf-8"), "json": bytearray(records[:payload_size], "utf-8"),
+            "random": bytearray(os.urandom(payload_size))}
+
+
+def main():
+    cipher = LocSecCipher(bench_key)
+    rows = []
+    for name, payload in payloads().items():
+        for method, method_levels in levels.items():
+            for level in method_levels:
+                chunk = cipher.encrypt(payload, compression=method or False, compression_level=level)
+                encrypt_ops = ops_per_second(
+                    lambda: cipher.encrypt(payload, compression=method or False, compression_level=level))
+                decrypt_ops = ops_per_second(lambda: cipher.decrypt(chunk, return_raw=True))
+                rows.append([name, method or "-", "-" if level is None else level,
+                             "{:.2f}".format(len(payload) / len(chunk)),
+                             "{:.1f}".format(encrypt_ops * len(payload) / 1048576),
+                             "{:.1f}".format(decrypt_ops * len(payload) / 1048576)])
+    print_table(["data", "method", "level", "ratio", "enc MB/s", "dec MB/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Random 4 KiB reads from a multi-GB container: cold (random positions all over the container, every read
+#  decrypts a chunk), nearby (random positions within a few chunks, served from the cache) and the time
+#  it takes to decrypt the whole container sequentially (what one read costs without the index).
+#  Run with: python -m locsec_aes.benchmarks.bench_container [size in GiB (default 2)] [directory]
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from locsec_aes.benchmarks.timing import ops_per_second, print_table, bench_key
+from locsec_aes.container import ContainerWriter, ContainerReader, default_chunk_size
+
+read_length = 4096
+sequential_sample = 268435456  # 256 MiB, full decryption time is extrapolated from it
+
+
+def main():
+    size = int(float(sys.argv[1]) * 1073741824) if len(sys.argv) > 1 else 2147483648
+    directory = sys.argv[2] if len(sys.argv) > 2 else None
+    block = os.urandom(16777216)
+    with tempfile.TemporaryDirectory(dir=directory) as temporary:
+        path = os.path.join(temporary, "container")
+        started = time.perf_counter()
+        with ContainerWriter(path, bench_key) as writer:
+            for position in range(0, size, len(block)):
+                writer.write(block[:size - position])
+        print("Container: {:.1f} GiB of data, {} chunks of {} KiB, written in {:.1f} s".format(
+            size / 1073741824, -(-size // default_chunk_size), default_chunk_size // 1024,
+            time.perf_counter() - started))
+
+        rng = random.Random(1)
+        rows = []
+        with ContainerReader(path, bench_key) as reader:
+            def read_at(position):
+                reader.seek(position)
+                reader.read(read_length)
+
+            cold_ops = ops_per_second(lambda: read_at(rng.randrange(size - read_length)))
+            rows.append(["random (cold)", "{:.0f}".format(cold_ops), "{:.1f}".format(1000 / cold_ops)])
+            window = default_chunk_size * 8
+            base = size // 2
+            nearby_ops = ops_per_second(lambda: read_at(base + rng.randrange(window)))
+            rows.append(["nearby (cached)", "{:.0f}".format(nearby_ops), "{:.3f}".format(1000 / nearby_ops)])
+
+            reader.seek(0)
+            started = time.perf_counter()
+            while reader.tell() < min(size, sequential_sample):
+                reader.read(default_chunk_size * 16)
+            full_ms = (time.perf_counter() - started) * size / min(size, sequential_sample) * 1000
+            rows.append(["decrypt everything", "{:.3f}".format(1000 / full_ms), "{:.0f}".format(full_ms)])
+        started = time.perf_counter()
+        ContainerReader(path, bench_key).close()
+        opened = time.perf_counter() - started
+    print_table(["4 KiB read", "reads/s", "ms/read"], rows)
+    print("\nOpening the container (reading the index): {:.1f} ms".format(opened * 1000))
+
+
+if __name__ == "__main__":
+    main()
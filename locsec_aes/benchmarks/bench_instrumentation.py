@@ -0,0 +1,72 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Cost of hot-path instrumentation: encrypt/decrypt round trips with instrumentation disabled and enabled
+#  (with an in-memory histogram), and an estimate of what the disabled hooks cost per call
+#  (flag checks and the decorator layer, measured separately).
+#  Run with: python -m locsec_aes.benchmarks.bench_instrumentation
+
+import os
+
+from locsec_aes import instrumentation
+from locsec_aes.benchmarks.timing import ops_per_second, print_table, bench_key
+from locsec_aes.encryption import LocSecCipher, encrypt_data, decrypt_data
+
+sizes = [100, 4096, 65536]
+
+# Flag checks on the longest path of one encrypt + decrypt round trip
+checks_per_round_trip = 14
+
+
+def _noop():
+    return None
+
+
+def main():
+    cipher = LocSecCipher(bench_key)
+    rows = []
+    for size in sizes:
+        payload = bytearray(os.urandom(size))
+        run = lambda: cipher.decrypt(cipher.encrypt(payload), return_raw=True)  # noqa: E731
+        run_module = lambda: decrypt_data(encrypt_data(payload, bench_key), bench_key, return_raw=True)  # noqa: E731
+        disabled_ops = ops_per_second(run)
+        disabled_module_ops = ops_per_second(run_module)
+        instrumentation.enable(instrumentation.HistogramSink())
+        try:
+            enabled_ops = ops_per_second(run)
+            enabled_module_ops = ops_per_second(run_module)
+        finally:
+            instrumentation.disable()
+        rows.append([size, "{:.0f}".format(disabled_ops), "{:.0f}".format(enabled_ops),
+                     "{:.1f}%".format((disabled_ops / enabled_ops - 1) * 100),
+                     "{:.0f}".format(disabled_module_ops), "{:.0f}".format(enabled_module_ops)])
+    print_table(["size", "disabled ops/s", "enabled ops/s", "enabled cost", "module disabled", "module enabled"], rows)
+
+    # What the hooks cost when instrumentation is disabled
+    check_ops = ops_per_second(lambda: instrumentation.enabled and None)
+    baseline_ops = ops_per_second(_noop)
+    measured_ops = ops_per_second(instrumentation.measured("noop")(_noop))
+    check_ns = max(0.0, 1e9 / check_ops - 1e9 / baseline_ops)
+    decorator_ns = max(0.0, 1e9 / measured_ops - 1e9 / baseline_ops)
+    disabled_ns = checks_per_round_trip * check_ns + 2 * decorator_ns
+    smallest_round_trip_ns = 1e9 / float(rows[0][1])
+    print("\nDisabled: {:.0f} ns per flag check, {:.0f} ns per decorated call, ~{:.0f} ns per round trip"
+          " ({:.2f}% of a {} byte round trip)".format(check_ns, decorator_ns, disabled_ns,
+                                                      disabled_ns / smallest_round_trip_ns * 100, sizes[0]))
+
+
+if __name__ == "__main__":
+    main()
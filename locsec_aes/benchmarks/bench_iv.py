@@ -0,0 +1,52 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Tiny-payload encryption with different IV providers: random.randbytes (what CBC used before, not a CSPRNG),
+#  os.urandom per chunk (what GCM used before), buffered per-thread pools (default) and buffered with background
+#  refill. IV column is the cost of the IV alone.
+#  Run with: python -m locsec_aes.benchmarks.bench_iv
+
+import random
+
+from locsec_aes import iv
+from locsec_aes.benchmarks.timing import ops_per_second, print_table, bench_key
+from locsec_aes.encryption import LocSecCipher
+
+payload = b"x"
+rounds = 3
+providers = [("random.randbytes", random.randbytes), ("os.urandom", iv.SystemProvider()),
+             ("buffered", iv.BufferedProvider()), ("buffered + background", iv.BufferedProvider(background=True))]
+
+
+def main():
+    cipher = LocSecCipher(bench_key, padding="block")
+    previous = iv.provider
+    rows = []
+    try:
+        for mode in ("cbc", "gcm"):
+            for name, provider in providers:
+                iv.set_provider(provider)
+                # Best of a few rounds: tiny calls are noisy
+                iv_ops = max(ops_per_second(lambda: iv.new_iv(16)) for _ in range(rounds))
+                encrypt_ops = max(ops_per_second(lambda: cipher.encrypt(payload, mode=mode)) for _ in range(rounds))
+                rows.append([mode, name, "{:.0f}".format(1000000000 / iv_ops), "{:.0f}".format(encrypt_ops)])
+    finally:
+        iv.set_provider(previous)
+    print_table(["mode", "IV provider", "IV ns", "encrypt/s ({} B)".format(len(payload))], rows)
+
+
+if __name__ == "__main__":
+    main()
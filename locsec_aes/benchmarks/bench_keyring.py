@@ -0,0 +1,59 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Decrypting chunks during key rotation: trying every key in turn (what callers do without key IDs)
+#  against a KeyRing lookup by key ID. Trial uses LocSecCipher objects, so it doesn't even pay for key derivation
+#  and error logging of decrypt_data.
+#  Run with: python -m locsec_aes.benchmarks.bench_keyring
+
+from locsec_aes.benchmarks.timing import ops_per_second, print_table, bench_key
+from locsec_aes.EncryptionException import EncryptionException
+from locsec_aes.encryption import LocSecCipher
+from locsec_aes.keyring import KeyRing
+
+key_counts = [2, 4, 8]
+payload_sizes = [100, 65536]
+
+
+def main():
+    rows = []
+    for key_count in key_counts:
+        keys = ["{}-{}".format(bench_key, i) for i in range(key_count)]
+        ciphers = [LocSecCipher(key) for key in keys]
+        key_ring = KeyRing()
+        for key in keys:
+            key_ring.add_key(key)
+
+        def trial(chunk):
+            for cipher in ciphers:
+                try:
+                    return cipher.decrypt(chunk, return_raw=True)
+                except EncryptionException:
+                    continue
+
+        for size in payload_sizes:
+            # Worst case for trial: the chunk is encrypted with the last key
+            chunk = ciphers[-1].encrypt(bytearray(size))
+            chunk_with_id = key_ring.cipher(key_ring.key_ids[-1]).encrypt(bytearray(size))
+            trial_ops = ops_per_second(lambda: trial(chunk))
+            ring_ops = ops_per_second(lambda: key_ring.decrypt(chunk_with_id, return_raw=True))
+            rows.append([key_count, size, "{:.0f}".format(trial_ops), "{:.0f}".format(ring_ops),
+                         "{:.2f}x".format(ring_ops / trial_ops)])
+    print_table(["keys", "bytes", "trial ops/s", "key ring ops/s", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
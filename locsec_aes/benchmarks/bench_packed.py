@@ -0,0 +1,74 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Many small records: one encrypt_data call per record against packed records (pack_many),
+#  CPU and ciphertext size per record, and getting one record back out of a packed chunk.
+#  Run with: python -m locsec_aes.benchmarks.bench_packed [amount of records (default 1000000)]
+
+import os
+import sys
+import time
+
+from locsec_aes.benchmarks.timing import ops_per_second, print_table, bench_key
+from locsec_aes.encryption import encrypt_data, decrypt_data
+from locsec_aes.packed import pack_many, unpack_records, unpack_record
+
+record_length = 64
+# Separate encryption is measured on a sample and extrapolated
+separate_sample = 20000
+
+
+def main():
+    amount = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    pool = os.urandom(record_length * 1024)
+    records = [pool[(i % 1024) * record_length:(i % 1024 + 1) * record_length] for i in range(amount)]
+    sample = records[:separate_sample]
+
+    started = time.perf_counter()
+    separate_chunks = [encrypt_data(record, bench_key) for record in sample]
+    separate_encrypt = (time.perf_counter() - started) / len(sample)
+    started = time.perf_counter()
+    for chunk in separate_chunks:
+        decrypt_data(chunk, bench_key, return_raw=True)
+    separate_decrypt = (time.perf_counter() - started) / len(sample)
+    separate_bytes = sum(len(chunk) for chunk in separate_chunks) / len(sample)
+
+    started = time.perf_counter()
+    packed_chunks = pack_many(records, bench_key)
+    packed_encrypt = (time.perf_counter() - started) / amount
+    started = time.perf_counter()
+    for chunk in packed_chunks:
+        for _ in unpack_records(chunk, bench_key):
+            pass
+    packed_decrypt = (time.perf_counter() - started) / amount
+    packed_bytes = sum(len(chunk) for chunk in packed_chunks) / amount
+
+    print("{} records of {} bytes, {} packed chunks".format(amount, record_length, len(packed_chunks)))
+    print_table(["", "encrypt us/record", "decrypt us/record", "bytes/record"], [
+        ["encrypt_data each", "{:.2f}".format(separate_encrypt * 1e6), "{:.2f}".format(separate_decrypt * 1e6),
+         "{:.1f}".format(separate_bytes)],
+        ["packed", "{:.3f}".format(packed_encrypt * 1e6), "{:.3f}".format(packed_decrypt * 1e6),
+         "{:.1f}".format(packed_bytes)],
+        ["ratio", "{:.1f}x".format(separate_encrypt / packed_encrypt),
+         "{:.1f}x".format(separate_decrypt / packed_decrypt), "{:.1f}x".format(separate_bytes / packed_bytes)],
+    ])
+    one_record_ops = ops_per_second(lambda: unpack_record(packed_chunks[0], bench_key, 1000))
+    print("\nOne record out of a packed chunk ({} records): {:.0f} us".format(
+        len(unpack_records(packed_chunks[0], bench_key)), 1e6 / one_record_ops))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Latency of decrypting big CBC chunks sequentially vs in segments on a thread pool.
+#  Run with: python -m locsec_aes.benchmarks.bench_parallel_decrypt
+
+import os
+import statistics
+import time
+
+from locsec_aes import encryption
+from locsec_aes.benchmarks.timing import print_table, bench_key
+from locsec_aes.encryption import LocSecCipher, data_size_max
+
+payload_sizes = [2097152, 4194304, data_size_max]
+worker_counts = [1, 2, 4, 8]
+rounds = 30
+
+
+def _latencies(cipher, chunk, output):
+    latencies = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        cipher.decrypt_into(chunk, output)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main():
+    print("CPUs: {}".format(os.cpu_count()))
+    cipher = LocSecCipher(bench_key)
+    rows = []
+    for size in payload_sizes:
+        chunk = cipher.encrypt(bytearray(os.urandom(size)))
+        output = bytearray(size)
+        for workers in worker_counts:
+            if encryption._parallel_decrypt_pool is not None:
+                encryption._parallel_decrypt_pool.shutdown()
+                encryption._parallel_decrypt_pool = None
+            encryption.parallel_decrypt_workers = workers
+            latencies = sorted(_latencies(cipher, chunk, output))
+            rows.append([size, workers, "{:.2f}".format(statistics.median(latencies) * 1000),
+                         "{:.2f}".format(latencies[int(len(latencies) * 0.99)] * 1000),
+                         "{:.1f}".format(size / statistics.median(latencies) / 1048576)])
+    print_table(["bytes", "workers", "p50 ms", "p99 ms", "MB/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Rejection throughput: decrypt_data on garbage, tampered and wrong-key chunks with every rejection logged
+#  with a traceback (as before rate limiting), with rate-limited logging (default) and with quiet rejections.
+#  Log output goes to os.devnull, so only formatting and writing of records is measured.
+#  Run with: python -m locsec_aes.benchmarks.bench_rejections
+
+import os
+
+from locsec_aes import logger as logger_settings
+from locsec_aes.benchmarks.timing import ops_per_second, print_table, bench_key
+from locsec_aes.encryption import encrypt_data, decrypt_data
+from locsec_aes.EncryptionException import EncryptionException
+from locsec_aes.logger import get_logger
+
+
+def _rejections():
+    chunk = encrypt_data(bytearray(os.urandom(1000)), bench_key)
+    tampered = bytearray(chunk)
+    tampered[100] ^= 1
+    return {
+        "garbage": bytearray(os.urandom(999)),
+        "tampered": tampered,
+        "wrong key": encrypt_data(bytearray(os.urandom(1000)), bench_key + "-other"),
+    }
+
+
+def _reject(chunk):
+    try:
+        decrypt_data(chunk, bench_key)
+    except EncryptionException:
+        return
+    raise AssertionError("Chunk was not rejected")
+
+
+def main():
+    devnull = open(os.devnull, "w")
+    streams = [(handler, handler.setStream(devnull)) for handler in get_logger().handlers]
+    rate_limit = logger_settings.rate_limit
+    rows = []
+    try:
+        for name, chunk in _rejections().items():
+            logger_settings.rate_limit = float("inf")
+            every_ops = ops_per_second(lambda: _reject(chunk))
+            logger_settings.rate_limit = rate_limit
+            limited_ops = ops_per_second(lambda: _reject(chunk))
+            logger_settings.set_quiet_rejections()
+            quiet_ops = ops_per_second(lambda: _reject(chunk))
+            logger_settings.set_quiet_rejections(False)
+            rows.append([name, "{:.0f}".format(every_ops), "{:.0f}".format(limited_ops), "{:.0f}".format(quiet_ops),
+                         "{:.1f}x".format(quiet_ops / every_ops)])
+    finally:
+        logger_settings.rate_limit = rate_limit
+        logger_settings.set_quiet_rejections(False)
+        for handler, stream in streams:
+            handler.setStream(stream)
+        devnull.close()
+    print_table(["chunk", "log every ops/s", "rate-limited ops/s", "quiet ops/s", "quiet speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
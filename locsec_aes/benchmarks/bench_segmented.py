@@ -0,0 +1,69 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Small edits of a big segmented blob: SegmentedCipher.update (one segment and the manifest are re-encrypted)
+#  against re-encrypting the whole blob (decrypt + encrypt, extrapolated from a 256 MiB sample to save memory).
+#  Run with: python -m locsec_aes.benchmarks.bench_segmented [blob size in GiB (default 1)]
+
+import os
+import random
+import sys
+import time
+
+from locsec_aes.benchmarks.timing import ops_per_second, print_table, bench_key
+from locsec_aes.segmented import SegmentedCipher, default_segment_size
+
+edit_lengths = [16, 4096, 65536]
+full_sample = 268435456  # 256 MiB
+
+
+def main():
+    size = int(float(sys.argv[1]) * 1073741824) if len(sys.argv) > 1 else 1073741824
+    cipher = SegmentedCipher(bench_key)
+    block = os.urandom(16777216)
+    data = bytearray(size)
+    for position in range(0, size, len(block)):
+        data[position:position + len(block)] = block[:size - position]
+    started = time.perf_counter()
+    blob = cipher.encrypt(data)
+    print("Blob: {:.2f} GiB of data, {} segments of {} KiB, encrypted in {:.1f} s".format(
+        size / 1073741824, -(-size // default_segment_size), default_segment_size // 1024,
+        time.perf_counter() - started))
+    del data
+
+    sample = SegmentedCipher(bench_key).encrypt(block * (min(size, full_sample) // len(block)))
+    started = time.perf_counter()
+    cipher.encrypt(cipher.decrypt(sample))
+    full_seconds = (time.perf_counter() - started) * size / min(size, full_sample)
+    del sample
+
+    rng = random.Random(1)
+    rows = []
+    for length in edit_lengths:
+        edit = os.urandom(length)
+        changed = []
+
+        def run():
+            ranges = cipher.update(blob, rng.randrange(size - length), edit)
+            changed.append(sum(end - start for start, end in ranges))
+        edit_ops = ops_per_second(run)
+        rows.append([length, "{:.2f}".format(1000 / edit_ops), "{:.0f}".format(full_seconds * 1000),
+                     "{:.0f}x".format(full_seconds * edit_ops), "{:.0f}".format(sum(changed) / len(changed) / 1024)])
+    print_table(["edit bytes", "update ms", "full re-encrypt ms", "speedup", "changed KiB"], rows)
+
+
+if __name__ == "__main__":
+    main()
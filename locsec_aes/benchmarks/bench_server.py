@@ -0,0 +1,99 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Load test of the daemon: worker processes encrypting small and big payloads through LocSecClient
+#  (one call at a time and pipelined) against the same processes encrypting in-process with their own LocSecCipher.
+#  Startup is what every fresh worker pays before its first call: imports and key derivation in-process,
+#  imports and a connection for the client.
+#  Run with: python -m locsec_aes.benchmarks.bench_server [worker processes (default 4)] [seconds per case (default 3)]
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from locsec_aes.benchmarks.timing import print_table, bench_key
+
+payload_sizes = [100, 65536]
+window = 64
+
+
+def _serve(path):
+    from locsec_aes.server import LocSecServer
+    LocSecServer(path, bench_key).run()
+
+
+def _work(kind, path, size, seconds):
+    data = os.urandom(size)
+    started = time.perf_counter()
+    if kind == "in-process":
+        from locsec_aes.encryption import LocSecCipher
+        cipher = LocSecCipher(bench_key)
+
+        def step():
+            cipher.encrypt(data)
+            return 1
+    else:
+        from locsec_aes.client import LocSecClient
+        client = LocSecClient(path, 1)
+        client.encrypt(b"")
+        if kind == "daemon":
+            def step():
+                client.encrypt(data)
+                return 1
+        else:
+            items = [data] * window
+
+            def step():
+                client.encrypt_many(items)
+                return window
+    startup = time.perf_counter() - started
+    calls = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        calls += step()
+    return calls, time.perf_counter() - started, startup
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    with tempfile.TemporaryDirectory() as temporary:
+        path = os.path.join(temporary, "locsec.sock")
+        server = multiprocessing.Process(target=_serve, args=(path,), daemon=True)
+        server.start()
+        while not os.path.exists(path):
+            time.sleep(0.01)
+        rows = []
+        try:
+            with multiprocessing.Pool(workers, maxtasksperchild=1) as pool:
+                for size in payload_sizes:
+                    for kind in ("in-process", "daemon", "daemon pipelined"):
+                        results = pool.starmap(_work, [(kind, path, size, seconds)] * workers)
+                        ops = sum(calls / elapsed for calls, elapsed, _ in results)
+                        startup = max(startup for _, _, startup in results)
+                        rows.append([size, kind, "{:.0f}".format(ops), "{:.1f}".format(ops * size / 1000000),
+                                     "{:.1f}".format(startup * 1000)])
+        finally:
+            server.terminate()
+            server.join()
+    print("{} worker processes, {} CPUs".format(workers, os.cpu_count()))
+    print_table(["payload", "case", "calls/s", "MB/s", "startup ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
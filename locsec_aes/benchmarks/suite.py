@@ -0,0 +1,200 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Benchmark suite: encrypt/decrypt across payload sizes, data types and thread counts.
+#  Reports throughput (ops/s, MB/s), latency (p50/p99) and peak memory, saves JSON baselines and flags regressions.
+#  Run with: python -m locsec_aes.benchmarks --help
+
+import collections
+import json
+import logging
+import os
+import platform
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from locsec_aes.encryption import LocSecCipher, data_size_max, _byteify
+from locsec_aes.benchmarks.timing import bench_key
+from locsec_aes.logger import get_logger
+
+baseline_version = 1
+default_threshold = 0.15
+default_min_time = 0.5
+
+payload_sizes = [0, 100, 4096, 1048576, data_size_max]
+type_payload_length = 4096
+concurrent_sizes = [4096, 1048576]
+concurrent_threads = [1, 4]
+
+# run: callable doing one operation, payload_length: bytes of data it processes
+Case = collections.namedtuple("Case", ["name", "run", "payload_length", "threads"])
+# Result of a case (latencies in microseconds, peak memory in KiB)
+Result = collections.namedtuple("Result", ["ops_s", "mb_s", "p50_us", "p99_us", "peak_kib"])
+
+
+def _typed_payloads():
+    text = "x" * type_payload_length
+    items = type_payload_length // 8
+    return {"str": text, "bytes": text.encode(), "bytearray": bytearray(text, "utf-8"), "int": 1234567890123,
+            "float": 3.14159, "list": list(range(items)), "dict": {str(i): i for i in range(items // 2)}}
+
+
+def cases():
+    """
+    :return: list of all benchmark cases
+    """
+    cipher = LocSecCipher(bench_key)
+    result = []
+
+    def add(name, operation, payload, payload_length, threads=1):
+        if operation == "encrypt":
+            run = lambda: cipher.encrypt(payload)  # noqa: E731
+        else:
+            chunk = cipher.encrypt(payload)
+            run = lambda: cipher.decrypt(chunk, return_raw=True)  # noqa: E731
+        result.append(Case(name, run, payload_length, threads))
+
+    for size in payload_sizes:
+        payload = bytearray(os.urandom(size))
+        for operation in ("encrypt", "decrypt"):
+            add("{}/size/{}".format(operation, size), operation, payload, size)
+    for type_name, payload in _typed_payloads().items():
+        payload_length = len(_byteify(payload, True))
+        for operation in ("encrypt", "decrypt"):
+            add("{}/type/{}".format(operation, type_name), operation, payload, payload_length)
+    for size in concurrent_sizes:
+        payload = bytearray(os.urandom(size))
+        for threads in concurrent_threads:
+            for operation in ("encrypt", "decrypt"):
+                add("{}/threads/{}/{}".format(operation, threads, size), operation, payload, size, threads)
+    return result
+
+
+def run_case(case, min_time=default_min_time):
+    """
+    Running a case for at least min_time seconds (every thread of it)
+    :param case: Case
+    :param min_time: Duration of the measurement (in seconds)
+    :return: Result
+    """
+    case.run()
+    if case.threads == 1:
+        started = time.perf_counter()
+        latencies = _timed_calls(case.run, min_time)
+    else:
+        with ThreadPoolExecutor(case.threads) as pool:
+            started = time.perf_counter()
+            futures = [pool.submit(_timed_calls, case.run, min_time) for _ in range(case.threads)]
+            latencies = [latency for future in futures for latency in future.result()]
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    ops_s = len(latencies) / elapsed
+    tracemalloc.start()
+    try:
+        case.run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return Result(ops_s, ops_s * case.payload_length / 1048576, _percentile(latencies, 50) * 1e6,
+                  _percentile(latencies, 99) * 1e6, peak / 1024)
+
+
+def run_suite(name_filter=None, min_time=default_min_time, progress=None):
+    """
+    Running benchmark cases
+    :param name_filter: Only cases with names containing this substring are run
+    :param min_time: Duration of every case measurement (in seconds)
+    :param progress: Callable called with a case name and its Result after every case
+    :return: {case name: Result}
+    """
+    logger = get_logger()
+    level = logger.level
+    # Non-string data makes encrypt warn on every call, that is not what is measured here
+    logger.setLevel(logging.ERROR)
+    try:
+        results = {}
+        for case in cases():
+            if name_filter and name_filter not in case.name:
+                continue
+            results[case.name] = run_case(case, min_time)
+            if progress is not None:
+                progress(case.name, results[case.name])
+        return results
+    finally:
+        logger.setLevel(level)
+
+
+def save_baseline(results, path):
+    """
+    Saving results as a JSON baseline
+    :param results: {case name: Result}
+    :param path: Path of the baseline file
+    """
+    baseline = {"version": baseline_version, "python": platform.python_version(), "machine": platform.machine(),
+                "cpus": os.cpu_count(), "results": {name: result._asdict() for name, result in results.items()}}
+    with open(path, "w") as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    """
+    :param path: Path of a baseline file
+    :return: {case name: Result}
+    """
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get("version") != baseline_version:
+        raise ValueError("Unsupported baseline version: {}".format(baseline.get("version")))
+    return {name: Result(**result) for name, result in baseline["results"].items()}
+
+
+def compare(results, baseline, threshold=default_threshold):
+    """
+    Finding regressions: throughput lower or peak memory higher than in the baseline by more than threshold
+    :param results: {case name: Result}
+    :param baseline: {case name: Result} (cases missing from either side are skipped)
+    :param threshold: Allowed relative difference (0.15 is 15%)
+    :return: list of (case name, metric, baseline value, current value)
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result.ops_s < expected.ops_s * (1 - threshold):
+            regressions.append((name, "ops_s", expected.ops_s, result.ops_s))
+        # A few KiB of allocator noise is not a regression
+        if result.peak_kib > expected.peak_kib * (1 + threshold) + 4:
+            regressions.append((name, "peak_kib", expected.peak_kib, result.peak_kib))
+    return regressions
+
+
+def _timed_calls(function, min_time):
+    latencies = []
+    finish = time.perf_counter() + min_time
+    while True:
+        started = time.perf_counter()
+        function()
+        finished = time.perf_counter()
+        latencies.append(finished - started)
+        if finished >= finish:
+            return latencies
+
+
+def _percentile(values, percent):
+    # values are sorted
+    return values[min(len(values) - 1, len(values) * percent // 100)]
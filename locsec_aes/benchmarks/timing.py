@@ -0,0 +1,52 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import time
+
+bench_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+
+
+def ops_per_second(func, min_time=1.0):
+    """
+    Calling func repeatedly for at least min_time seconds
+    :param func: Callable without arguments
+    :param min_time: Minimal duration of the measurement (in seconds)
+    :return: Amount of calls per second
+    """
+    calls = 0
+    batch = 1
+    started = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            func()
+        calls += batch
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return calls / elapsed
+        batch *= 2
+
+
+def print_table(header, rows):
+    """
+    Printing a simple aligned table
+    :param header: Column names
+    :param rows: Rows (lists of values, same length as header)
+    """
+    rows = [[str(value) for value in row] for row in rows]
+    widths = [max([len(str(column))] + [len(row[i]) for row in rows]) for i, column in enumerate(header)]
+    print("  ".join(str(column).rjust(width) for column, width in zip(header, widths)))
+    for row in rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
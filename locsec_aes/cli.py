@@ -0,0 +1,422 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import argparse
+import collections
+import functools
+import getpass
+import mmap
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from locsec_aes import compression as compression_module
+from locsec_aes.encryption import LocSecCipher, default_mode, modes
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException, OversizeException
+from locsec_aes.server import LocSecServer
+from locsec_aes.streaming import default_segment_size, max_frame_length, _stream_header, _frame_header, \
+    _check_segment_size, _new_stream_header, _parse_stream_header, _segment_data, _check_segment
+
+'''
+locsec-aes command-line tool: encrypting/decrypting files and directory trees, running the daemon (locsec_aes.server).
+
+Files are encrypted to LocSec streams (see locsec_aes.streaming, decrypt_stream reads them too),
+ so files of any size are supported. Input files are memory-mapped, their segments are encrypted
+ on a process pool, every output file is written to "<name>.part" and renamed when it's complete.
+Complete outputs get modification time of their input, that's how --resume finds files that are done.
+'''
+
+suffix = ".lsa"
+part_suffix = ".part"
+key_env = "LOCSEC_AES_KEY"
+
+# Segments being processed (or waiting to be written) per worker
+in_flight_per_worker = 4
+progress_interval = 0.5
+
+Job = collections.namedtuple("Job", ["src", "dst", "size"])
+Stats = collections.namedtuple("Stats", ["files", "skipped", "bytes", "seconds"])
+
+
+def encrypt_path(src, dst, encryption_key, mode=default_mode, compression=None, segment_size=default_segment_size,
+                 workers=None, resume=False, progress=None):
+    """
+    Encrypting a file or a directory tree (files get the ".lsa" suffix)
+    :param src: File or directory to encrypt
+    :param dst: Output file (or directory for a directory or to put the file into)
+    :param encryption_key: Encryption key
+    :param mode: Encryption mode ("cbc" or "gcm")
+    :param compression: Compression method ("zlib", "lzma", "bz2" or None)
+    :param segment_size: Amount of data (in bytes) that goes to one LocSec chunk
+    :param workers: Amount of worker processes (CPU count if not specified, 1 means no process pool)
+    :param resume: Whether to skip files that are already encrypted (by a previous, maybe interrupted, run)
+    :param progress: Writable text stream for progress output (no progress if not specified)
+    :return: Stats
+    """
+    _check_segment_size(segment_size)
+    LocSecCipher(encryption_key, mode, compression=compression)
+    jobs = _jobs(src, dst, lambda name: name + suffix, lambda name: True)
+    return _run(jobs, functools.partial(_encrypt_tasks, segment_size), _encrypt_segment,
+                (encryption_key, mode, compression), True, workers, resume, progress)
+
+
+def decrypt_path(src, dst, encryption_key, workers=None, resume=False, progress=None):
+    """
+    Decrypting a file or a directory tree encrypted by encrypt_path (only ".lsa" files of a tree are decrypted)
+    :param src: File or directory to decrypt
+    :param dst: Output file (or directory for a directory or to put the file into)
+    :param encryption_key: Encryption key
+    :param workers: Amount of worker processes (CPU count if not specified, 1 means no process pool)
+    :param resume: Whether to skip files that are already decrypted (by a previous, maybe interrupted, run)
+    :param progress: Writable text stream for progress output (no progress if not specified)
+    :return: Stats
+    """
+    LocSecCipher(encryption_key)
+    jobs = _jobs(src, dst, lambda name: name[:-len(suffix)] if name.endswith(suffix) else name,
+                 lambda name: name.endswith(suffix))
+    return _run(jobs, _decrypt_tasks, _decrypt_segment, (encryption_key,), False, workers, resume, progress)
+
+
+def _jobs(src, dst, output_name, wanted):
+    """
+    :return: list of Jobs for a file or all wanted files of a directory tree
+    """
+    if not os.path.isdir(src):
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, output_name(os.path.basename(src)))
+        return [Job(src, dst, os.path.getsize(src))]
+    jobs = []
+    dst_real = os.path.realpath(dst)
+    for directory, subdirectories, files in os.walk(src):
+        # Output tree inside the input tree is not input
+        subdirectories[:] = sorted(name for name in subdirectories
+                                   if os.path.realpath(os.path.join(directory, name)) != dst_real)
+        output_directory = os.path.join(dst, os.path.relpath(directory, src))
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            if wanted(name) and not name.endswith(part_suffix) and os.path.isfile(path):
+                jobs.append(Job(path, os.path.normpath(os.path.join(output_directory, output_name(name))),
+                                os.path.getsize(path)))
+    return jobs
+
+
+def _run(jobs, make_tasks, function, args, framed, workers, resume, progress):
+    """
+    Processing segments of all jobs on a pool and writing results in order
+    :param make_tasks: Function returning header of the output file and list of (offset, length, *task_args)
+     segments of a job
+    :param function: Worker function: function(path, offset, length, *task_args, *args) -> output of the segment
+    :param framed: Whether outputs are framed (written as LocSec streams)
+    :return: Stats
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise EncryptionException("Bad amount of workers: should be at least 1.")
+    started = time.perf_counter()
+    complete = [resume and _is_complete(job) for job in jobs]
+    skipped = sum(complete)
+    jobs = [job for job, done in zip(jobs, complete) if not done]
+    reporter = _Progress(progress, len(jobs), sum(job.size for job in jobs), started)
+    pending = collections.deque()
+    # Process pool startup costs more than it saves for one worker
+    with (ProcessPoolExecutor(workers) if workers > 1 else ThreadPoolExecutor(1)) as pool:
+        try:
+            for job in jobs:
+                header, tasks = make_tasks(job)
+                writer = _Writer(job, header, framed)
+                if not tasks:
+                    pending.append((writer, None, 0, True))
+                for index, task in enumerate(tasks):
+                    pending.append((writer, pool.submit(function, job.src, *task, *args), task[1],
+                                    index == len(tasks) - 1))
+                    while len(pending) > workers * in_flight_per_worker:
+                        _write_result(pending.popleft(), reporter)
+            while pending:
+                _write_result(pending.popleft(), reporter)
+        except BaseException:
+            for writer, future, length, last in pending:
+                if future is not None:
+                    future.cancel()
+                writer.abort()
+            raise
+    reporter.finish()
+    return Stats(len(jobs), skipped, reporter.done_bytes, time.perf_counter() - started)
+
+
+def _write_result(entry, reporter):
+    writer, future, length, last = entry
+    if future is not None:
+        try:
+            writer.write(future.result())
+        except BaseException:
+            writer.abort()
+            raise
+    reporter.update(length, last)
+    if last:
+        writer.commit()
+
+
+def _is_complete(job):
+    try:
+        return os.stat(job.dst).st_mtime_ns == os.stat(job.src).st_mtime_ns
+    except OSError:
+        return False
+
+
+class _Writer:
+    """
+    Output file written to "<dst>.part" and renamed to dst when it's complete
+    """
+
+    def __init__(self, job, header, framed):
+        self.job = job
+        self.framed = framed
+        self.part = job.dst + part_suffix
+        self.file = None
+        self.header = header
+
+    def write(self, data):
+        if self.file is None:
+            self._open()
+        if self.framed:
+            self.file.write(_frame_header.pack(len(data)))
+        self.file.write(data)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.part) or ".", exist_ok=True)
+        self.file = open(self.part, "wb")
+        self.file.write(self.header)
+
+    def commit(self):
+        if self.file is None:
+            self._open()
+        if self.framed:
+            self.file.write(_frame_header.pack(0))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.part, self.job.dst)
+        shutil.copymode(self.job.src, self.job.dst)
+        src_stat = os.stat(self.job.src)
+        os.utime(self.job.dst, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+
+    def abort(self):
+        if self.file is not None and not self.file.closed:
+            self.file.close()
+            try:
+                os.remove(self.part)
+            except OSError:
+                pass
+
+
+class _Progress:
+    def __init__(self, stream, total_files, total_bytes, started):
+        self.stream = stream
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.started = started
+        self.done_files = 0
+        self.done_bytes = 0
+        self.shown = 0
+        self.width = 0
+
+    def update(self, length, file_done):
+        self.done_bytes += length
+        self.done_files += file_done
+        if self.stream is not None and time.perf_counter() - self.shown >= progress_interval:
+            self._show("\r")
+
+    def finish(self):
+        if self.stream is not None:
+            self._show("\r")
+            self.stream.write("\n")
+            self.stream.flush()
+
+    def _show(self, prefix):
+        self.shown = time.perf_counter()
+        elapsed = max(self.shown - self.started, 1e-9)
+        line = "{}/{} files, {:.1f}/{:.1f} MiB, {:.1f} MB/s".format(
+            self.done_files, self.total_files, self.done_bytes / 1048576, self.total_bytes / 1048576,
+            self.done_bytes / elapsed / 1000000)
+        # Padded to overwrite the previous line completely
+        self.stream.write(prefix + line.ljust(self.width))
+        self.width = len(line)
+        self.stream.flush()
+
+
+def _encrypt_tasks(segment_size, job):
+    # Tasks get the stream ID, segment index and whether the segment is final (an empty file has one empty segment)
+    stream_id, header = _new_stream_header()
+    offsets = range(0, job.size, segment_size) or [0]
+    return header, [(offset, min(segment_size, job.size - offset), stream_id, index, index == len(offsets) - 1)
+                    for index, offset in enumerate(offsets)]
+
+
+def _decrypt_tasks(job):
+    # Frame headers are read (a few bytes per segment), segments themselves are read by workers.
+    #  Workers check the segment index and that only the last frame is final
+    tasks = []
+    with open(job.src, "rb") as src:
+        try:
+            stream_id = _parse_stream_header(src.read(_stream_header.size))
+        except MalformedChunkException:
+            raise MalformedChunkException("Could not decrypt \"{}\": not a LocSec stream "
+                                          "(or unsupported stream version).", job.src)
+        offset = _stream_header.size
+        while True:
+            frame_header = src.read(_frame_header.size)
+            if len(frame_header) < _frame_header.size:
+                raise MalformedChunkException("Could not decrypt \"{}\": stream is truncated.", job.src)
+            (frame_length,) = _frame_header.unpack(frame_header)
+            offset += _frame_header.size
+            if frame_length == 0:
+                if not tasks:
+                    raise MalformedChunkException("Could not decrypt \"{}\": stream is truncated.", job.src)
+                return b"", [task + (task[3] == len(tasks) - 1,) for task in tasks]
+            if frame_length > max_frame_length or offset + frame_length > job.size:
+                raise OversizeException("Could not decrypt \"{}\": bad frame length ({} bytes).",
+                                        job.src, frame_length)
+            tasks.append((offset, frame_length, stream_id, len(tasks)))
+            offset = src.seek(frame_length, os.SEEK_CUR)
+
+
+# Worker side: the last mapped file is kept open (segments of one file usually go to the same worker in a row)
+_mapped = None
+
+
+def _map(path):
+    global _mapped
+    if _mapped is None or _mapped[0] != path:
+        if _mapped is not None:
+            try:
+                _mapped[2].close()
+            except BufferError:
+                # Views of it are still referenced (by a traceback of a failed segment), it's closed when they go
+                pass
+            _mapped[1].close()
+        file = open(path, "rb")
+        _mapped = (path, file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+    return _mapped[2]
+
+
+@functools.lru_cache(maxsize=4)
+def _cipher(encryption_key, mode=default_mode, compression=None):
+    return LocSecCipher(encryption_key, mode, compression=compression)
+
+
+def _encrypt_segment(path, offset, length, stream_id, index, final, encryption_key, mode, compression):
+    cipher = _cipher(encryption_key, mode, compression)
+    if not length:
+        # Empty files can't be mapped
+        return cipher.encrypt(_segment_data(stream_id, index, final, b""))
+    with memoryview(_map(path)) as view, view[offset:offset + length] as segment:
+        return cipher.encrypt(_segment_data(stream_id, index, final, segment))
+
+
+def _decrypt_segment(path, offset, length, stream_id, index, last, encryption_key):
+    with memoryview(_map(path)) as view, view[offset:offset + length] as chunk:
+        segment = _cipher(encryption_key)._decrypt(chunk)[1]
+    if _check_segment(segment, stream_id, index) != last:
+        raise MalformedChunkException("Could not decrypt \"{}\": {}.", path,
+                                      "stream is truncated (final segment is missing)" if last else
+                                      "frames after the final segment")
+    return segment
+
+
+def _read_key(key_file):
+    if key_file is not None:
+        with open(key_file, encoding="utf-8") as file:
+            return file.read().rstrip("\r\n")
+    if os.environ.get(key_env):
+        return os.environ[key_env]
+    return getpass.getpass("Encryption key: ")
+
+
+def _serve(args):
+    try:
+        keys = {}
+        for key in args.key:
+            key_id, _, key_file = key.partition("=")
+            if not key_id.isdigit() or not key_file:
+                raise EncryptionException("Bad --key \"{}\": should be ID=KEY_FILE.", key)
+            keys[int(key_id)] = _read_key(key_file)
+        if args.key_file is not None or not keys:
+            keys[0] = _read_key(args.key_file)
+        LocSecServer(args.socket, keys, args.workers).run()
+    except (EncryptionException, OSError) as e:
+        print("locsec-aes: {}".format(e), file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="locsec-aes",
+                                     description="Encrypting/decrypting files and directory trees with LocSec-AES")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ("encrypt", "decrypt"):
+        subparser = subparsers.add_parser(command, help="{} a file or a directory tree".format(command))
+        subparser.add_argument("src", help="file or directory to {}".format(command))
+        subparser.add_argument("dst", help="output file or directory")
+        subparser.add_argument("-k", "--key-file", help="file with the encryption key "
+                                                        "(default: ${} or a prompt)".format(key_env))
+        subparser.add_argument("-j", "--workers", type=int, help="worker processes (default: CPU count)")
+        subparser.add_argument("--resume", action="store_true", help="skip files that are already done")
+        subparser.add_argument("-q", "--quiet", action="store_true", help="no progress output")
+        if command == "encrypt":
+            subparser.add_argument("-m", "--mode", choices=modes, default=default_mode,
+                                   help="encryption mode (default: %(default)s)")
+            subparser.add_argument("-c", "--compression", choices=compression_module.methods,
+                                   help="compression method (default: none)")
+            subparser.add_argument("-s", "--segment-size", type=int, default=default_segment_size,
+                                   help="bytes per LocSec chunk (default: %(default)s)")
+    subparser = subparsers.add_parser("serve", help="run the encryption daemon on a Unix domain socket")
+    subparser.add_argument("socket", help="path of the socket")
+    subparser.add_argument("-k", "--key-file", help="file with the key of ID 0 "
+                                                    "(default: ${} or a prompt, unless --key is given)".format(key_env))
+    subparser.add_argument("--key", action="append", default=[], metavar="ID=KEY_FILE",
+                           help="file with the key of ID (can be repeated)")
+    subparser.add_argument("-j", "--workers", type=int, help="worker threads (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        return _serve(args)
+    progress = None if args.quiet else sys.stderr
+    try:
+        encryption_key = _read_key(args.key_file)
+        if args.command == "encrypt":
+            stats = encrypt_path(args.src, args.dst, encryption_key, args.mode, args.compression, args.segment_size,
+                                 args.workers, args.resume, progress)
+        else:
+            stats = decrypt_path(args.src, args.dst, encryption_key, args.workers, args.resume, progress)
+    except (EncryptionException, OSError) as e:
+        print("locsec-aes: {}".format(e), file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        print("\nlocsec-aes: interrupted, run with --resume to continue", file=sys.stderr)
+        return 130
+    if not args.quiet:
+        print("{}ed {} files ({:.1f} MiB) in {:.2f} s, {:.1f} MB/s{}".format(
+            args.command.capitalize(), stats.files, stats.bytes / 1048576, stats.seconds,
+            stats.bytes / max(stats.seconds, 1e-9) / 1000000,
+            ", {} already done".format(stats.skipped) if stats.skipped else ""), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
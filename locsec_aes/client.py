@@ -0,0 +1,242 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import selectors
+import socket
+import threading
+
+from locsec_aes import protocol
+from locsec_aes.EncryptionException import EncryptionException, OversizeException
+
+'''
+Client of the LocSec daemon (locsec_aes.server). Imports no crypto libraries and derives no keys:
+ everything is done by the daemon. Connections are pooled, *_many calls pipeline requests on one connection
+ (sending them while reading responses, so neither side waits for the other with full buffers).
+'''
+
+default_pool_size = 4
+# Requests sent ahead of responses in *_many calls (kept under protocol.max_in_flight)
+default_window = 32
+
+
+class LocSecClient:
+    """
+    Thread-safe client with a pool of connections to the daemon
+    """
+
+    def __init__(self, path, pool_size=default_pool_size, timeout=None):
+        """
+        :param path: Path of the daemon's Unix domain socket
+        :param pool_size: Max amount of connections (and calls running at once)
+        :param timeout: Socket timeout (in seconds, none if not specified)
+        """
+        self.path = path
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def encrypt(self, data, key_id=0, mode=None):
+        """
+        :param data: Data to encrypt (any object supporting buffer protocol)
+        :param key_id: ID of the key on the server
+        :param mode: Encryption mode ("cbc" or "gcm", default of the server if not specified)
+        :return: Encrypted LocSec chunk (bytearray)
+        """
+        return self._call_many(protocol.operation_encrypt, _mode_flags(mode), key_id, (data,), 1, True)[0]
+
+    def decrypt(self, chunk, key_id=0):
+        """
+        :param chunk: LocSec chunk (any object supporting buffer protocol)
+        :param key_id: ID of the key on the server
+        :return: Decrypted data (bytearray)
+        """
+        return self._call_many(protocol.operation_decrypt, 0, key_id, (chunk,), 1, True)[0]
+
+    def encrypt_many(self, items, key_id=0, mode=None, window=default_window):
+        """
+        Encrypting many pieces of data with pipelined requests
+        :return: List of encrypted LocSec chunks in the order of items.
+         Items that could not be encrypted get an EncryptionException in their place
+        """
+        return self._call_many(protocol.operation_encrypt, _mode_flags(mode), key_id, items, window)
+
+    def decrypt_many(self, items, key_id=0, window=default_window):
+        """
+        Decrypting many chunks with pipelined requests
+        :return: List of decrypted data in the order of items.
+         Items that could not be decrypted get an EncryptionException in their place
+        """
+        return self._call_many(protocol.operation_decrypt, 0, key_id, items, window)
+
+    def _call_many(self, operation, flags, key_id, items, window, raise_errors=False):
+        items = list(items)
+        results = [None] * len(items)
+        window = max(1, min(window, protocol.max_in_flight - 1))
+        with self._slots:
+            connection = self._connection()
+            try:
+                in_flight = {}
+                queued = 0
+                while queued < len(items) or in_flight:
+                    while queued < len(items) and len(in_flight) < window:
+                        try:
+                            payload = _payload(items[queued])
+                        except EncryptionException as e:
+                            # Items that can't be sent fail in place, the rest of them are still processed
+                            results[queued] = e
+                        else:
+                            in_flight[connection.queue(operation, flags, key_id, payload)] = queued
+                        queued += 1
+                    if not in_flight:
+                        continue
+                    request_id, status, payload = connection.receive()
+                    index = in_flight.pop(request_id)
+                    if status == protocol.status_ok:
+                        results[index] = payload
+                    else:
+                        results[index] = protocol.error_from_status(status, payload.decode(errors="replace"))
+            except BaseException:
+                # State of the connection is unknown (responses may be pending)
+                connection.close()
+                raise
+            with self._lock:
+                self._idle.append(connection)
+        if raise_errors:
+            for result in results:
+                if isinstance(result, EncryptionException):
+                    raise result
+        return results
+
+    def _connection(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return _Connection(self.path, self.timeout)
+
+    def close(self):
+        """
+        Closing idle connections
+        """
+        with self._lock:
+            for connection in self._idle:
+                connection.close()
+            self._idle = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _Connection:
+    def __init__(self, path, timeout):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        try:
+            self.socket.connect(path)
+        except BaseException:
+            self.socket.close()
+            raise
+        self.timeout = timeout
+        self._next_id = 0
+        self._out = bytearray()
+        self._sent = 0
+        self._header = bytearray(protocol.response_header.size)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.socket, selectors.EVENT_READ)
+        self._events = selectors.EVENT_READ
+
+    def queue(self, operation, flags, key_id, payload):
+        """
+        Queueing a request (sent while receiving responses)
+        :param payload: Request payload (checked by _payload)
+        :return: Request ID
+        """
+        request_id = self._next_id
+        self._next_id = (self._next_id + 1) & 0xffffffff
+        self._out += protocol.request_header.pack(len(payload), request_id, operation, flags, key_id)
+        self._out += payload
+        return request_id
+
+    def receive(self):
+        """
+        :return: Request ID, status and payload of the next response
+        """
+        self._receive_into(memoryview(self._header))
+        length, request_id, status = protocol.response_header.unpack(self._header)
+        payload = bytearray(length)
+        self._receive_into(memoryview(payload))
+        return request_id, status, payload
+
+    def _receive_into(self, view):
+        while view:
+            view = view[self._transfer(view):]
+
+    def _transfer(self, view):
+        """
+        Sending queued requests and receiving into view, whichever the socket is ready for
+        :return: Amount of bytes received
+        """
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE if self._sent < len(self._out) else selectors.EVENT_READ
+        if events != self._events:
+            self._selector.modify(self.socket, events)
+            self._events = events
+        ready = self._selector.select(self.timeout)
+        if not ready:
+            raise socket.timeout("Timed out waiting for the LocSec daemon.")
+        ready = ready[0][1]
+        if ready & selectors.EVENT_WRITE:
+            with memoryview(self._out) as out:
+                self._sent += self.socket.send(out[self._sent:])
+            if self._sent == len(self._out):
+                self._out.clear()
+                self._sent = 0
+            elif self._sent > len(self._out) // 2:
+                del self._out[:self._sent]
+                self._sent = 0
+        if not ready & selectors.EVENT_READ:
+            return 0
+        received = self.socket.recv_into(view)
+        if not received:
+            raise ConnectionError("Connection to the LocSec daemon was closed.")
+        return received
+
+    def close(self):
+        self._selector.close()
+        self.socket.close()
+
+
+def _payload(item):
+    """
+    :return: Item as a byte view that fits in a request
+    """
+    try:
+        payload = memoryview(item).cast("B")
+    except TypeError:
+        raise EncryptionException("Data should support buffer protocol, got {}.", type(item).__name__)
+    if len(payload) > protocol.max_payload_length:
+        raise OversizeException("Request is too big ({} bytes, max is {}).", len(payload), protocol.max_payload_length)
+    return payload
+
+
+def _mode_flags(mode):
+    if mode is None or mode == "cbc":
+        return 0
+    if mode == "gcm":
+        return protocol.flag_gcm
+    raise EncryptionException("Unknown encryption mode: \"{}\".", mode)
@@ -0,0 +1,262 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import importlib
+import io
+import itertools
+import pickle
+import struct
+import sys
+
+from locsec_aes.EncryptionException import EncryptionException
+
+'''
+Typed data codecs.
+Type tag of encoded data is stored in encrypted chunk headers ("data type" byte), so decrypted data
+ can be turned back into an object of the original type. Tag 0 means untyped data (decrypted as str or bytearray).
+Tags up to 31 are taken by built-in codecs, custom types should use tags 32-255.
+Containers (list, dict, tuple, set, frozenset) start with a format byte.
+Containers of built-in types only (None, bool, int, float, str, bytes and containers of them) are pickled
+ with protocol 4 (fixed format, read by every Python 3 version) by C code: the pickler refuses any other object
+ and the unpickler refuses to load any class or function, so decoding can't create or call anything else.
+Containers with other types (custom types, subclasses) are encoded item by item with the codecs of their types:
+
+ size        1            4             1        4        (item length)
+(bytes)  |========|==============|  |=====|=============|#############|  ...
+             ^           ^             ^         ^              ^
+         container   amount of      item      item       encoded item
+          format     items (dicts   type     length
+                     count keys     tag
+                     and values)
+'''
+
+untyped = 0
+custom_tag_min = 32
+
+encoding = "utf-8"
+# Container formats
+container_itemized = 1
+container_pickled = 2
+# Pickler can refuse objects that aren't of built-in types since Python 3.8 (older ones write itemized containers)
+pickle_containers = sys.version_info >= (3, 8)
+_pickle_protocol = 4
+
+_int64 = struct.Struct(">q")
+_float64 = struct.Struct(">d")
+_container_format = struct.Struct(">B")
+_container_header = struct.Struct(">BI")
+_item_header = struct.Struct(">BI")
+
+# tag -> (type, encode, decode)
+_codecs = {}
+# type -> tag
+_tags = {}
+# Built-in tags of codecs registered by other modules (imported when data with the tag is decoded)
+_module_tags = {13: "locsec_aes.packed"}
+
+
+def register_codec(data_class, tag, encode, decode):
+    """
+    Registering a codec for a type
+    :param data_class: Type of objects to encode
+    :param tag: Type tag stored in the chunk (32-255 for custom types)
+    :param encode: Function turning an object into bytes (or any other object supporting buffer protocol)
+    :param decode: Function turning a bytearray back into an object
+    """
+    if type(tag) is not int or not custom_tag_min <= tag <= 255:
+        raise EncryptionException("Bad type tag: custom types should use tags {}-255.".format(custom_tag_min))
+    _register(data_class, tag, encode, decode)
+
+
+def unregister_codec(tag):
+    """
+    Removing a custom codec
+    :param tag: Type tag of the codec
+    """
+    if tag < custom_tag_min or tag not in _codecs:
+        raise EncryptionException("No custom codec with type tag {}.".format(tag))
+    data_class = _codecs.pop(tag)[0]
+    del _tags[data_class]
+
+
+def encode(data):
+    """
+    Encoding an object with the codec of its type
+    :param data: Object to encode
+    :return: type tag and encoded data
+    """
+    tag = _tags.get(type(data))
+    if tag is None:
+        # Subclasses of registered types
+        for data_class, a_tag in _tags.items():
+            if isinstance(data, data_class):
+                tag = a_tag
+                break
+        else:
+            raise EncryptionException("No codec for data type: \"{}\"".format(type(data)))
+    return tag, _codecs[tag][1](data)
+
+
+def decode(tag, data):
+    """
+    Decoding data with the codec of its type tag
+    :param tag: Type tag
+    :param data: Encoded data (bytearray)
+    :return: Decoded object
+    """
+    if tag not in _codecs and tag in _module_tags:
+        importlib.import_module(_module_tags[tag])
+    if tag not in _codecs:
+        raise EncryptionException("No codec for type tag {}.".format(tag))
+    return _codecs[tag][2](data)
+
+
+def _register(data_class, tag, encode_function, decode_function):
+    if tag in _codecs:
+        raise EncryptionException("Type tag {} is already taken by \"{}\".".format(tag, _codecs[tag][0]))
+    if data_class in _tags:
+        raise EncryptionException("Type \"{}\" already has a codec.".format(data_class))
+    _codecs[tag] = (data_class, encode_function, decode_function)
+    _tags[data_class] = tag
+
+
+def _encode_int(data):
+    # 64-bit ints are packed with struct, bigger ones take as many bytes as they need (always more than 8)
+    try:
+        return _int64.pack(data)
+    except struct.error:
+        return data.to_bytes(data.bit_length() // 8 + 1, "big", signed=True)
+
+
+def _decode_int(data):
+    if len(data) == _int64.size:
+        return _int64.unpack(data)[0]
+    return int.from_bytes(data, "big", signed=True)
+
+
+class _NotBuiltin(Exception):
+    pass
+
+
+class _BuiltinPickler(pickle.Pickler):
+    def reducer_override(self, obj):
+        # Not called for None, bools and objects of exactly int, float, bytes, str, dict, set, frozenset, list, tuple
+        raise _NotBuiltin()
+
+
+class _BuiltinUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError("Global \"{}.{}\" is not allowed.".format(module, name))
+
+
+def _encode_container(data):
+    if pickle_containers:
+        stream = io.BytesIO()
+        stream.write(_container_format.pack(container_pickled))
+        try:
+            _BuiltinPickler(stream, _pickle_protocol).dump(data)
+            return stream.getvalue()
+        except _NotBuiltin:
+            pass
+    return _encode_items(data)
+
+
+def _encode_items(data):
+    values = itertools.chain.from_iterable(data.items()) if isinstance(data, dict) else data
+    parts = [b""]
+    append = parts.append
+    pack = _item_header.pack
+    tags = _tags
+    codecs = _codecs
+    for value in values:
+        tag = tags.get(type(value))
+        if tag is None:
+            # Subclasses, types without a codec
+            try:
+                tag, encoded = encode(value)
+            except EncryptionException:
+                raise EncryptionException("Container has items without a codec: \"{}\"".format(type(value)))
+        else:
+            encoded = codecs[tag][1](value)
+        append(pack(tag, len(encoded)))
+        append(encoded)
+    parts[0] = _container_header.pack(container_itemized, len(parts) // 2)
+    return b"".join(parts)
+
+
+def _decode_container(data_class):
+    def decode_function(data):
+        if type(data) is not bytearray:
+            data = bytearray(data)
+        end = len(data)
+        if end and data[0] == container_pickled:
+            return _unpickle(data, data_class)
+        if end < _container_header.size:
+            raise EncryptionException("Bad container: header is missing.")
+        container_format, count = _container_header.unpack_from(data)
+        if container_format != container_itemized:
+            raise EncryptionException("Bad container: unsupported format {}.".format(container_format))
+        items = []
+        append = items.append
+        unpack_from = _item_header.unpack_from
+        header_size = _item_header.size
+        codecs = _codecs
+        position = _container_header.size
+        try:
+            for _ in range(count):
+                tag, length = unpack_from(data, position)
+                position += header_size + length
+                if position > end:
+                    raise EncryptionException("Bad container: it is truncated.")
+                item_codec = codecs.get(tag)
+                item = data[position - length:position]
+                append(item_codec[2](item) if item_codec is not None else decode(tag, item))
+        except struct.error:
+            raise EncryptionException("Bad container: it is truncated.")
+        if position != end:
+            raise EncryptionException("Bad container: data after the last item.")
+        if data_class is list:
+            return items
+        if data_class is dict and count % 2:
+            raise EncryptionException("Bad container: dict without a value for the last key.")
+        try:
+            return dict(zip(items[::2], items[1::2])) if data_class is dict else data_class(items)
+        except TypeError:
+            raise EncryptionException("Bad container: unhashable keys or items in a \"{}\".".format(data_class))
+    return decode_function
+
+
+def _unpickle(data, data_class):
+    stream = io.BytesIO(data)
+    stream.seek(_container_format.size)
+    try:
+        container = _BuiltinUnpickler(stream).load()
+    except Exception:
+        raise EncryptionException("Bad container: could not unpickle it.")
+    if type(container) is not data_class or stream.read(1):
+        raise EncryptionException("Bad container: it is not a \"{}\" (or has data after it).".format(data_class))
+    return container
+
+
+_register(bytes, 1, lambda data: data, bytes)
+_register(bytearray, 2, lambda data: data, lambda data: data)
+_register(str, 3, lambda data: data.encode(encoding), lambda data: data.decode(encoding))
+_register(bool, 4, lambda data: b"\x01" if data else b"\x00", lambda data: data == b"\x01")
+_register(int, 5, _encode_int, _decode_int)
+_register(float, 6, _float64.pack, lambda data: _float64.unpack(data)[0])
+_register(type(None), 7, lambda data: b"", lambda data: None)
+for _tag, _data_class in ((8, list), (9, dict), (10, tuple), (11, set), (12, frozenset)):
+    _register(_data_class, _tag, _encode_container, _decode_container(_data_class))
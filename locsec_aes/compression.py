@@ -0,0 +1,120 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import bz2
+import lzma
+import zlib
+
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException
+
+'''
+Optional compression of data before encryption.
+Compression method is stored in the lower bits of encrypted "data flags" byte of a chunk,
+ length of the original (uncompressed) data goes to the reserved bytes of chunk meta.
+Data that looks incompressible (judging by a sample of it) or doesn't get any shorter is stored as is.
+'''
+
+methods = ("zlib", "lzma", "bz2")
+# Compression method id in data flags
+method_flags = {"zlib": 0x01, "lzma": 0x02, "bz2": 0x03}
+flags_mask = 0x03
+_flags_methods = {flag: method for method, flag in method_flags.items()}
+
+default_levels = {"zlib": 6, "lzma": 0, "bz2": 9}
+
+# Data shorter than this isn't worth compressing (it's padded to 256 bytes anyway)
+min_length = 512
+# Data longer than this is sampled before compressing: sample_count slices of sample_length bytes
+#  are compressed with zlib (fastest), if they don't shrink by at least sample_ratio the data is left as is
+sample_threshold = 65536
+sample_length = 4096
+sample_count = 4
+sample_ratio = 0.9
+
+
+def check_method(method):
+    """
+    :param method: Compression method name (or None for no compression)
+    :return: method
+    """
+    if method is not None and method not in method_flags:
+        raise EncryptionException("Unknown compression method: \"{}\". Supported methods: {}"
+                                  .format(method, ", ".join(methods)))
+    return method
+
+
+def compress(data_view, method, level=None):
+    """
+    Compressing data (if it looks compressible)
+    :param data_view: Data to compress (memoryview)
+    :param method: Compression method ("zlib", "lzma" or "bz2")
+    :param level: Compression level (preset for lzma), default for the method if not specified
+    :return: data flags and compressed data, or 0 and None if the data was not compressed
+    """
+    data_length = len(data_view)
+    if data_length < min_length or not _looks_compressible(data_view):
+        return 0, None
+    if level is None:
+        level = default_levels[method]
+    if method == "zlib":
+        compressed = zlib.compress(data_view, level)
+    elif method == "lzma":
+        compressed = lzma.compress(data_view, preset=level)
+    else:
+        compressed = bz2.compress(data_view, level)
+    if len(compressed) >= data_length:
+        return 0, None
+    return method_flags[method], compressed
+
+
+def decompress(data_flags, data, original_length):
+    """
+    Decompressing data of a chunk
+    :param data_flags: Data flags of the chunk
+    :param data: Compressed data
+    :param original_length: Length of data before compression (from chunk meta)
+    :return: Decompressed data (bytes)
+    """
+    method = _flags_methods[data_flags & flags_mask]
+    if method == "zlib":
+        decompressor = zlib.decompressobj()
+        # No more than original length is ever decompressed (no matter what compressed data says)
+        decompressed = decompressor.decompress(data, original_length)
+        finished = decompressor.eof and not decompressor.unconsumed_tail
+    else:
+        decompressor = lzma.LZMADecompressor() if method == "lzma" else bz2.BZ2Decompressor()
+        decompressed = decompressor.decompress(data, original_length)
+        finished = decompressor.eof
+    if not finished or len(decompressed) != original_length:
+        raise MalformedChunkException("Could not decompress data: decompressed data length mismatch.")
+    return decompressed
+
+
+def flags_method(data_flags):
+    """
+    :param data_flags: Data flags of a chunk
+    :return: Compression method name (or None if data is not compressed)
+    """
+    return _flags_methods.get(data_flags & flags_mask)
+
+
+def _looks_compressible(data_view):
+    data_length = len(data_view)
+    if data_length <= sample_threshold:
+        return True
+    step = (data_length - sample_length) // (sample_count - 1)
+    sample = b"".join(data_view[i * step:i * step + sample_length] for i in range(sample_count))
+    return len(zlib.compress(sample, 1)) < len(sample) * sample_ratio
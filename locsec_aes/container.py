@@ -0,0 +1,308 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import bisect
+import collections
+import io
+import os
+import struct
+
+from locsec_aes.encryption import LocSecCipher, default_mode, data_size_max, chunk_length_max, _buffer_view
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException
+
+'''
+LocSec AES container (seekable, only the chunks that are read are decrypted):
+
+ size      4       1        16                                                4              4                 12
+(bytes) |=====|=========|=========|###########|###########|  ...  |=============|###########|  ...  |============|
+           ^       ^         ^          ^           ^                   ^             ^                    ^
+         magic container container   chunk 0     chunk 1       index chunk length  index chunk          trailer
+               version      ID        (data, chunk_size bytes each)           (a few entries each)
+
+Header: magic, container version, random container ID (16 bytes).
+Trailer: offset of the first index frame (u64), amount of index frames (u32).
+Every index chunk (at least one) starts with: container ID, frame number (u32), amount of frames (u32),
+ amount of index entries (u64) and data length (u64) of the container, so the (not encrypted) trailer
+ can't cut the index or make it come from another container.
+Index entries (encrypted): chunk offset (u64), chunk length (u32), offset of its data in the container (u64),
+ data length (u32) and first bytes of the chunk (header and IV, so chunks can't be swapped or replaced).
+'''
+
+container_magic = b"LSAC"
+container_version = 2
+default_chunk_size = 65536  # 64 KiB
+default_cache_chunks = 32
+
+_container_header = struct.Struct(">4sB16s")
+_trailer = struct.Struct(">QI")
+_index_frame = struct.Struct(">I")
+_index_prefix = struct.Struct(">16sIIQQ")
+_index_entry = struct.Struct(">QIQI32s")
+_chunk_prefix_length = 32
+
+# Index is split into chunks of this many entries
+_index_entries_per_chunk = (data_size_max - _index_prefix.size) // _index_entry.size
+
+IndexEntry = collections.namedtuple("IndexEntry", ["offset", "length", "data_offset", "data_length", "prefix"])
+
+
+class ContainerWriter:
+    """
+    Writing data to a new LocSec container (file-like, write-only)
+    """
+
+    def __init__(self, file, encryption_key, chunk_size=default_chunk_size, mode=default_mode, compression=None):
+        """
+        :param file: Path or a writable binary file object (positioned where the container should start)
+        :param encryption_key: Encryption key
+        :param chunk_size: Amount of data (in bytes) in one chunk: smaller chunks make small reads cheaper,
+         bigger ones make the index smaller
+        :param mode: Encryption mode ("cbc" or "gcm")
+        :param compression: Compression method for chunks ("zlib", "lzma", "bz2" or None)
+        """
+        if not 0 < chunk_size <= data_size_max:
+            raise EncryptionException("Bad chunk size: should be between 1 and {} bytes.".format(data_size_max))
+        self.cipher = LocSecCipher(encryption_key, mode, compression=compression)
+        self.chunk_size = chunk_size
+        self._own_file = isinstance(file, (str, bytes, os.PathLike))
+        self.file = open(file, "wb") if self._own_file else file
+        self._container_id = os.urandom(16)
+        self.file.write(_container_header.pack(container_magic, container_version, self._container_id))
+        self._buffer = bytearray()
+        self._entries = []
+        self._data_length = 0
+        self.closed = False
+
+    def write(self, data):
+        """
+        :param data: Data to append (any object supporting buffer protocol)
+        :return: Amount of data written
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed container.")
+        data_view = _buffer_view(data)
+        position = 0
+        if self._buffer:
+            position = min(len(data_view), self.chunk_size - len(self._buffer))
+            self._buffer.extend(data_view[:position])
+            if len(self._buffer) < self.chunk_size:
+                return len(data_view)
+            self._write_chunk(self._buffer)
+            self._buffer = bytearray()
+        # Whole chunks are encrypted right from data, the rest waits for more data
+        while len(data_view) - position >= self.chunk_size:
+            self._write_chunk(data_view[position:position + self.chunk_size])
+            position += self.chunk_size
+        self._buffer.extend(data_view[position:])
+        return len(data_view)
+
+    def _write_chunk(self, data):
+        chunk = self.cipher.encrypt(data)
+        offset = self.file.tell()
+        self.file.write(chunk)
+        self._entries.append(_index_entry.pack(offset, len(chunk), self._data_length, len(data),
+                                               bytes(chunk[:_chunk_prefix_length])))
+        self._data_length += len(data)
+
+    def close(self):
+        """
+        Writing the rest of data, the index and the trailer (container can't be read before it's closed)
+        """
+        if self.closed:
+            return
+        if self._buffer:
+            self._write_chunk(self._buffer)
+            self._buffer = bytearray()
+        index_offset = self.file.tell()
+        frames = max(1, -(-len(self._entries) // _index_entries_per_chunk))
+        for frame in range(frames):
+            start = frame * _index_entries_per_chunk
+            prefix = _index_prefix.pack(self._container_id, frame, frames, len(self._entries), self._data_length)
+            chunk = self.cipher.encrypt(prefix + b"".join(self._entries[start:start + _index_entries_per_chunk]),
+                                        compression=False)
+            self.file.write(_index_frame.pack(len(chunk)))
+            self.file.write(chunk)
+        self.file.write(_trailer.pack(index_offset, frames) + container_magic)
+        self.file.flush()
+        if self._own_file:
+            self.file.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Not finishing a container that failed half-way: without a trailer it can't be opened
+            if self._own_file:
+                self.file.close()
+            self.closed = True
+
+
+class ContainerReader(io.RawIOBase):
+    """
+    Reading a LocSec container like a file: seek/read decrypt only the chunks overlapping the requested range,
+     recently decrypted chunks are cached
+    """
+
+    def __init__(self, file, encryption_key, cache_chunks=default_cache_chunks):
+        """
+        :param file: Path or a readable and seekable binary file object with the container
+         (the container should end where the file ends)
+        :param encryption_key: Encryption key
+        :param cache_chunks: Amount of decrypted chunks to keep (0 disables the cache)
+        """
+        super().__init__()
+        self.cipher = LocSecCipher(encryption_key)
+        self.cache_chunks = cache_chunks
+        self._own_file = isinstance(file, (str, bytes, os.PathLike))
+        self.file = open(file, "rb") if self._own_file else file
+        self._cache = collections.OrderedDict()
+        self._position = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        try:
+            self._entries = self._read_index()
+        except BaseException:
+            if self._own_file:
+                self.file.close()
+            raise
+        self._data_offsets = [entry.data_offset for entry in self._entries]
+        last = self._entries[-1] if self._entries else None
+        self._size = last.data_offset + last.data_length if last else 0
+
+    def _read_index(self):
+        start = self.file.tell()
+        header = self.file.read(_container_header.size)
+        if len(header) < _container_header.size or \
+                _container_header.unpack(header)[:2] != (container_magic, container_version):
+            raise MalformedChunkException("Could not open container: not a LocSec container "
+                                          "(or unsupported container version).")
+        container_id = header[-16:]
+        end = self.file.seek(0, io.SEEK_END)
+        trailer_start = end - _trailer.size - len(container_magic)
+        if trailer_start < start + _container_header.size:
+            raise MalformedChunkException("Could not open container: container is truncated.")
+        self.file.seek(trailer_start)
+        trailer = self.file.read(_trailer.size + len(container_magic))
+        if trailer[_trailer.size:] != container_magic:
+            raise MalformedChunkException("Could not open container: trailer is missing (container was not closed?).")
+        index_offset, frames = _trailer.unpack_from(trailer)
+        if not start + _container_header.size <= index_offset <= trailer_start:
+            raise MalformedChunkException("Could not open container: bad index offset.")
+        if not frames:
+            raise MalformedChunkException("Could not open container: index is missing.")
+        self.file.seek(index_offset)
+        entries = []
+        for frame in range(frames):
+            frame_header = self.file.read(_index_frame.size)
+            (frame_length,) = _index_frame.unpack(frame_header) if len(frame_header) == _index_frame.size else (-1,)
+            if not 0 < frame_length <= chunk_length_max or self.file.tell() + frame_length > trailer_start:
+                raise MalformedChunkException("Could not open container: index is damaged.")
+            index = self.cipher._decrypt(memoryview(bytearray(self.file.read(frame_length))))[1]
+            if len(index) < _index_prefix.size or (len(index) - _index_prefix.size) % _index_entry.size:
+                raise MalformedChunkException("Could not open container: index is damaged.")
+            index_container_id, number, index_frames, entry_count, data_length = _index_prefix.unpack_from(index)
+            if index_container_id != container_id or number != frame or index_frames != frames:
+                raise MalformedChunkException("Could not open container: index doesn't match the container.")
+            entries.extend(IndexEntry(*fields)
+                           for fields in _index_entry.iter_unpack(memoryview(index)[_index_prefix.size:]))
+        data_offset = 0
+        for entry in entries:
+            if entry.data_offset != data_offset or not start <= entry.offset < entry.offset + entry.length \
+                    <= index_offset or entry.length > chunk_length_max:
+                raise MalformedChunkException("Could not open container: index is damaged.")
+            data_offset += entry.data_length
+        if len(entries) != entry_count or data_offset != data_length:
+            raise MalformedChunkException("Could not open container: index is truncated.")
+        return entries
+
+    @property
+    def size(self):
+        """Length of data in the container"""
+        return self._size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError("Bad whence: {}".format(whence))
+        if position < 0:
+            raise ValueError("Negative seek position {}".format(position))
+        self._position = position
+        return position
+
+    def readinto(self, buffer):
+        """
+        Reading data from the current position into a writable buffer
+        :return: Amount of data read (0 at the end of the container)
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed container.")
+        output = memoryview(buffer).cast("B")
+        written = 0
+        while written < len(output) and self._position < self._size:
+            index = bisect.bisect_right(self._data_offsets, self._position) - 1
+            data = self._chunk(index)
+            start = self._position - self._entries[index].data_offset
+            length = min(len(data) - start, len(output) - written)
+            output[written:written + length] = data[start:start + length]
+            written += length
+            self._position += length
+        return written
+
+    def _chunk(self, index):
+        data = self._cache.get(index)
+        if data is not None:
+            self._cache.move_to_end(index)
+            self.cache_hits += 1
+            return data
+        self.cache_misses += 1
+        entry = self._entries[index]
+        self.file.seek(entry.offset)
+        chunk = bytearray(self.file.read(entry.length))
+        if len(chunk) != entry.length or chunk[:_chunk_prefix_length] != entry.prefix:
+            raise MalformedChunkException("Could not read container: chunk {} doesn't match the index.", index)
+        data = self.cipher._decrypt(memoryview(chunk))[1]
+        if len(data) != entry.data_length:
+            raise MalformedChunkException("Could not read container: chunk {} doesn't match the index.", index)
+        if self.cache_chunks:
+            self._cache[index] = data
+            if len(self._cache) > self.cache_chunks:
+                self._cache.popitem(last=False)
+        return data
+
+    def close(self):
+        if not self.closed:
+            self._cache.clear()
+            if self._own_file:
+                self.file.close()
+        super().close()
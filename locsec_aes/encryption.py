@@ -14,24 +14,71 @@
 #  along with this program; if not, write to the Free Software
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import bisect
+import collections
+import functools
 import json
 import hashlib
+import logging
+import os
+import struct
 import traceback
 import sys
-from random import randbytes
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from hashlib import sha256
 from Cryptodome.Cipher import AES
+from Cryptodome.Util.strxor import strxor
 
-from locsec_aes.logger import get_logger
+from locsec_aes.logger import get_logger, log_limited
 
 logger = get_logger()
 
-from locsec_aes.EncryptionException import EncryptionException
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException, HashMismatchException, \
+    BadKeyException, OversizeException
+from locsec_aes import logger as logger_settings
+from locsec_aes import backends, codec, instrumentation, iv
+from locsec_aes import compression as compression_module
 
 encoding = "utf-8"
 
 '''
-LocSec AES encryption chunk:
+LocSec AES encryption chunk, version 2:
+
+         |______not encrypted_______|_____________________________encrypted_____________________________|
+
+ size       3      1      1     16          32           8      1      1       6        10485760 (10 MiB) (max)
+(bytes)  |=====|=======|=====|======|##############|########|######|######|#########|#######################|
+            ^      ^      ^     ^          ^             ^      ^      ^       ^                 ^
+          magic version flags   IV    sha256 of the    data   data   data   reserved    encrypted data + padding
+                                     rest of the chunk length  type  flags  (zeros)
+                                       (w/o padding)  (u64)               original
+                                                                            length
+                                                                         (compressed)
+
+With "gcm" mode (flags & 0x01) integrity is checked with AES-GCM authentication tag instead of sha256
+ (magic, version and flags are authenticated as associated data):
+
+ size       3      1      1      12           8      1      1       6        10485760 (10 MiB) (max)       16
+(bytes)  |=====|=======|=====|=======|########|######|######|#########|##############################|=========|
+            ^      ^      ^      ^        ^      ^      ^       ^                    ^                    ^
+          magic version flags  nonce    data   data   data   reserved     encrypted data + padding      GCM tag
+                                       length  type  flags  (zeros)
+
+With flags & 0x02 the header is followed by a 4-byte key ID (u32, see locsec_aes.keyring), which is
+ authenticated the same way as the rest of the header.
+
+Lower bits of data flags are the compression method of data (see locsec_aes.compression).
+ Compressed data has length of the original data instead of reserved zeros (u48).
+Next two bits of data flags are the padding policy the chunk was encrypted with (decryption doesn't need it,
+ padding is whatever follows the data).
+
+Encrypted part is padded according to the padding policy: to be 256-divisible by default, to a power of two,
+ to AES block size or to one of caller-defined bucket sizes. It's always AES-block aligned,
+ so the whole chunk never is (5 [+ 4] + 16 + 16 * n bytes or 5 [+ 4] + 12 + 16 * n + 16 bytes).
+ That's how it is told apart from version 1 chunks, which always are:
+
+LocSec AES encryption chunk, version 1 (only decrypted):
  
          |_not encrypted_|_________________________________________encrypted__________________________________________|
 
@@ -39,82 +86,946 @@ LocSec AES encryption chunk:
 (bytes)  |===============|######################|######################|##############################################|
                 ^                    ^                      ^                                  ^
           initial vector    sha256 of the data     length of encrypted                   encrypted data
-                                                      data (in bytes)
+                                                   data (in bytes, ascii)
                              
 '''
 
 supported_data_types = ["str", "int", "float", "list", "dict", "bytearray"]
 
+chunk_magic = b"LSA"
+chunk_version = 2
+chunk_header = struct.Struct(">3sBB")  # magic, version, flags
+data_meta = struct.Struct(">QBB6s")  # data length, data type, data flags, reserved
+chunk_header_length = chunk_header.size
+key_id_header = struct.Struct(">I")
+key_id_length = key_id_header.size
+key_id_flag = 0x02
 data_hash_header_length = 32
-data_length_header_length = 32
-encrypted_headers_length = data_hash_header_length + data_length_header_length
+data_meta_length = data_meta.size
+encrypted_headers_length = data_hash_header_length + data_meta_length
 initial_vector_length = 16
+gcm_nonce_length = 12
+gcm_tag_length = 16
+
+# Encryption modes
+modes = ("cbc", "gcm")
+default_mode = "cbc"
+initial_vector_lengths = {"cbc": initial_vector_length, "gcm": gcm_nonce_length}
+encrypted_headers_lengths = {"cbc": encrypted_headers_length, "gcm": data_meta_length}
+tag_lengths = {"cbc": 0, "gcm": gcm_tag_length}
+_mode_flags = {"cbc": 0x00, "gcm": 0x01}
+_flags_modes = {flags: mode for mode, flags in _mode_flags.items()}
+_mode_flags_mask = 0x01
 default_data_resolution = 256
+
+# Padding policies (how long the encrypted part of a chunk is for given data):
+#  "bucket256" - multiple of 256 bytes (hides data length best, default)
+#  "pow2" - power of two (overhead up to 2x, but only log2 of distinct chunk sizes)
+#  "block" - multiple of AES block size (minimal overhead, exposes data length to 16 bytes)
+#  a list of bucket sizes (multiples of 16) - the smallest bucket that fits, AES block aligned beyond the biggest one
+padding_policies = ("bucket256", "pow2", "block")
+default_padding = "bucket256"
+_padding_flags = {"bucket256": 0x00, "pow2": 0x04, "block": 0x08}
+_custom_padding_flags = 0x0c
+_flags_paddings = {flags: padding for padding, flags in _padding_flags.items()}
+padding_flags_mask = 0x0c
 data_size_max = 10485760  # 10 MiB
+# Data up to this size is copied and encrypted with one AES call instead of being encrypted in place
+small_data_length = 4096
 min_key_length = 8
 key_len = 512
 
+# CBC data of big chunks is decrypted in segments on a thread pool (AES releases the GIL).
+#  Workers should be set before the first big decryption (pool is created once)
+parallel_decrypt_threshold = 2097152  # 2 MiB
+parallel_decrypt_segment_min = 524288  # 512 KiB
+parallel_decrypt_workers = min(os.cpu_count() or 1, 8)
+_parallel_decrypt_pool = None
+_parallel_decrypt_lock = threading.Lock()
+
+# Version 1 chunks
+v1_data_length_header_length = 32
+v1_encrypted_headers_length = data_hash_header_length + v1_data_length_header_length
+
+_meta_reserved = bytes(6)
+_known_data_flags = compression_module.flags_mask | padding_flags_mask
+
+# Decrypted headers of a chunk:
+#  hashed_prefix is what goes to sha256 before the data, data_start is an offset of encrypted data in the chunk,
+#  original_length is length of data before compression (same as data_length if it's not compressed)
+ChunkHeaders = collections.namedtuple("ChunkHeaders", ["version", "mode", "data_hash", "data_length", "data_type",
+                                                       "data_flags", "data_start", "hashed_prefix",
+                                                       "original_length"])
+
+# What inspect_chunk tells about a chunk: data_length is length of decrypted data, stored_length is how much of it
+#  is in the chunk (less if compressed), compression is the method name, padding is the policy name ("custom" for
+#  bucket lists), key_id and data_hash are None if the chunk has none
+ChunkInfo = collections.namedtuple("ChunkInfo", ["version", "mode", "key_id", "data_length", "stored_length",
+                                                 "data_type", "compression", "padding", "data_hash"])
+
+# Chunks are verified in pieces of this size (without allocating a buffer for the whole data)
+verify_piece_length = 65536
+
 default_encoding = sys.getdefaultencoding()
 
 fe = traceback.format_exc
 
 
-def encrypt_data(data, encryption_key, initial_vector=None):
+class _ChainedCBC:
     """
-    Encrypting data. One of two main methods in LocSec.
-    :param data: Data to encrypt (preferably a bytearray)
-    :param encryption_key: Encryption key
-    :param initial_vector: IV for encryption. (Will be autogenerated if not specified)
-    :return: Encrypted LocSec chunk
+    Long-lived AES-CBC encryptor or decryptor for one key (AES key schedule is done only once).
+    CBC XORs every block with the previous ciphertext block, so a running cipher can be used with a new IV
+     by XORing the first block with (new IV ^ last ciphertext block): the result is the same as with a fresh cipher.
+    Not thread-safe, LocSecCipher keeps one per thread.
     """
-    try:
 
-        if len(encryption_key) < min_key_length or type(encryption_key) is not str:
-            raise EncryptionException("Bad encryption key:\n"
+    def __init__(self, backend, key_raw, decrypt):
+        self.chain = bytes(initial_vector_length)
+        self.aes = backend.cbc(key_raw, self.chain, decrypt)
+
+    def encrypt(self, initial_vector, parts, output):
+        """
+        :param initial_vector: IV for this piece of data (None to continue after the previous call)
+        :param parts: consecutive pieces of data to encrypt, each padded to AES block size.
+         If initial_vector is given, the first piece should be a bytearray (its first block is modified!)
+        :param output: writable buffer for encrypted data (exactly as long as all parts together)
+        """
+        if initial_vector is not None:
+            first = parts[0]
+            first[:AES.block_size] = strxor(strxor(first[:AES.block_size], initial_vector), self.chain)
+        position = 0
+        for part in parts:
+            if len(part):
+                self.aes.process(part, output[position:position + len(part)])
+                position += len(part)
+        self.chain = bytes(output[position - AES.block_size:position])
+
+    def decrypt(self, initial_vector, parts, outputs):
+        """
+        :param initial_vector: IV this piece of data was encrypted with (None to continue after the previous call)
+        :param parts: consecutive pieces of encrypted data, each padded to AES block size
+         (decryption may stop before the end of a chunk)
+        :param outputs: writable buffers for decrypted pieces (as long as parts)
+        """
+        previous_chain = self.chain
+        for part, output in zip(parts, outputs):
+            if len(part):
+                self.aes.process(part, output)
+                self.chain = part[-AES.block_size:]
+        self.chain = bytes(self.chain)
+        if initial_vector is not None:
+            first = outputs[0]
+            first[:AES.block_size] = strxor(strxor(first[:AES.block_size], initial_vector), previous_chain)
+
+
+class _GCM:
+    """
+    AES-GCM encryptor or decryptor for one chunk (same interface as _ChainedCBC).
+    Unencrypted chunk header is authenticated too (as associated data).
+    """
+
+    def __init__(self, backend, key_raw, nonce, header, decrypt):
+        self.aes = backend.gcm(key_raw, nonce, header, gcm_tag_length, decrypt)
+
+    def encrypt(self, initial_vector, parts, output):
+        position = 0
+        for part in parts:
+            if len(part):
+                self.aes.process(part, output[position:position + len(part)])
+                position += len(part)
+
+    def decrypt(self, initial_vector, parts, outputs):
+        for part, output in zip(parts, outputs):
+            if len(part):
+                self.aes.process(part, output)
+
+
+class LocSecCipher:
+    """
+    Encryption context bound to one encryption key.
+    The key is checked and derived once, so encrypting or decrypting many pieces of data with the same key
+     doesn't pay for key setup on every call. encrypt_data/decrypt_data are thin wrappers around it.
+    """
+
+    def __init__(self, encryption_key, mode=default_mode, typed=False, compression=None, compression_level=None,
+                 padding=default_padding, key_id=None, backend=None):
+        """
+        :param encryption_key: Encryption key
+        :param mode: Default encryption mode: "cbc" (AES-CBC + sha256) or "gcm" (AES-GCM, authenticated in one pass)
+        :param typed: Whether to encrypt data with its type by default (see locsec_aes.codec),
+         so that decrypt returns an object of the original type
+        :param compression: Default compression method for data before encryption: "zlib", "lzma", "bz2"
+         or None (no compression)
+        :param compression_level: Default compression level (default of the method if not specified)
+        :param padding: Default padding policy: "bucket256", "pow2", "block" or a list of bucket sizes
+         (see padding_policies)
+        :param key_id: ID of the key (u32) to write to unencrypted headers of chunks (not written if not specified)
+        :param backend: AES backend name (see locsec_aes.backends), picked automatically if not specified
+        """
+        if type(encryption_key) is not str or len(encryption_key) < min_key_length:
+            raise BadKeyException("Bad encryption key:\n"
                                       "Encryption key should be a string with no less than 8 characters.")
 
         # Encryption key should be padded to key_len (done by creating SHA256)
-        key_raw = _pad_enc_key(_byteify(encryption_key))
+        self.key_raw = _pad_enc_key(_byteify(encryption_key))
+        self.mode = _check_mode(mode)
+        self.typed = typed
+        self.compression = compression_module.check_method(compression)
+        self.compression_level = compression_level
+        self.padding = _check_padding(padding)
+        if key_id is not None and (type(key_id) is not int or not 0 <= key_id < 1 << 32):
+            raise BadKeyException("Bad key ID: should be an integer from 0 to {}.".format((1 << 32) - 1))
+        self.key_id = key_id
+        self.backend = backends.get_backend(backend)
+        self._local = threading.local()
 
-        # This is some magic used by AES256 to encrypt and decrypt (may not be secret or may be like a second password).
-        #  in our case it is not secret. This vector should be 16 bytes long
-        if initial_vector is None:
-            initial_vector = bytearray(randbytes(initial_vector_length))
-        aes = AES.new(key_raw, AES.MODE_CBC, initial_vector)
+    def __getstate__(self):
+        # AES objects can't be pickled (and shouldn't be shared anyway), they are recreated on first use
+        return {"key_raw": self.key_raw, "mode": self.mode, "typed": self.typed, "compression": self.compression,
+                "compression_level": self.compression_level, "padding": self.padding, "key_id": self.key_id,
+                "backend": self.backend.name}
+
+    def __setstate__(self, state):
+        self.key_raw = state["key_raw"]
+        self.mode = state["mode"]
+        self.typed = state["typed"]
+        self.compression = state["compression"]
+        self.compression_level = state["compression_level"]
+        self.padding = state["padding"]
+        self.key_id = state["key_id"]
+        self.backend = backends.get_backend(state["backend"])
+        self._local = threading.local()
+
+    def _encryptor(self):
+        encryptor = getattr(self._local, "encryptor", None)
+        if encryptor is None:
+            encryptor = self._local.encryptor = _ChainedCBC(self.backend, self.key_raw, False)
+        return encryptor
 
-        # This step takes whatever type input data is and converts it to bytearray
-        data_byteified = _byteify(data)
+    def _decryptor(self):
+        decryptor = getattr(self._local, "decryptor", None)
+        if decryptor is None:
+            decryptor = self._local.decryptor = _ChainedCBC(self.backend, self.key_raw, True)
+        return decryptor
+
+    @instrumentation.measured("encrypt")
+    def encrypt(self, data, initial_vector=None, mode=None, typed=None, compression=None, compression_level=None,
+                padding=None):
+        """
+        Encrypting data
+        :param data: Data to encrypt (preferably a bytearray)
+        :param initial_vector: IV (nonce for GCM) for encryption. (Will be autogenerated if not specified)
+        :param mode: Encryption mode ("cbc" or "gcm", default mode of the cipher if not specified)
+        :param typed: Whether to encrypt data with its type (default of the cipher if not specified)
+        :param compression: Compression method ("zlib", "lzma", "bz2" or False for no compression,
+         default of the cipher if not specified)
+        :param compression_level: Compression level (default of the cipher if not specified)
+        :param padding: Padding policy (default of the cipher if not specified)
+        :return: Encrypted LocSec chunk
+        """
+        if typed or typed is None and self.typed:
+            # Encoding data with the codec of its type, type tag goes to the chunk headers
+            data_type, data_encoded = codec.encode(data)
+            data_byteified = _buffer_view(data_encoded)
+        else:
+            # This step takes whatever type input data is and converts it to bytearray (binary data is used as is)
+            data_type = codec.untyped
+            data_byteified = _buffer_view(data) if isinstance(data, (bytes, memoryview)) else _byteify(data)
+        if instrumentation.enabled:
+            instrumentation.lap("encode")
+        if len(data_byteified) > data_size_max:
+            raise OversizeException("Data exceeded maximum size. Max supported data size is {} bytes.", data_size_max)
+        mode = self.mode if mode is None else _check_mode(mode)
+        padding = self.padding if padding is None else _check_padding(padding)
+        data_flags = 0
+        original_length = len(data_byteified)
+        method = self.compression if compression is None else compression_module.check_method(compression or None)
+        if method is not None:
+            if compression_level is None:
+                compression_level = self.compression_level
+            data_flags, data_compressed = compression_module.compress(data_byteified, method, compression_level)
+            if data_flags:
+                data_byteified = _buffer_view(data_compressed)
+            if instrumentation.enabled:
+                instrumentation.lap("compress")
+        encrypted_data = bytearray(_chunk_length(len(data_byteified), mode, padding, self.key_id is not None))
+        self._encrypt_into(data_byteified, encrypted_data, initial_vector, mode, padding, data_type, data_flags,
+                           original_length)
+        return encrypted_data
+
+    @instrumentation.measured("encrypt")
+    def encrypt_into(self, data, output, initial_vector=None, mode=None, padding=None):
+        """
+        Encrypting data straight into a preallocated buffer (without intermediate copies of the data)
+        :param data: Data to encrypt (bytes, bytearray, memoryview, mmap or any other object supporting buffer protocol)
+        :param output: Writable buffer for the LocSec chunk,
+         at least encrypted_size(len(data), mode, padding, self.key_id is not None) bytes long
+        :param initial_vector: IV (nonce for GCM) for encryption. (Will be autogenerated if not specified)
+        :param mode: Encryption mode ("cbc" or "gcm", default mode of the cipher if not specified)
+        :param padding: Padding policy (default of the cipher if not specified)
+        :return: Length of the LocSec chunk written to output
+        """
+        mode = self.mode if mode is None else _check_mode(mode)
+        padding = self.padding if padding is None else _check_padding(padding)
+        return self._encrypt_into(data, output, initial_vector, mode, padding, codec.untyped)
+
+    def _encrypt_into(self, data, output, initial_vector, mode, padding, data_type, data_flags=0,
+                      original_length=None):
+        data_view = _buffer_view(data)
+        output_view = _buffer_view(output)
 
         # Taking data length and writing it to be encrypted (so that it's easier to depad later)
-        data_length = len(data_byteified)
+        data_length = len(data_view)
         if data_length > data_size_max:
-            raise EncryptionException(
-                "Data exceeded maximum size. Max supported data size is {} bytes.".format(data_size_max))
-        data_length_raw = _pad_data(_byteify(data_length, True), data_length_header_length)
-
-        # Adding (and padding) data type
-        data_raw = bytearray(_sha(data_byteified))
-        # Adding data length
-        data_raw.extend(data_length_raw)
-        # Adding the data itself
-        data_raw.extend(data_byteified)
-
-        # Data to encrypt should be padded too (as AES encrypts by 16-byte chunks)
-        #  Data resolution is dynamically calculated to make data 256-divisible (which will make it harder to guess
-        #  the size of initial data.
-        data_resolution = default_data_resolution
-        while data_resolution < data_length + initial_vector_length + encrypted_headers_length:
-            data_resolution += default_data_resolution
-        # -16 is to account for additional data in each encrypted chunk
-        data_padded = _pad_data(data_raw, data_resolution - initial_vector_length)
-
-        # Writing the vector we used above to encrypted data, so that we can decrypt it later
-        encrypted_data = initial_vector
-        encrypted_data.extend(bytearray(aes.encrypt(data_padded)))
-        return encrypted_data
-    except Exception:
-        logger.exception("Error while encrypting data.")
-        raise EncryptionException("Error while encrypting. Check logs")
+            raise OversizeException("Data exceeded maximum size. Max supported data size is {} bytes.", data_size_max)
+        chunk_length = _chunk_length(data_length, mode, padding, self.key_id is not None)
+        if output_view.readonly or len(output_view) < chunk_length:
+            raise EncryptionException("Could not encrypt data: output should be a writable buffer of at least {} bytes."
+                                      .format(chunk_length))
+
+        # This is some magic used by AES256 to encrypt and decrypt (may not be secret or may be like a second password).
+        #  in our case it is not secret. GCM nonce must never repeat for a key though, so IVs come from a CSPRNG
+        #  (buffered, see locsec_aes.iv)
+        vector_length = initial_vector_lengths[mode]
+        if initial_vector is None:
+            initial_vector = iv.new_iv(vector_length)
+        elif len(initial_vector) != vector_length:
+            raise EncryptionException("Bad initial vector: should be {} bytes long.".format(vector_length))
+
+        if self.key_id is None:
+            header = chunk_header.pack(chunk_magic, chunk_version, _mode_flags[mode])
+        else:
+            header = chunk_header.pack(chunk_magic, chunk_version, _mode_flags[mode] | key_id_flag) + \
+                key_id_header.pack(self.key_id)
+        header_length = len(header)
+        reserved = original_length.to_bytes(6, "big") if data_flags & compression_module.flags_mask else _meta_reserved
+        data_flags |= _padding_flags.get(padding, _custom_padding_flags)
+        meta = data_meta.pack(data_length, data_type, data_flags, reserved)
+        encrypted_start = header_length + vector_length
+        encrypted_end = chunk_length - tag_lengths[mode]
+        padding_length = encrypted_end - encrypted_start - encrypted_headers_lengths[mode] - data_length
+        if mode == "gcm":
+            # Headers: data meta (integrity is checked with GCM tag)
+            encryptor = _GCM(self.backend, self.key_raw, initial_vector, header, False)
+            headers = bytearray(meta)
+        else:
+            # Headers: hash of the whole chunk (except for padding) and data meta
+            encryptor = self._encryptor()
+            headers = bytearray(_sha(data_view, header + meta))
+            headers.extend(meta)
+            if instrumentation.enabled:
+                instrumentation.lap("hash")
+
+        # Writing the vector we used above to the chunk, so that we can decrypt it later
+        output_view[:header_length] = header
+        output_view[header_length:encrypted_start] = initial_vector
+        parts = _chunk_parts(headers, data_view, padding_length)
+        if instrumentation.enabled:
+            instrumentation.lap("pad")
+        encryptor.encrypt(initial_vector, parts, output_view[encrypted_start:encrypted_end])
+        if mode == "gcm":
+            output_view[encrypted_end:chunk_length] = encryptor.aes.tag()
+        if instrumentation.enabled:
+            instrumentation.lap("aes")
+            instrumentation.count(chunk_length)
+        return chunk_length
+
+    def _decrypt(self, data_view, output_view=None, verify=True, decompress=True):
+        """
+        Decrypting a LocSec chunk of any version
+        :param data_view: LocSec chunk (as a memoryview)
+        :param output_view: Writable memoryview for decrypted data (allocated if not specified)
+        :param verify: Whether to check data integrity (hash or GCM tag)
+        :param decompress: Whether to decompress compressed data (otherwise it's returned as stored in the chunk)
+        :return: ChunkHeaders and decrypted data (output_view or a new bytearray)
+        """
+        version, mode, header_length = _chunk_version(data_view)
+        output_given = output_view is not None
+        encrypted_start = header_length + initial_vector_lengths[mode]
+        encrypted_end = len(data_view) - tag_lengths[mode]
+        headers_length = encrypted_headers_lengths[mode] if version == chunk_version else v1_encrypted_headers_length
+        if encrypted_end - encrypted_start < headers_length or (encrypted_end - encrypted_start) % AES.block_size:
+            raise MalformedChunkException("Could not decrypt data: data is not a LocSec chunk (bad length).")
+        initial_vector = data_view[header_length:encrypted_start]
+        if mode == "gcm":
+            decryptor = _GCM(self.backend, self.key_raw, initial_vector, data_view[:header_length], True)
+        else:
+            decryptor = self._decryptor()
+
+        sha_obj = None
+        if output_view is None and len(data_view) <= small_data_length:
+            # Small chunk: decrypting it whole with one AES call
+            decrypted_data = bytearray(encrypted_end - encrypted_start)
+            decryptor.decrypt(initial_vector, (data_view[encrypted_start:encrypted_end],), (decrypted_data,))
+            if instrumentation.enabled:
+                instrumentation.lap("aes")
+            headers = _parse_headers(version, mode, data_view[:header_length], decrypted_data, len(data_view))
+            del decrypted_data[:headers_length]
+            del decrypted_data[headers.data_length:]
+            if instrumentation.enabled:
+                instrumentation.lap("headers")
+        else:
+            # Decrypting headers first, then only as many blocks as needed for the data
+            headers_raw = bytearray(headers_length)
+            decryptor.decrypt(initial_vector, (data_view[encrypted_start:encrypted_start + headers_length],),
+                              (headers_raw,))
+            headers = _parse_headers(version, mode, data_view[:header_length], headers_raw, len(data_view))
+            if instrumentation.enabled:
+                instrumentation.lap("headers")
+            if output_view is None:
+                decrypted_data = bytearray(headers.data_length)
+                output_view = memoryview(decrypted_data)
+            elif output_view.readonly or len(output_view) < headers.original_length:
+                raise EncryptionException("Could not decrypt data: output should be a writable buffer of at least {}"
+                                          " bytes.".format(headers.original_length))
+            else:
+                decrypted_data = output_view
+            if mode == "gcm":
+                # GCM tag covers padding too
+                data_end = headers.data_start + headers.data_length
+                decryptor.decrypt(None, (data_view[headers.data_start:data_end], data_view[data_end:encrypted_end]),
+                                  (output_view[:headers.data_length], bytearray(encrypted_end - data_end)))
+            else:
+                # Data is hashed while it is being decrypted
+                sha_obj = sha256(headers.hashed_prefix) if verify else None
+                self._decrypt_data(data_view, headers, output_view, sha_obj)
+            if instrumentation.enabled:
+                instrumentation.lap("aes")
+
+        if verify:
+            if mode == "gcm":
+                try:
+                    decryptor.aes.verify(data_view[encrypted_end:])
+                except ValueError:
+                    raise HashMismatchException("Data authentication failed: GCM tag mismatch.")
+                if instrumentation.enabled:
+                    instrumentation.lap("verify")
+            else:
+                if sha_obj is None:
+                    sha_obj = sha256(headers.hashed_prefix)
+                    sha_obj.update(memoryview(decrypted_data)[:headers.data_length])
+                decrypted_data_hash = sha_obj.digest()
+                if not decrypted_data_hash == headers.data_hash:
+                    raise HashMismatchException("Data hash mismatch:\nExpected: {}\nActual:   {}",
+                                                headers.data_hash.hex(), decrypted_data_hash.hex())
+                if instrumentation.enabled:
+                    instrumentation.lap("hash")
+        if decompress and headers.data_flags & compression_module.flags_mask:
+            data_decompressed = compression_module.decompress(
+                headers.data_flags, memoryview(decrypted_data)[:headers.data_length], headers.original_length)
+            if output_given:
+                output_view[:headers.original_length] = data_decompressed
+            else:
+                decrypted_data = bytearray(data_decompressed)
+            if instrumentation.enabled:
+                instrumentation.lap("decompress")
+                instrumentation.count(headers.original_length)
+        elif instrumentation.enabled:
+            instrumentation.count(headers.data_length)
+        return headers, decrypted_data
+
+    def _decrypt_data(self, data_view, headers, output_view, sha_obj=None):
+        """
+        Decrypting data of a CBC LocSec chunk right after its headers (padding is not decrypted at all)
+        :param data_view: LocSec chunk (as a memoryview)
+        :param headers: ChunkHeaders
+        :param output_view: Writable memoryview, at least data_length bytes long
+        :param sha_obj: sha256 object to update with decrypted data (if needed)
+        """
+        data_length = headers.data_length
+        data_aligned_length = data_length - data_length % AES.block_size
+        tail_length = data_length - data_aligned_length
+        tail = bytearray(AES.block_size if tail_length else 0)
+        tail_start = headers.data_start + data_aligned_length
+        segments = _parallel_decrypt_segments(data_aligned_length)
+        if segments:
+            self._decrypt_data_parallel(data_view[headers.data_start - AES.block_size:tail_start], segments,
+                                        output_view[:data_aligned_length], sha_obj)
+            if tail_length:
+                # Chained decryptor is still right after headers, the tail block gets its previous block as IV
+                self._decryptor().decrypt(data_view[tail_start - AES.block_size:tail_start],
+                                          (data_view[tail_start:tail_start + AES.block_size],), (tail,))
+        else:
+            self._decryptor().decrypt(None, (data_view[headers.data_start:tail_start],
+                                             data_view[tail_start:tail_start + len(tail)]),
+                                      (output_view[:data_aligned_length], tail))
+            if sha_obj is not None:
+                sha_obj.update(output_view[:data_aligned_length])
+        output_view[data_aligned_length:data_length] = tail[:tail_length]
+        if sha_obj is not None:
+            sha_obj.update(output_view[data_aligned_length:data_length])
+
+    def _decrypt_data_parallel(self, data_view, segments, output_view, sha_obj):
+        """
+        Decrypting AES-CBC data in segments on a thread pool.
+        Every CBC block depends only on the previous ciphertext block, so every segment is decrypted separately
+         with the ciphertext block before it as IV. Hashing can't be split (sha256 is sequential), so segments are
+         hashed in order while the next ones are still being decrypted.
+        :param data_view: Encrypted data with one block before it
+        :param segments: Lengths of segments (AES-block aligned)
+        :param output_view: Writable memoryview for decrypted data
+        :param sha_obj: sha256 object to update with decrypted data (if needed)
+        """
+        executor = _parallel_decrypt_executor()
+        futures = []
+        position = 0
+        for segment_length in segments:
+            futures.append(executor.submit(_decrypt_cbc_segment, self.backend, self.key_raw,
+                                           data_view[position:position + 16],
+                                           data_view[position + 16:position + 16 + segment_length],
+                                           output_view[position:position + segment_length]))
+            position += segment_length
+        try:
+            position = 0
+            for future, segment_length in zip(futures, segments):
+                future.result()
+                if sha_obj is not None:
+                    sha_obj.update(output_view[position:position + segment_length])
+                position += segment_length
+        finally:
+            # Output buffer should not be touched after returning (or raising)
+            wait(futures)
+
+    def _decrypt_headers(self, data_view):
+        """
+        Decrypting only the headers of a LocSec chunk (without integrity check)
+        :param data_view: LocSec chunk (as a memoryview)
+        :return: ChunkHeaders
+        """
+        version, mode, header_length = _chunk_version(data_view)
+        encrypted_start = header_length + initial_vector_lengths[mode]
+        encrypted_end = len(data_view) - tag_lengths[mode]
+        headers_length = encrypted_headers_lengths[mode] if version == chunk_version else v1_encrypted_headers_length
+        if encrypted_end - encrypted_start < headers_length or (encrypted_end - encrypted_start) % AES.block_size:
+            raise MalformedChunkException("Could not decrypt data: data is not a LocSec chunk (bad length).")
+        initial_vector = data_view[header_length:encrypted_start]
+        headers_raw = bytearray(headers_length)
+        if mode == "gcm":
+            # GCM encrypts data with AES-CTR starting from counter 2 (for 12-byte nonces)
+            self.backend.ctr(self.key_raw, initial_vector, 2) \
+                .process(data_view[encrypted_start:encrypted_start + headers_length], headers_raw)
+        else:
+            self._decryptor().decrypt(initial_vector, (data_view[encrypted_start:encrypted_start + headers_length],),
+                                      (headers_raw,))
+        return _parse_headers(version, mode, data_view[:header_length], headers_raw, len(data_view))
+
+    def decrypted_size(self, data_to_dec):
+        """
+        Getting length of data in a LocSec chunk (only its headers are decrypted)
+        :param data_to_dec: LocSec chunk (any object supporting buffer protocol)
+        :return: Length of decrypted data (in bytes)
+        """
+        return self._decrypt_headers(_buffer_view(data_to_dec)).original_length
+
+    def inspect(self, data_to_inspect):
+        """
+        Getting information about a LocSec chunk (only its headers are decrypted, without integrity check)
+        :param data_to_inspect: LocSec chunk (any object supporting buffer protocol)
+        :return: ChunkInfo
+        """
+        data_view = _buffer_view(data_to_inspect)
+        headers = self._decrypt_headers(data_view)
+        return ChunkInfo(headers.version, headers.mode, chunk_key_id(data_view), headers.original_length,
+                         headers.data_length, headers.data_type, compression_module.flags_method(headers.data_flags),
+                         _flags_paddings.get(headers.data_flags & padding_flags_mask, "custom"), headers.data_hash)
+
+    def verify(self, data_to_verify):
+        """
+        Checking integrity of a LocSec chunk without building its data: data is decrypted and hashed
+         (or authenticated) piece by piece. Foreign or malformed chunks are rejected after decrypting their headers
+        :param data_to_verify: LocSec chunk (any object supporting buffer protocol)
+        :return: Whether the chunk is intact and encrypted with this key
+        """
+        try:
+            self._verify(_buffer_view(data_to_verify))
+        except EncryptionException as e:
+            logger.debug("Chunk verification failed: %s", e)
+            return False
+        return True
+
+    def _verify(self, data_view):
+        version, mode, header_length = _chunk_version(data_view)
+        encrypted_start = header_length + initial_vector_lengths[mode]
+        encrypted_end = len(data_view) - tag_lengths[mode]
+        headers = self._decrypt_headers(data_view)
+        piece = memoryview(bytearray(min(verify_piece_length, encrypted_end - headers.data_start)))
+        if mode == "gcm":
+            # GCM tag covers the whole encrypted part (headers and padding too)
+            decryptor = _GCM(self.backend, self.key_raw, data_view[header_length:encrypted_start],
+                             data_view[:header_length], True)
+            decryptor.decrypt(None, (data_view[encrypted_start:headers.data_start],),
+                              (bytearray(headers.data_start - encrypted_start),))
+            for position in range(headers.data_start, encrypted_end, verify_piece_length):
+                piece_end = min(position + verify_piece_length, encrypted_end)
+                decryptor.decrypt(None, (data_view[position:piece_end],), (piece[:piece_end - position],))
+            try:
+                decryptor.aes.verify(data_view[encrypted_end:])
+            except ValueError:
+                raise HashMismatchException("Data authentication failed: GCM tag mismatch.")
+        else:
+            # Chained decryptor is right after the headers, padding doesn't need to be decrypted
+            decryptor = self._decryptor()
+            sha_obj = sha256(headers.hashed_prefix)
+            data_end = headers.data_start + headers.data_length
+            blocks_end = data_end + -headers.data_length % AES.block_size
+            for position in range(headers.data_start, blocks_end, verify_piece_length):
+                piece_end = min(position + verify_piece_length, blocks_end)
+                decryptor.decrypt(None, (data_view[position:piece_end],), (piece[:piece_end - position],))
+                sha_obj.update(piece[:min(piece_end, data_end) - position])
+            if sha_obj.digest() != headers.data_hash:
+                raise HashMismatchException("Data hash mismatch.")
+
+    @instrumentation.measured("decrypt")
+    def decrypt_into(self, data_to_dec, output):
+        """
+        Decrypting a LocSec chunk straight into a preallocated buffer (without intermediate copies of the data)
+        :param data_to_dec: LocSec chunk (bytes, bytearray, memoryview, mmap or any other object supporting buffer protocol)
+        :param output: Writable buffer for decrypted data, at least decrypted_size(data_to_dec) bytes long
+        :return: Length of decrypted data written to output
+        """
+        headers, _ = self._decrypt(_buffer_view(data_to_dec), _buffer_view(output))
+        return headers.original_length
+
+    def decrypt_raw(self, data_to_dec):
+        """
+        :param data_to_dec: Data to decrypt (preferably a bytearray)
+        :return: raw decrypted data (just a full decrypted encrypted part of a LocSec chunk, without integrity check)
+        """
+        data_view = _buffer_view(_byteify(data_to_dec, True) if isinstance(data_to_dec, str) else data_to_dec)
+        if len(data_view) == 0:
+            return bytearray()
+        version, mode, header_length = _chunk_version(data_view)
+        encrypted_start = header_length + initial_vector_lengths[mode]
+        encrypted_end = len(data_view) - tag_lengths[mode]
+        if encrypted_end <= encrypted_start or (encrypted_end - encrypted_start) % AES.block_size:
+            raise MalformedChunkException("Could not decrypt data: data is not a LocSec chunk (bad length).")
+        initial_vector = data_view[header_length:encrypted_start]
+        if mode == "gcm":
+            decryptor = _GCM(self.backend, self.key_raw, initial_vector, data_view[:header_length], True)
+        else:
+            decryptor = self._decryptor()
+        decrypted_data = bytearray(encrypted_end - encrypted_start)
+        decryptor.decrypt(initial_vector, (data_view[encrypted_start:encrypted_end],), (decrypted_data,))
+        return decrypted_data
+
+    def decrypt_wo_verification(self, data_to_dec):
+        """
+        :param data_to_dec: Data to decrypt (preferably a bytearray)
+        :return: data hash from the chunk headers (None for GCM chunks)
+         and raw decrypted data (without integrity verification)
+        """
+        data_view = _buffer_view(_byteify(data_to_dec, True) if isinstance(data_to_dec, str) else data_to_dec)
+        headers, decrypted_data_raw = self._decrypt(data_view, verify=False)
+        return headers.data_hash, decrypted_data_raw
+
+    @instrumentation.measured("decrypt")
+    def decrypt(self, data_to_dec, return_raw=False):
+        """
+        Decrypting data (of any mode, it is taken from the chunk)
+        :param data_to_dec: Data to decrypt
+        :param return_raw: Whether to return raw (bytearray) data or stringified (or decoded, if it was typed)
+        :return: decrypted data (raw, stringified or an object of the original type)
+        """
+        if type(data_to_dec) is not bytearray:
+            log_limited(logger, logging.WARNING, "%s: Data to decrypt is not bytearray. Will try to byteify,"
+                        " but please pass data as raw bytearray. You passed data as a \"%s\"",
+                        __file__, data_to_dec.__class__.__name__)
+            if instrumentation.enabled:
+                instrumentation.lap("log")
+        data_view = _buffer_view(_byteify(data_to_dec, True) if isinstance(data_to_dec, str) else data_to_dec)
+        headers, decrypted_data_raw = self._decrypt(data_view)
+        if return_raw:
+            return decrypted_data_raw
+        elif headers.data_type != codec.untyped:
+            decrypted_data_prepared = codec.decode(headers.data_type, decrypted_data_raw)
+        else:
+            decrypted_data_prepared = bytes(decrypted_data_raw).decode(encoding=encoding)
+        if instrumentation.enabled:
+            instrumentation.lap("decode")
+        return decrypted_data_prepared
+
+
+def _parallel_decrypt_segments(data_length):
+    """
+    Splitting CBC data for parallel decryption
+    :param data_length: Length of data (AES-block aligned)
+    :return: Lengths of segments (or None if data should be decrypted in one go)
+    """
+    if data_length < parallel_decrypt_threshold or parallel_decrypt_workers < 2:
+        return None
+    segment_count = min(parallel_decrypt_workers, data_length // parallel_decrypt_segment_min)
+    if segment_count < 2:
+        return None
+    blocks = data_length // AES.block_size
+    return [(blocks // segment_count + (1 if i < blocks % segment_count else 0)) * AES.block_size
+            for i in range(segment_count)]
+
+
+def _decrypt_cbc_segment(backend, key_raw, initial_vector, data, output):
+    backend.cbc(key_raw, initial_vector, True).process(data, output)
+
+
+def _parallel_decrypt_executor():
+    global _parallel_decrypt_pool
+    with _parallel_decrypt_lock:
+        if _parallel_decrypt_pool is None:
+            _parallel_decrypt_pool = ThreadPoolExecutor(max_workers=parallel_decrypt_workers,
+                                                        thread_name_prefix="LocSec-AES-decrypt")
+        return _parallel_decrypt_pool
+
+
+def _parallel_decrypt_after_fork():
+    # Threads of the pool don't exist in a forked child (work queued there would never run)
+    global _parallel_decrypt_pool, _parallel_decrypt_lock
+    _parallel_decrypt_pool = None
+    _parallel_decrypt_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_parallel_decrypt_after_fork)
+
+
+def _check_mode(mode):
+    if mode not in modes:
+        raise EncryptionException("Unknown encryption mode: \"{}\". Supported modes are: {}."
+                                  .format(mode, ", ".join(modes)))
+    return mode
+
+
+def _chunk_parts(headers, data_view, padding_length):
+    """
+    Splitting the part of a chunk to encrypt into consecutive pieces (AES blocks of big data are not copied)
+    :param headers: Encrypted headers (bytearray, modified!)
+    :param data_view: Data to encrypt (as a memoryview)
+    :param padding_length: Length of padding after data
+    :return: tuple of pieces
+    """
+    # Whole AES blocks of big data are encrypted right from the input, the rest of it goes to the last block
+    #  together with padding (small data is just copied, one AES call is cheaper than three).
+    data_length = len(data_view)
+    if data_length <= small_data_length:
+        headers.extend(data_view)
+        headers.extend(bytes(padding_length))
+        return headers,
+    data_aligned_length = data_length - data_length % AES.block_size
+    tail = bytearray(data_view[data_aligned_length:])
+    tail.extend(bytes(padding_length))
+    return headers, data_view[:data_aligned_length], tail
+
+
+def _chunk_version(data_view):
+    """
+    Detecting LocSec chunk version and encryption mode
+    :param data_view: LocSec chunk (as a memoryview)
+    :return: chunk version, encryption mode and length of its unencrypted header (before IV)
+    """
+    # Version 1 chunks are always AES-block aligned and have no header, version 2 chunks never are
+    if len(data_view) % AES.block_size == 0:
+        return 1, "cbc", 0
+    if len(data_view) < chunk_header_length:
+        raise MalformedChunkException("Could not decrypt data: data is not a LocSec chunk (bad length).")
+    magic, version, flags = chunk_header.unpack_from(data_view)
+    if magic != chunk_magic:
+        raise MalformedChunkException("Could not decrypt data: data is not a LocSec chunk (bad magic).")
+    if version != chunk_version or flags & ~(_mode_flags_mask | key_id_flag):
+        raise MalformedChunkException("Could not decrypt data: unsupported LocSec chunk version ({}) or flags ({}).",
+                                      version, flags)
+    return version, _flags_modes[flags & _mode_flags_mask], \
+        chunk_header_length + key_id_length if flags & key_id_flag else chunk_header_length
+
+
+def chunk_key_id(data):
+    """
+    Getting ID of the key a LocSec chunk was encrypted with (nothing is decrypted)
+    :param data: LocSec chunk (any object supporting buffer protocol)
+    :return: Key ID or None if the chunk has no key ID
+    """
+    data_view = _buffer_view(data)
+    if len(data_view) % AES.block_size == 0 or len(data_view) < chunk_header_length + key_id_length:
+        return None
+    magic, version, flags = chunk_header.unpack_from(data_view)
+    if magic != chunk_magic or not flags & key_id_flag:
+        return None
+    return key_id_header.unpack_from(data_view, chunk_header_length)[0]
+
+
+def _parse_headers(version, mode, header, headers_raw, chunk_length):
+    """
+    Parsing decrypted headers of a LocSec chunk
+    :param version: Chunk version
+    :param mode: Encryption mode
+    :param header: Unencrypted header of the chunk
+    :param headers_raw: Decrypted headers (or the whole decrypted part of the chunk)
+    :param chunk_length: Length of the whole LocSec chunk
+    :return: ChunkHeaders
+    """
+    if version == chunk_version:
+        data_hash = bytes(headers_raw[:data_hash_header_length]) if mode == "cbc" else None
+        meta_start = encrypted_headers_lengths[mode] - data_meta_length
+        data_length, data_type, data_flags, reserved = data_meta.unpack_from(headers_raw, meta_start)
+        # Reserved bytes are zeros (or a sane original length), with a wrong key they are not (most probably)
+        if data_flags & compression_module.flags_mask:
+            original_length = int.from_bytes(reserved, "big")
+            bad_meta = data_flags & ~_known_data_flags or not 0 < original_length <= data_size_max
+        else:
+            original_length = data_length
+            bad_meta = reserved != _meta_reserved or data_flags & ~_known_data_flags
+        data_start = len(header) + initial_vector_lengths[mode] + encrypted_headers_lengths[mode]
+        hashed_prefix = bytes(header) + bytes(headers_raw[meta_start:meta_start + data_meta_length])
+    else:
+        data_hash = bytes(headers_raw[:data_hash_header_length])
+        try:
+            data_length = int(_depad_data(headers_raw[data_hash_header_length:v1_encrypted_headers_length]))
+        except ValueError:
+            data_length = -1
+        data_type, data_flags, bad_meta = 0, 0, False
+        original_length = data_length
+        data_start = initial_vector_length + v1_encrypted_headers_length
+        hashed_prefix = b""
+    if bad_meta or not 0 <= data_length <= chunk_length - tag_lengths[mode] - data_start:
+        raise BadKeyException("Could not decrypt data: bad encryption key or data is not a LocSec chunk.")
+    return ChunkHeaders(version, mode, data_hash, data_length, data_type, data_flags, data_start, hashed_prefix,
+                        original_length)
+
+
+def _check_padding(padding):
+    """
+    :param padding: Padding policy name or a list of bucket sizes
+    :return: padding policy name or a sorted tuple of bucket sizes
+    """
+    if isinstance(padding, str):
+        if padding not in _padding_flags:
+            raise EncryptionException("Unknown padding policy: \"{}\". Supported policies: {} or a list of bucket sizes"
+                                      .format(padding, ", ".join(padding_policies)))
+        return padding
+    try:
+        buckets = tuple(sorted(padding))
+    except TypeError:
+        raise EncryptionException("Bad padding policy: should be a policy name or a list of bucket sizes.")
+    if not buckets or any(type(bucket) is not int or bucket <= 0 or bucket % AES.block_size or
+                          bucket > padded_length_max for bucket in buckets):
+        raise EncryptionException("Bad padding buckets: should be multiples of {} up to {} bytes."
+                                  .format(AES.block_size, padded_length_max))
+    return buckets
+
+
+def _padded_length(length, padding):
+    """
+    Getting length of the encrypted part of a chunk
+    :param length: Length of encrypted headers and data
+    :param padding: Padding policy (checked)
+    :return: Padded length (AES-block aligned)
+    """
+    if padding == "bucket256":
+        return -(-length // default_data_resolution) * default_data_resolution
+    if padding == "block":
+        return -(-length // AES.block_size) * AES.block_size
+    if padding == "pow2":
+        return 1 << max(length - 1, AES.block_size - 1).bit_length()
+    index = bisect.bisect_left(padding, length)
+    if index < len(padding):
+        return padding[index]
+    return -(-length // AES.block_size) * AES.block_size
+
+
+# No padding policy makes the encrypted part of a chunk longer than this (pow2 of the biggest data)
+padded_length_max = _padded_length(encrypted_headers_length + data_size_max, "pow2")
+
+
+def encrypted_size(data_length, mode=default_mode, padding=default_padding, with_key_id=False):
+    """
+    Getting exact length of a LocSec chunk for data of given length
+    :param data_length: Length of data to encrypt (in bytes)
+    :param mode: Encryption mode ("cbc" or "gcm")
+    :param padding: Padding policy ("bucket256", "pow2", "block" or a list of bucket sizes)
+    :param with_key_id: Whether the chunk has a key ID in its header
+    :return: Length of the LocSec chunk (in bytes)
+    """
+    return _chunk_length(data_length, _check_mode(mode), _check_padding(padding), with_key_id)
+
+
+def _chunk_length(data_length, mode, padding, with_key_id):
+    """
+    encrypted_size for a checked mode and padding policy (see _check_mode, _check_padding)
+    """
+    header_length = chunk_header_length + key_id_length if with_key_id else chunk_header_length
+    return header_length + initial_vector_lengths[mode] + tag_lengths[mode] + \
+        _padded_length(encrypted_headers_lengths[mode] + data_length, padding)
+
+
+# Biggest LocSec chunk (with any mode and padding policy)
+chunk_length_max = chunk_header_length + key_id_length + padded_length_max + \
+    max(initial_vector_lengths[mode] + tag_lengths[mode] for mode in modes)
+
+
+@functools.lru_cache(maxsize=16)
+def _cipher_for_key(encryption_key):
+    # Module-level functions are usually called with the same few keys, no need to derive them every time
+    return LocSecCipher(encryption_key)
+
+
+@instrumentation.measured("encrypt")
+def encrypt_data(data, encryption_key, initial_vector=None, mode=default_mode, typed=False, compression=None,
+                 compression_level=None, padding=default_padding):
+    """
+    Encrypting data. One of two main methods in LocSec.
+    :param data: Data to encrypt (preferably a bytearray)
+    :param encryption_key: Encryption key
+    :param initial_vector: IV (nonce for GCM) for encryption. (Will be autogenerated if not specified)
+    :param mode: Encryption mode: "cbc" (AES-CBC + sha256) or "gcm" (AES-GCM, authenticated in one pass)
+    :param typed: Whether to encrypt data with its type (see locsec_aes.codec),
+     so that decrypt_data returns an object of the original type instead of a string
+    :param compression: Compression method for data before encryption ("zlib", "lzma", "bz2" or None).
+     Data that doesn't compress is stored as is
+    :param compression_level: Compression level (default of the method if not specified)
+    :param padding: Padding policy: "bucket256" (default), "pow2", "block" or a list of bucket sizes.
+     Smaller padding costs less space for tiny data, but hides its length less
+    :return: Encrypted LocSec chunk
+    """
+    try:
+        cipher = _cipher_for_key(encryption_key)
+        if instrumentation.enabled:
+            instrumentation.lap("key")
+        return cipher.encrypt(data, initial_vector, mode, typed, compression or False, compression_level, padding)
+    except Exception as e:
+        raise _failure("encrypting", e)
+
+
+def encrypt_into(data, output, encryption_key, initial_vector=None, mode=default_mode,
+                 padding=default_padding):
+    """
+    Encrypting data straight into a preallocated buffer.
+    :param data: Data to encrypt (any object supporting buffer protocol: bytes, bytearray, memoryview, mmap...)
+    :param output: Writable buffer for the LocSec chunk, at least encrypted_size(len(data), mode, padding)
+     bytes long
+    :param encryption_key: Encryption key
+    :param initial_vector: IV (nonce for GCM) for encryption. (Will be autogenerated if not specified)
+    :param mode: Encryption mode ("cbc" or "gcm")
+    :param padding: Padding policy ("bucket256", "pow2", "block" or a list of bucket sizes)
+    :return: Length of the LocSec chunk written to output
+    """
+    try:
+        return _cipher_for_key(encryption_key).encrypt_into(data, output, initial_vector, mode, padding)
+    except Exception as e:
+        raise _failure("encrypting", e)
+
+
+def _failure(action, error):
+    """
+    Logging an error of a module-level function (rate-limited) and making an exception for it to raise
+    :param action: What the function was doing ("encrypting", "decrypting"...)
+    :param error: Exception caught
+    :return: Exception of the same LocSec type as error (EncryptionException for non-LocSec errors),
+     error itself for LocSec errors if logging of rejections is off (see locsec_aes.logger.quiet_rejections)
+    """
+    if isinstance(error, EncryptionException):
+        if logger_settings.quiet_rejections:
+            return error
+        exception_class = type(error)
+    else:
+        exception_class = EncryptionException
+    log_limited(logger, logging.ERROR, "Error while %s data.", action, exc_info=error)
+    return exception_class("Error while {}. Check logs", action)
 
 
 def _decrypt_data_return_raw_wo_headers(data_to_dec, encryption_key):
@@ -124,18 +1035,13 @@ def _decrypt_data_return_raw_wo_headers(data_to_dec, encryption_key):
     :return: raw decrypted data (just decrypted data, without checksum verification)
     """
     try:
-        decrypted_data = _decrypt_data_return_raw(data_to_dec, encryption_key)
-        # Stripping parts of decrypted chunk, finding encrypted data
-        data_hash = decrypted_data[:data_hash_header_length]
-        data_length = int(_depad_data(decrypted_data[data_hash_header_length:encrypted_headers_length]))
-        decrypted_data_raw = decrypted_data[encrypted_headers_length:encrypted_headers_length + data_length]
-        return data_hash, decrypted_data_raw
-    except Exception:
-        logger.exception("Error while decrypting data")
+        return _cipher_for_key(encryption_key).decrypt_wo_verification(data_to_dec)
+    except Exception as e:
+        log_limited(logger, logging.ERROR, "Error while decrypting data", exc_info=e)
 
 
-def _sha(data):
-    sha_obj = sha256()
+def _sha(data, prefix=b""):
+    sha_obj = sha256(prefix)
     sha_obj.update(data)
     return sha_obj.digest()
 
@@ -146,52 +1052,79 @@ def _decrypt_data_return_raw(data_to_dec, encryption_key):
     :param encryption_key: Encryption key
     :return: raw decrypted data (just a full decrypted LocSec chunk)
     """
-    if type(data_to_dec) is not bytearray:
-        logger.warning("{}: Data to decrypt is not bytearray. Will try to byteify,"
-                       " but please pass data as raw bytearray. You passed data as a \"{}\""
-                       .format(__file__, data_to_dec.__class__.__name__))
+    return _cipher_for_key(encryption_key).decrypt_raw(data_to_dec)
 
-    if len(data_to_dec) == 0:
-        return bytearray()
-    data_raw = _byteify(data_to_dec)
 
-    # Preparing key for use
-    key_raw = _pad_enc_key(_byteify(encryption_key))
+@instrumentation.measured("decrypt")
+def decrypt_data(data_to_dec, encryption_key, return_raw=False):
+    """
+    Decrypting data. One of two main methods in LocSec.
+    :param data_to_dec: Data to decrypt
+    :param encryption_key: Encryption key
+    :param return_raw: Whether to return raw (bytearray) data or stringified (or decoded, if it was typed)
+    :return: decrypted data (raw, stringified or an object of the original type)
+    """
+    try:
+        cipher = _cipher_for_key(encryption_key)
+        if instrumentation.enabled:
+            instrumentation.lap("key")
+        return cipher.decrypt(data_to_dec, return_raw)
+    except Exception as e:
+        raise _failure("decrypting", e)
+
 
-    # Getting initial vector (it is first 16 unencrypted bytes)
-    init_vector = data_raw[:initial_vector_length]
+def decrypt_into(data_to_dec, output, encryption_key):
+    """
+    Decrypting a LocSec chunk straight into a preallocated buffer.
+    :param data_to_dec: LocSec chunk (any object supporting buffer protocol: bytes, bytearray, memoryview, mmap...)
+    :param output: Writable buffer for decrypted data, at least decrypted_size(data_to_dec, encryption_key) bytes long
+    :param encryption_key: Encryption key
+    :return: Length of decrypted data written to output
+    """
+    try:
+        return _cipher_for_key(encryption_key).decrypt_into(data_to_dec, output)
+    except Exception as e:
+        raise _failure("decrypting", e)
 
-    # All the encrypted data is everything after initial vector
-    encrypted_data = data_raw[initial_vector_length:]
 
-    # Initializing AES and decrypting data
-    aes = AES.new(key_raw, AES.MODE_CBC, init_vector)
-    decrypted_data = bytearray(aes.decrypt(encrypted_data))
-    return decrypted_data
+def decrypted_size(data_to_dec, encryption_key):
+    """
+    Getting length of data in a LocSec chunk (only the chunk headers are decrypted).
+    :param data_to_dec: LocSec chunk (any object supporting buffer protocol)
+    :param encryption_key: Encryption key
+    :return: Length of decrypted data (in bytes)
+    """
+    try:
+        return _cipher_for_key(encryption_key).decrypted_size(data_to_dec)
+    except Exception as e:
+        raise _failure("decrypting", e)
 
 
-def decrypt_data(data_to_dec, encryption_key, return_raw=False):
+def inspect_chunk(data_to_inspect, encryption_key):
     """
-    Decrypting data. One of two main methods in LocSec.
-    :param data_to_dec: Data to decrypt
+    Getting information about a LocSec chunk: data length, mode, key ID, data type, compression, padding...
+     Only the chunk headers are decrypted (a few AES blocks), data integrity is not checked (see verify_chunk).
+    :param data_to_inspect: LocSec chunk (any object supporting buffer protocol)
     :param encryption_key: Encryption key
-    :param return_raw: Whether to return raw (bytearray) data or stringified
-    :return: decrypted data (raw or stringified)
+    :return: ChunkInfo
     """
     try:
-        data_hash, decrypted_data_raw = _decrypt_data_return_raw_wo_headers(data_to_dec, encryption_key)
-        decrypted_data_hash = _sha(decrypted_data_raw)
-        if not decrypted_data_hash == data_hash:
-            raise EncryptionException("Data hash mismatch:\nExpected: {}\nActual:   {}"
-                                      .format(data_hash.hex(), decrypted_data_hash.hex()))
-        if return_raw:
-            return decrypted_data_raw
-        else:
-            decrypted_data_prepared = bytes(decrypted_data_raw).decode(encoding=encoding)
-            return decrypted_data_prepared
-    except Exception:
-        logger.exception("Error while decrypting data.")
-        raise EncryptionException("Error while decrypting. Check logs")
+        return _cipher_for_key(encryption_key).inspect(data_to_inspect)
+    except EncryptionException:
+        # Foreign or malformed chunks are an expected outcome of inspection, no traceback for them
+        raise
+    except Exception as e:
+        raise _failure("inspecting", e)
+
+
+def verify_chunk(data_to_verify, encryption_key):
+    """
+    Checking that a LocSec chunk is intact and encrypted with the key, without building or decoding its data.
+    :param data_to_verify: LocSec chunk (any object supporting buffer protocol)
+    :param encryption_key: Encryption key
+    :return: Whether the chunk is intact and encrypted with the key
+    """
+    return _cipher_for_key(encryption_key).verify(data_to_verify)
 
 
 def _pad_enc_key(input_key):
@@ -243,8 +1176,25 @@ def _depad_data(data):
     if type(data) is not bytearray:
         raise EncryptionException("Could not depad data: data is not byteified!")
     # Use it carefully, this may destroy data!
-    depadded_data = [abyte for abyte in data if abyte.to_bytes(1, sys.byteorder) != b'\x00']
-    return bytearray(depadded_data)
+    return data.replace(b"\x00", b"")
+
+
+def _buffer_view(data):
+    """
+    Getting a flat byte view of an object supporting buffer protocol (no data is copied)
+    :param data: bytes, bytearray, memoryview, mmap, array...
+    :return: memoryview of bytes
+    """
+    try:
+        view = memoryview(data)
+    except TypeError:
+        raise EncryptionException("Data should support buffer protocol (bytes, bytearray, memoryview, mmap...)."
+                                  " You passed data as a \"{}\"".format(data.__class__.__name__))
+    if not view.c_contiguous:
+        raise EncryptionException("Data should be a contiguous buffer.")
+    if view.ndim != 1 or view.format != "B":
+        view = view.cast("B")
+    return view
 
 
 def _byteify(data, no_warnings=False):
@@ -254,9 +1204,9 @@ def _byteify(data, no_warnings=False):
     :return: data as bytearray
     """
     if not no_warnings and not isinstance(data, str) and not isinstance(data, bytes) and not isinstance(data, bytearray):
-        logger.warning("{}: Data to encrypt is not a string or binary. Will try to byteify,"
-                       " but please pass data as a string or binary. You passed data as a \"{}\""
-                       .format(__file__, data.__class__.__name__))
+        log_limited(logger, logging.WARNING, "%s: Data to encrypt is not a string or binary. Will try to byteify,"
+                    " but please pass data as a string or binary. You passed data as a \"%s\"",
+                    __file__, data.__class__.__name__)
     match data:
         case str():
             return bytearray(data, encoding)
@@ -0,0 +1,218 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import bisect
+import collections
+import functools
+import threading
+import time
+
+'''
+Optional per-phase timing of encryption and decryption.
+Disabled by default: then every instrumented spot costs one check of a module flag.
+When enabled, every top-level encrypt/decrypt call produces a Measurement that is sent to the sinks.
+
+Phases: key (key lookup/derivation), encode (type codec or byteify), compress, hash (sha256),
+ pad (building padded blocks), aes, headers (decrypting and parsing chunk headers), verify (GCM tag),
+ log (logging on the hot path), decompress, decode, other (the rest of the call).
+'''
+
+enabled = False
+
+# operation: "encrypt" or "decrypt", phases: {phase: seconds}, total: seconds,
+#  data_length: bytes of the LocSec chunk (encrypt) or of decrypted data before decoding (decrypt), see count,
+#  error: whether the call raised
+Measurement = collections.namedtuple("Measurement", ["operation", "phases", "total", "data_length", "error"])
+
+_sinks = []
+_local = threading.local()
+
+
+def enable(*sinks):
+    """
+    Enabling instrumentation
+    :param sinks: Sinks to add (callables taking a Measurement, e.g. a HistogramSink)
+    """
+    global enabled
+    _sinks.extend(sinks)
+    enabled = True
+
+
+def disable():
+    """
+    Disabling instrumentation and removing all sinks
+    """
+    global enabled
+    enabled = False
+    del _sinks[:]
+
+
+def measured(operation):
+    """
+    Decorator for top-level operations: calls made while another one is measured on the same thread
+     are counted as a part of it
+    :param operation: Operation name
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled or getattr(_local, "measurement", None) is not None:
+                return function(*args, **kwargs)
+            measurement = _local.measurement = _Running()
+            error = True
+            try:
+                result = function(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                _local.measurement = None
+                _emit(operation, measurement, error)
+        return wrapper
+    return decorator
+
+
+def lap(phase):
+    """
+    Attributing time since the previous lap (or the beginning of the operation) to a phase
+    :param phase: Phase name
+    """
+    measurement = getattr(_local, "measurement", None)
+    if measurement is not None:
+        now = time.perf_counter()
+        measurement.phases[phase] = measurement.phases.get(phase, 0) + now - measurement.last
+        measurement.last = now
+
+
+def count(data_length):
+    """
+    Setting the amount of bytes the operation produced (the last call wins)
+    :param data_length: Length of the LocSec chunk (encrypt) or of decrypted data (decrypt)
+    """
+    measurement = getattr(_local, "measurement", None)
+    if measurement is not None:
+        measurement.data_length = data_length
+
+
+class _Running:
+    __slots__ = ("started", "last", "phases", "data_length")
+
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.phases = {}
+        self.data_length = 0
+
+
+def _emit(operation, measurement, error):
+    total = time.perf_counter() - measurement.started
+    phases = measurement.phases
+    phases["other"] = max(0.0, total - sum(phases.values()))
+    for sink in list(_sinks):
+        sink(Measurement(operation, phases, total, measurement.data_length, error))
+
+
+class CallbackSink:
+    """
+    Sink calling a function with every Measurement (a plain function can be used as a sink too)
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def __call__(self, measurement):
+        self.callback(measurement)
+
+
+# Histogram bucket bounds (seconds): 1 us ... ~1 s
+default_buckets = tuple(10 ** (exponent / 2) / 1000000 for exponent in range(13))
+
+
+class HistogramSink:
+    """
+    In-memory histograms of phase durations per operation, with call, error and byte counters
+    """
+
+    def __init__(self, buckets=default_buckets):
+        """
+        :param buckets: Upper bounds of histogram buckets (in seconds)
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # (operation, phase) -> [bucket counts (+ overflow), sum, count]
+        self.histograms = {}
+        # operation -> {"calls", "errors", "bytes"}
+        self.counters = {}
+
+    def __call__(self, measurement):
+        operation = measurement.operation
+        histograms = self.histograms
+        buckets = self.buckets
+        phases = list(measurement.phases.items())
+        phases.append(("total", measurement.total))
+        with self._lock:
+            counters = self.counters.get(operation)
+            if counters is None:
+                counters = self.counters[operation] = {"calls": 0, "errors": 0, "bytes": 0}
+            counters["calls"] += 1
+            counters["errors"] += measurement.error
+            counters["bytes"] += measurement.data_length
+            for phase, duration in phases:
+                histogram = histograms.get((operation, phase))
+                if histogram is None:
+                    histogram = histograms[(operation, phase)] = [[0] * (len(buckets) + 1), 0.0, 0]
+                histogram[0][bisect.bisect_left(buckets, duration)] += 1
+                histogram[1] += duration
+                histogram[2] += 1
+
+    def percentile(self, operation, phase, percent):
+        """
+        Estimating a percentile of phase duration (upper bound of the bucket it falls into)
+        :return: Duration in seconds (None if there are no measurements, inf if it's beyond the last bucket)
+        """
+        with self._lock:
+            histogram = self.histograms.get((operation, phase))
+            if histogram is None:
+                return None
+            rank = histogram[2] * percent / 100
+            seen = 0
+            for bound, count in zip(self.buckets + (float("inf"),), histogram[0]):
+                seen += count
+                if seen >= rank:
+                    return bound
+            return float("inf")
+
+    def prometheus(self, prefix="locsec_aes"):
+        """
+        :param prefix: Metric name prefix
+        :return: Metrics in Prometheus text exposition format
+        """
+        lines = ["# TYPE {}_calls_total counter".format(prefix),
+                 "# TYPE {}_errors_total counter".format(prefix),
+                 "# TYPE {}_bytes_total counter".format(prefix)]
+        with self._lock:
+            for operation, counters in sorted(self.counters.items()):
+                for name in ("calls", "errors", "bytes"):
+                    lines.append('{}_{}_total{{operation="{}"}} {}'.format(prefix, name, operation, counters[name]))
+            lines.append("# TYPE {}_phase_seconds histogram".format(prefix))
+            for (operation, phase), (counts, total, count) in sorted(self.histograms.items()):
+                labels = 'operation="{}",phase="{}"'.format(operation, phase)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append('{}_phase_seconds_bucket{{{},le="{:g}"}} {}'.format(prefix, labels, bound, cumulative))
+                lines.append('{}_phase_seconds_bucket{{{},le="+Inf"}} {}'.format(prefix, labels, count))
+                lines.append("{}_phase_seconds_sum{{{}}} {!r}".format(prefix, labels, total))
+                lines.append("{}_phase_seconds_count{{{}}} {}".format(prefix, labels, count))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,165 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import hashlib
+import io
+import itertools
+import os
+import queue
+import threading
+import weakref
+
+'''
+IVs (GCM nonces) for chunks encrypted without an explicit one, from a pluggable provider
+ (a callable taking a length and returning that many bytes).
+
+The default BufferedProvider takes os.urandom in blocks and hands IVs out of per-thread pools,
+ so a chunk costs no syscall and threads don't share a lock. Blocks can be prepared by a background thread.
+Buffers are dropped in forked children (a child must never reuse its parent's IVs: for GCM that would leak data).
+DeterministicProvider gives repeatable IVs for tests, it must never be used for real data.
+'''
+
+default_block_size = 4096
+# Blocks prepared ahead by the background thread of a BufferedProvider
+background_blocks = 16
+
+_generation = 0
+_buffered = weakref.WeakSet()
+
+
+class SystemProvider:
+    """
+    os.urandom call for every IV
+    """
+
+    def __call__(self, length):
+        return os.urandom(length)
+
+
+class BufferedProvider:
+    """
+    IVs from per-thread pools of os.urandom blocks
+    """
+
+    def __init__(self, block_size=default_block_size, background=False):
+        """
+        :param block_size: Amount of random bytes (in bytes) taken from the OS at once
+        :param background: Whether to prepare blocks in a background thread
+        """
+        self.block_size = block_size
+        self.background = background
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._blocks = None
+        self._refill_thread = None
+        _buffered.add(self)
+
+    def __call__(self, length):
+        try:
+            generation, read = self._local.state
+        except AttributeError:
+            generation = read = None
+        if generation == _generation:
+            initial_vector = read(length)
+            if len(initial_vector) == length:
+                return initial_vector
+        # Pool of this thread is used up (the rest of it is dropped) or is not there yet
+        if length > self.block_size:
+            return os.urandom(length)
+        read = io.BytesIO(self._block()).read
+        self._local.state = (_generation, read)
+        return read(length)
+
+    def _block(self):
+        if self.background:
+            if self._refill_thread is None:
+                self._start_refill()
+            try:
+                return self._blocks.get_nowait()
+            except queue.Empty:
+                # Refilling is behind: not waiting for it
+                pass
+        return os.urandom(self.block_size)
+
+    def _start_refill(self):
+        with self._lock:
+            if self._refill_thread is None:
+                self._blocks = queue.Queue(background_blocks)
+                self._refill_thread = threading.Thread(target=_refill, args=(self._blocks, self.block_size),
+                                                       name="LocSec-AES IV refill", daemon=True)
+                self._refill_thread.start()
+
+    def _after_fork(self):
+        # Blocks prepared by the parent are its own, the refill thread didn't survive the fork
+        self._lock = threading.Lock()
+        self._blocks = None
+        self._refill_thread = None
+
+
+class DeterministicProvider:
+    """
+    Repeatable IVs (sha256 of the seed and a counter). For tests only
+    """
+
+    def __init__(self, seed=0):
+        """
+        :param seed: Integer, IVs of providers with the same seed are the same
+        """
+        self.seed = seed.to_bytes(8, "big", signed=True)
+        self._counter = itertools.count()
+
+    def __call__(self, length):
+        digest = hashlib.sha256(self.seed + next(self._counter).to_bytes(8, "big")).digest()
+        while len(digest) < length:
+            digest += hashlib.sha256(digest).digest()
+        return digest[:length]
+
+
+def _refill(blocks, block_size):
+    while True:
+        blocks.put(os.urandom(block_size))
+
+
+def _after_fork():
+    global _generation
+    _generation += 1
+    for provider in list(_buffered):
+        provider._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+# Used for every IV generated by locsec_aes.encryption
+provider = BufferedProvider()
+# Called by locsec_aes.encryption: bound __call__ of the provider (cheaper to call than the provider itself)
+new_iv = provider.__call__
+
+
+def set_provider(new_provider):
+    """
+    Setting the IV provider for all encryption
+    :param new_provider: Callable taking a length and returning that many random bytes
+     (SystemProvider(), BufferedProvider(...), DeterministicProvider(seed) for tests)
+    :return: Previous provider
+    """
+    global provider, new_iv
+    if not callable(new_provider):
+        raise TypeError("IV provider should be callable")
+    previous = provider
+    provider = new_provider
+    new_iv = new_provider.__call__
+    return previous
@@ -0,0 +1,186 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from hashlib import sha256
+
+from locsec_aes.EncryptionException import EncryptionException, BadKeyException
+from locsec_aes.batch import _run_many, _item_error
+from locsec_aes.encryption import LocSecCipher, chunk_key_id, default_mode, default_padding, \
+    padding_flags_mask, _flags_paddings, _buffer_view, _check_mode, _check_padding, _chunk_length
+from locsec_aes import compression as compression_module
+
+'''
+Several keys at once (e.g. during key rotation).
+Every key has a 4-byte ID which is written to the unencrypted header of chunks encrypted with it,
+ so decryption picks the right key with one lookup instead of trying every key.
+ Chunks without key ID (encrypted by LocSecCipher/encrypt_data) are still decrypted by trying the keys in turn.
+'''
+
+
+class KeyRing:
+    """
+    Set of encryption keys with one current key (used for encryption).
+    Keys are derived once when they are added.
+    """
+
+    def __init__(self, mode=default_mode, typed=False, compression=None, compression_level=None,
+                 padding=default_padding):
+        """
+        Options are the same as LocSecCipher ones and apply to every key of the ring
+        :param mode: Default encryption mode ("cbc" or "gcm")
+        :param typed: Whether to encrypt data with its type by default
+        :param compression: Default compression method ("zlib", "lzma", "bz2" or None)
+        :param compression_level: Default compression level
+        :param padding: Default padding policy ("bucket256", "pow2", "block" or a list of bucket sizes)
+        """
+        self._options = {"mode": _check_mode(mode), "typed": typed,
+                         "compression": compression_module.check_method(compression),
+                         "compression_level": compression_level, "padding": _check_padding(padding)}
+        self._ciphers = {}
+        self.current_key_id = None
+
+    def add_key(self, encryption_key, key_id=None, current=False):
+        """
+        Adding a key to the ring
+        :param encryption_key: Encryption key
+        :param key_id: Key ID (u32), derived from the key if not specified
+        :param current: Whether to make the key current (the first added key always is)
+        :return: Key ID
+        """
+        cipher = LocSecCipher(encryption_key, key_id=key_id, **self._options)
+        if key_id is None:
+            # Derived key ID tells nothing about the key itself
+            cipher.key_id = key_id = int.from_bytes(sha256(b"LocSec key ID" + cipher.key_raw).digest()[:4], "big")
+        if key_id in self._ciphers:
+            raise EncryptionException("Key ID {} is already taken.".format(key_id))
+        self._ciphers[key_id] = cipher
+        if current or self.current_key_id is None:
+            self.current_key_id = key_id
+        return key_id
+
+    def remove_key(self, key_id):
+        """
+        Removing a key from the ring (current key can't be removed)
+        :param key_id: Key ID
+        """
+        if key_id == self.current_key_id:
+            raise EncryptionException("Current key can't be removed, make another key current first.")
+        if self._ciphers.pop(key_id, None) is None:
+            raise BadKeyException("No key with ID {} in the ring.", key_id)
+
+    def set_current(self, key_id):
+        """
+        Making a key current (new data is encrypted with it)
+        :param key_id: Key ID
+        """
+        if key_id not in self._ciphers:
+            raise BadKeyException("No key with ID {} in the ring.", key_id)
+        self.current_key_id = key_id
+
+    @property
+    def key_ids(self):
+        return list(self._ciphers)
+
+    def cipher(self, key_id=None):
+        """
+        :param key_id: Key ID (current key if not specified)
+        :return: LocSecCipher of the key (its chunks have the key ID)
+        """
+        if key_id is None:
+            if self.current_key_id is None:
+                raise BadKeyException("Key ring is empty.")
+            key_id = self.current_key_id
+        cipher = self._ciphers.get(key_id)
+        if cipher is None:
+            raise BadKeyException("No key with ID {} in the ring.", key_id)
+        return cipher
+
+    def encrypt(self, data, initial_vector=None, mode=None, typed=None, compression=None, compression_level=None,
+                padding=None):
+        """
+        Encrypting data with the current key (see LocSecCipher.encrypt)
+        :return: Encrypted LocSec chunk with ID of the current key
+        """
+        return self.cipher().encrypt(data, initial_vector, mode, typed, compression, compression_level, padding)
+
+    def decrypt(self, data_to_dec, return_raw=False):
+        """
+        Decrypting a chunk with the key it was encrypted with (see LocSecCipher.decrypt)
+        :param data_to_dec: LocSec chunk
+        :param return_raw: Whether to return raw (bytearray) data
+        :return: decrypted data
+        """
+        key_id = chunk_key_id(data_to_dec) if not isinstance(data_to_dec, str) else None
+        if key_id is not None:
+            return self.cipher(key_id).decrypt(data_to_dec, return_raw)
+        return self._try_keys(lambda cipher: cipher.decrypt(data_to_dec, return_raw))
+
+    def reencrypt(self, data_to_reenc):
+        """
+        Re-encrypting a chunk with the current key.
+        Data is not decompressed/decoded in between, mode, data type and padding policy of the chunk are kept
+         (chunks with custom padding buckets get the default padding of the ring)
+        :param data_to_reenc: LocSec chunk (any object supporting buffer protocol)
+        :return: LocSec chunk encrypted with the current key (the same data if it already was)
+        """
+        data_view = _buffer_view(data_to_reenc)
+        key_id = chunk_key_id(data_view)
+        if key_id == self.current_key_id:
+            return bytearray(data_view)
+        if key_id is not None:
+            headers, data = self.cipher(key_id)._decrypt(data_view, decompress=False)
+        else:
+            headers, data = self._try_keys(lambda cipher: cipher._decrypt(data_view, decompress=False))
+        cipher = self.cipher()
+        padding = _flags_paddings.get(headers.data_flags & padding_flags_mask, cipher.padding)
+        output = bytearray(_chunk_length(headers.data_length, headers.mode, padding, True))
+        cipher._encrypt_into(data, output, None, headers.mode, padding, headers.data_type,
+                             headers.data_flags & compression_module.flags_mask, headers.original_length)
+        return output
+
+    def reencrypt_many(self, items, workers=None, executor="thread", chunksize=None):
+        """
+        Re-encrypting many chunks with the current key in parallel (see locsec_aes.batch)
+        :param items: Iterable with LocSec chunks
+        :param workers: Amount of workers (CPU count if not specified)
+        :param executor: "thread", "process" or an existing concurrent.futures.Executor
+        :param chunksize: Amount of items sent to a worker at once (calculated if not specified)
+        :return: List of re-encrypted chunks in the order of items.
+         Items that could not be re-encrypted get an EncryptionException in their place
+        """
+        return _run_many(_reencrypt_slice, items, self, (), workers, executor, chunksize)
+
+    def _try_keys(self, function):
+        # Chunk without key ID: trying the current key first, then the rest
+        if self.current_key_id is None:
+            raise BadKeyException("Key ring is empty.")
+        key_ids = [self.current_key_id] + [key_id for key_id in self._ciphers if key_id != self.current_key_id]
+        for key_id in key_ids:
+            try:
+                return function(self._ciphers[key_id])
+            except EncryptionException:
+                continue
+        raise BadKeyException("Could not decrypt data: none of the keys in the ring fit.")
+
+
+def _reencrypt_slice(key_ring, start, items_slice):
+    results = []
+    for index, item in enumerate(items_slice, start):
+        try:
+            results.append(key_ring.reencrypt(item))
+        except Exception as e:
+            results.append(_item_error("re-encrypting", index, e))
+    return results
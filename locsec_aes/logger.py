@@ -16,6 +16,8 @@
 
 import logging
 import sys
+import threading
+import time
 
 _log_format = "%(asctime)s - [%(levelname)-7s] - LocSec-AES: %(filename)32s:%(lineno)-3s | %(message)s"
 
@@ -23,6 +25,18 @@ loggers = {}
 
 default_level = logging.INFO
 
+# Same message is logged at most rate_limit times per rate_limit_interval seconds, the rest are counted
+#  and reported once the interval is over (a burst of garbage chunks shouldn't be bottlenecked on logging)
+rate_limit = 10
+rate_limit_interval = 60.0
+
+# Whether to skip logging of rejected data (bad chunks, wrong keys...) completely.
+#  Rejections are raised right away then, with their own exception types and messages
+quiet_rejections = False
+
+_limits = {}
+_limits_lock = threading.Lock()
+
 
 def get_stream_handlers(level=logging.INFO):
     stream_handler = logging.StreamHandler(sys.stdout)
@@ -52,3 +66,40 @@ def setdebug():
     get_logger().info("Enabling debug logging")
     default_level = logging.DEBUG
     get_logger().debug("Debug logging enabled")
+
+
+def set_quiet_rejections(quiet=True):
+    """
+    Turning logging of rejected data on or off (see quiet_rejections)
+    """
+    global quiet_rejections
+    quiet_rejections = quiet
+
+
+def log_limited(logger, level, message, *args, exc_info=None):
+    """
+    Logging a message (formatted lazily, logging-style) no more than rate_limit times per rate_limit_interval
+    :param logger: Logger
+    :param level: Logging level
+    :param message: Message format string (also the key messages are counted by)
+    :param args: Message arguments
+    :param exc_info: Exception to log the traceback of
+    :return: Whether the message was logged
+    """
+    if not logger.isEnabledFor(level):
+        return False
+    now = time.monotonic()
+    suppressed = 0
+    with _limits_lock:
+        limit = _limits.get(message)
+        if limit is None or now - limit[0] >= rate_limit_interval:
+            suppressed = limit[2] if limit is not None else 0
+            limit = _limits[message] = [now, 0, 0]
+        if limit[1] >= rate_limit:
+            limit[2] += 1
+            return False
+        limit[1] += 1
+    if suppressed:
+        logger.log(level, "%d more messages like the next one were suppressed", suppressed)
+    logger.log(level, message, *args, exc_info=exc_info, stacklevel=2)
+    return True
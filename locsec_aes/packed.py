@@ -0,0 +1,229 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import collections.abc
+import itertools
+import struct
+
+from locsec_aes import codec
+from locsec_aes.encryption import _cipher_for_key, _buffer_view, default_mode, default_padding, data_size_max
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException, OversizeException
+
+'''
+Packed records: many small values in one LocSec chunk (one IV, one hash or tag, one padding for all of them).
+
+ size      1       4         4 * count         count (typed only)
+(bytes) |=====|=========|==================|======================|####################|
+           ^       ^             ^                    ^                      ^
+         flags   count   record end offsets      type tags           records, one after another
+
+Records are found through the offset table, so one record is decoded without touching the others.
+'''
+
+packed_tag = 13
+typed_flag = 0x01
+default_chunk_data_size = 1048576  # 1 MiB
+
+_packed_header = struct.Struct(">BI")
+_offset = struct.Struct(">I")
+
+
+class PackedRecords(collections.abc.Sequence):
+    """
+    Read-only sequence of packed records: records are decoded when they are accessed
+    """
+
+    def __init__(self, data):
+        """
+        :param data: Packed records (as made by PackedRecords.pack)
+        """
+        self.data = _buffer_view(data)
+        if len(self.data) < _packed_header.size:
+            raise MalformedChunkException("Could not unpack records: data is too short.")
+        flags, self._count = _packed_header.unpack_from(self.data)
+        if flags & ~typed_flag:
+            raise MalformedChunkException("Could not unpack records: unknown flags ({}).", flags)
+        self.typed = bool(flags & typed_flag)
+        self._tags_start = _packed_header.size + _offset.size * self._count
+        self._records_start = self._tags_start + (self._count if self.typed else 0)
+        if self._records_start > len(self.data) or \
+                self._records_start + (self._end(self._count - 1) if self._count else 0) != len(self.data):
+            raise MalformedChunkException("Could not unpack records: offset table doesn't match data length.")
+
+    @classmethod
+    def pack(cls, records, typed=False):
+        """
+        Packing records
+        :param records: Iterable with records: objects supporting buffer protocol (or str, encoded to utf-8)
+         or, if typed, objects of any type with a codec (see locsec_aes.codec)
+        :param typed: Whether to keep types of records (untyped records are unpacked as bytes)
+        :return: PackedRecords
+        """
+        tags = bytearray() if typed else None
+        encoded = [_encode_record(record, tags) for record in records]
+        return cls._from_encoded(encoded, tags)
+
+    @classmethod
+    def _from_encoded(cls, encoded, tags):
+        packed = bytearray(_packed_header.pack(typed_flag if tags is not None else 0, len(encoded)))
+        packed += struct.pack(">{}I".format(len(encoded)), *itertools.accumulate(map(len, encoded)))
+        if tags is not None:
+            packed += tags
+        packed += b"".join(encoded)
+        return cls(packed)
+
+    def _end(self, index):
+        return _offset.unpack_from(self.data, _packed_header.size + _offset.size * index)[0]
+
+    def __len__(self):
+        return self._count
+
+    def raw(self, index):
+        """
+        :param index: Record index
+        :return: Encoded record (memoryview, no copy) and its type tag (codec.untyped if records are untyped)
+        """
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("Record index out of range")
+        start = self._end(index - 1) if index else 0
+        end = self._end(index)
+        if not start <= end:
+            raise MalformedChunkException("Could not unpack records: bad offset of record {}.", index)
+        tag = self.data[self._tags_start + index] if self.typed else codec.untyped
+        return self.data[self._records_start + start:self._records_start + end], tag
+
+    def __iter__(self):
+        # Offset table is unpacked once for all records
+        ends = struct.unpack_from(">{}I".format(self._count), self.data, _packed_header.size)
+        start = self._records_start
+        for index, end in enumerate(ends):
+            end += self._records_start
+            if end < start:
+                raise MalformedChunkException("Could not unpack records: bad offset of record {}.", index)
+            if self.typed:
+                yield codec.decode(self.data[self._tags_start + index], bytearray(self.data[start:end]))
+            else:
+                yield bytes(self.data[start:end])
+            start = end
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        record, tag = self.raw(index)
+        if tag == codec.untyped:
+            return bytes(record)
+        return codec.decode(tag, bytearray(record))
+
+
+def pack_records(records, encryption_key, typed=False, mode=default_mode, compression=None, padding=default_padding):
+    """
+    Encrypting many records into one LocSec chunk
+    :param records: Iterable with records (see PackedRecords.pack)
+    :param encryption_key: Encryption key
+    :param typed: Whether to keep types of records (untyped records are unpacked as bytes)
+    :param mode: Encryption mode ("cbc" or "gcm")
+    :param compression: Compression method ("zlib", "lzma", "bz2" or None)
+    :param padding: Padding policy ("bucket256", "pow2", "block" or a list of bucket sizes)
+    :return: Encrypted LocSec chunk (decrypt_data returns PackedRecords for it)
+    """
+    return _encrypt_packed(PackedRecords.pack(records, typed), encryption_key, mode, compression, padding)
+
+
+def pack_many(records, encryption_key, chunk_data_size=default_chunk_data_size, typed=False, mode=default_mode,
+              compression=None, padding=default_padding):
+    """
+    Encrypting any amount of records into as many LocSec chunks as needed
+    :param records: Iterable with records (see PackedRecords.pack)
+    :param encryption_key: Encryption key
+    :param chunk_data_size: Approximate amount of record data (in bytes) per chunk
+    :param typed: Whether to keep types of records
+    :param mode: Encryption mode ("cbc" or "gcm")
+    :param compression: Compression method ("zlib", "lzma", "bz2" or None)
+    :param padding: Padding policy ("bucket256", "pow2", "block" or a list of bucket sizes)
+    :return: List of LocSec chunks (records keep their order: chunk by chunk)
+    """
+    if not 0 < chunk_data_size <= data_size_max // 2:
+        raise EncryptionException("Bad chunk data size: should be between 1 and {} bytes.".format(data_size_max // 2))
+    chunks = []
+    group = []
+    tags = bytearray() if typed else None
+    group_size = 0
+    for record in records:
+        record = _encode_record(record, tags)
+        group.append(record)
+        group_size += _offset.size + len(record)
+        if group_size >= chunk_data_size:
+            chunks.append(_encrypt_packed(PackedRecords._from_encoded(group, tags), encryption_key, mode,
+                                          compression, padding))
+            group = []
+            tags = bytearray() if typed else None
+            group_size = 0
+    if group or not chunks:
+        chunks.append(_encrypt_packed(PackedRecords._from_encoded(group, tags), encryption_key, mode,
+                                      compression, padding))
+    return chunks
+
+
+def _encode_record(record, tags):
+    """
+    :param record: Record to encode
+    :param tags: bytearray to append the type tag of the record to (None for untyped records)
+    :return: Encoded record (bytes-like object, len() is its length in bytes)
+    """
+    if tags is not None:
+        tag, record = codec.encode(record)
+        tags.append(tag)
+    elif type(record) is str:
+        return record.encode(codec.encoding)
+    if type(record) is bytes or type(record) is bytearray:
+        return record
+    return _buffer_view(record)
+
+
+def _encrypt_packed(packed, encryption_key, mode, compression, padding):
+    if len(packed.data) > data_size_max:
+        raise OversizeException("Packed records exceeded maximum size ({} bytes), use pack_many.", data_size_max)
+    return _cipher_for_key(encryption_key).encrypt(packed, None, mode, True, compression or False, None, padding)
+
+
+def unpack_records(chunk, encryption_key):
+    """
+    Decrypting a chunk with packed records (the whole chunk is decrypted and verified, records are decoded lazily)
+    :param chunk: LocSec chunk made by pack_records
+    :param encryption_key: Encryption key
+    :return: PackedRecords
+    """
+    headers, data = _cipher_for_key(encryption_key)._decrypt(_buffer_view(chunk))
+    if headers.data_type != packed_tag:
+        raise MalformedChunkException("Could not unpack records: chunk has no packed records (data type {}).",
+                                      headers.data_type)
+    return PackedRecords(data)
+
+
+def unpack_record(chunk, encryption_key, index):
+    """
+    Getting one record from a chunk with packed records (the others are not decoded)
+    :param chunk: LocSec chunk made by pack_records
+    :param encryption_key: Encryption key
+    :param index: Record index
+    :return: Record
+    """
+    return unpack_records(chunk, encryption_key)[index]
+
+
+codec._register(PackedRecords, packed_tag, lambda records: records.data, PackedRecords)
@@ -0,0 +1,70 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import struct
+
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException, HashMismatchException, \
+    BadKeyException, OversizeException
+
+'''
+Binary protocol of the LocSec daemon (locsec_aes.server / locsec_aes.client), over a Unix domain socket.
+Kept free of crypto imports, so clients don't pay for them.
+
+Request:   payload length (u32) | request ID (u32) | operation (u8) | flags (u8) | key ID (u32) | payload
+Response:  payload length (u32) | request ID (u32) | status (u8) | payload (result or utf-8 error message)
+
+Requests of a connection may be pipelined, responses come back in any order (matched by request ID).
+'''
+
+request_header = struct.Struct(">IIBBI")
+response_header = struct.Struct(">IIB")
+
+operation_encrypt = 1
+operation_decrypt = 2
+operations = (operation_encrypt, operation_decrypt)
+
+# Encrypt with AES-GCM instead of the default mode of the key
+flag_gcm = 0x01
+
+status_ok = 0
+# status -> exception class (most specific classes are matched first when an error is sent)
+error_statuses = {1: EncryptionException, 2: MalformedChunkException, 3: HashMismatchException, 4: BadKeyException,
+                  5: OversizeException}
+
+# Bigger than any LocSec chunk (and data that can be encrypted)
+max_payload_length = 16777216
+# Requests in flight per connection the server accepts by default (clients send fewer than that ahead of responses)
+max_in_flight = 64
+
+
+def error_status(error):
+    """
+    :param error: Exception
+    :return: Status to send it with
+    """
+    for status, exception_class in sorted(error_statuses.items(), reverse=True):
+        if isinstance(error, exception_class):
+            return status
+    return 1
+
+
+def error_from_status(status, message):
+    """
+    :param status: Error status of a response
+    :param message: Error message of the response
+    :return: Exception to raise for it
+    """
+    return error_statuses.get(status, EncryptionException)(message)
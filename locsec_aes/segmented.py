@@ -0,0 +1,293 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import struct
+
+from locsec_aes.encryption import LocSecCipher, default_mode, default_padding, data_size_max, encrypted_size, \
+    chunk_length_max, _mode_flags, _flags_modes, _padding_flags, _custom_padding_flags, _flags_paddings, \
+    _check_padding, _buffer_view
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException
+
+'''
+LocSec AES segmented blob (updatable in place, segment by segment):
+
+ size      4       1                                                             4          4
+(bytes) |=====|=========|############|############|  ...  |#########|##########|==========|=====|
+           ^       ^          ^            ^                   ^         ^           ^         ^
+         magic   blob     segment 0    segment 1       last segment  manifest  manifest     magic
+                version                                                          length
+
+Every segment is a LocSec chunk (own IV and hash/tag) with segment_size bytes of data (the last one may have less),
+ so segment i starts at a fixed offset and can be replaced without moving the others.
+Manifest (encrypted): segment size (u32), slot (chunk length of a full segment, u32), data length (u64),
+ mode and padding policy of the segments (u8, u8; custom padding buckets follow as a count (u32) and sizes (u32)),
+ and first bytes (header and IV) of every segment chunk, so segments can't be swapped, replaced by older versions
+ or dropped. Updates re-encrypt segments with the mode and padding of the blob, so they keep fitting their slots.
+'''
+
+blob_magic = b"LSAB"
+blob_version = 2
+default_segment_size = 262144  # 256 KiB
+
+_blob_header = struct.Struct(">4sB")
+_manifest_header = struct.Struct(">IIQBBI")
+_bucket = struct.Struct(">I")
+_trailer = struct.Struct(">I4s")
+_segment_id_length = 32
+
+
+class SegmentedCipher:
+    """
+    Encrypting data to segmented blobs and updating parts of them without re-encrypting the rest
+    """
+
+    def __init__(self, encryption_key, segment_size=default_segment_size, mode=default_mode,
+                 padding=default_padding):
+        """
+        :param encryption_key: Encryption key
+        :param segment_size: Amount of data (in bytes) in one segment of new blobs: an update re-encrypts
+         at least one segment, the manifest grows with the amount of segments
+        :param mode: Encryption mode ("cbc" or "gcm")
+        :param padding: Padding policy ("bucket256", "pow2", "block" or a list of bucket sizes)
+        """
+        if not 0 < segment_size <= data_size_max:
+            raise EncryptionException("Bad segment size: should be between 1 and {} bytes.".format(data_size_max))
+        self.cipher = LocSecCipher(encryption_key, mode, padding=padding)
+        self.segment_size = segment_size
+
+    def encrypt(self, data):
+        """
+        :param data: Data to encrypt (any object supporting buffer protocol)
+        :return: Segmented blob (bytearray)
+        """
+        data_view = _buffer_view(data)
+        blob = bytearray(_blob_header.pack(blob_magic, blob_version))
+        segment_ids = []
+        for start in range(0, len(data_view), self.segment_size):
+            chunk = self.cipher.encrypt(data_view[start:start + self.segment_size], compression=False)
+            segment_ids.append(bytes(chunk[:_segment_id_length]))
+            blob += chunk
+        slot = encrypted_size(self.segment_size, self.cipher.mode, self.cipher.padding)
+        self._write_manifest(blob, _Manifest(self.segment_size, len(data_view), segment_ids, _blob_header.size, slot,
+                                             None, self.cipher.mode, self.cipher.padding))
+        return blob
+
+    def decrypt(self, blob):
+        """
+        :param blob: Segmented blob
+        :return: Decrypted data (bytearray)
+        """
+        blob_view = _buffer_view(blob)
+        manifest = self._read_manifest(blob_view)
+        return bytearray(b"".join(self._segment(blob_view, manifest, index)
+                                  for index in range(len(manifest.segment_ids))))
+
+    def read(self, blob, offset, length):
+        """
+        Decrypting a part of a blob (only the segments it's in)
+        :param blob: Segmented blob
+        :param offset: Offset of the part in the data
+        :param length: Length of the part
+        :return: Decrypted part (bytes, shorter if the data ends before the part does)
+        """
+        blob_view = _buffer_view(blob)
+        manifest = self._read_manifest(blob_view)
+        end = min(offset + length, manifest.data_length)
+        if offset >= end:
+            return b""
+        first, last = offset // manifest.segment_size, (end - 1) // manifest.segment_size
+        data = b"".join(self._segment(blob_view, manifest, index) for index in range(first, last + 1))
+        start = offset - first * manifest.segment_size
+        return bytes(data[start:start + end - offset])
+
+    def update(self, blob, offset, new_bytes):
+        """
+        Overwriting a part of the data of a blob in place: only the segments it touches and the manifest
+         are re-encrypted. Writing past the end of the data extends it (with zeros between the end and offset)
+        :param blob: Segmented blob (bytearray, changed in place)
+        :param offset: Offset in the data to write new_bytes at
+        :param new_bytes: New data (any object supporting buffer protocol)
+        :return: Sorted list of changed (start, end) byte ranges of the blob.
+         If the blob got longer or shorter (data extended, manifest size changed), the last range ends at its new end
+        """
+        if type(blob) is not bytearray:
+            raise EncryptionException("Blob to update should be a bytearray.")
+        if offset < 0:
+            raise EncryptionException("Bad offset: should not be negative.")
+        new_view = _buffer_view(new_bytes)
+        with memoryview(blob) as blob_view:
+            manifest = self._read_manifest(blob_view)
+            if not new_view:
+                return []
+            segment_size = manifest.segment_size
+            segments = len(manifest.segment_ids)
+            data_length = max(manifest.data_length, offset + len(new_view))
+            first = min(offset, manifest.data_length) // segment_size
+            last = (offset + len(new_view) - 1) // segment_size
+            old_segments = {index: self._segment(blob_view, manifest, index)
+                            for index in range(first, min(last + 1, segments))}
+        # New chunks get mode and padding of the blob, so full segments still fill their slots exactly.
+        #  All of them are checked before the blob is changed
+        chunks = []
+        for index in range(first, last + 1):
+            segment_start = index * segment_size
+            data = bytearray(old_segments.pop(index, b""))
+            # Zeros between the old end of data and offset, then the new bytes
+            data.extend(bytes(min(segment_size, data_length - segment_start) - len(data)))
+            start = max(offset, segment_start)
+            end = min(offset + len(new_view), segment_start + segment_size)
+            if start < end:
+                data[start - segment_start:end - segment_start] = new_view[start - offset:end - offset]
+            chunk = self.cipher.encrypt(data, None, manifest.mode, compression=False, padding=manifest.padding)
+            # Every segment but the last one fills its slot, the last one takes up to a slot
+            if len(chunk) > manifest.slot or len(chunk) != manifest.slot and segment_start + segment_size < data_length:
+                raise EncryptionException("Could not update blob: segment {} doesn't fit its slot.", index)
+            chunks.append(chunk)
+        segment_ids = list(manifest.segment_ids)
+        ranges = []
+        tail_start = None
+        for index, chunk in enumerate(chunks, first):
+            chunk_start = manifest.segments_start + index * manifest.slot
+            if index < segments:
+                segment_ids[index] = bytes(chunk[:_segment_id_length])
+            else:
+                segment_ids.append(bytes(chunk[:_segment_id_length]))
+            if index < segments - 1:
+                blob[chunk_start:chunk_start + len(chunk)] = chunk
+                ranges.append((chunk_start, chunk_start + len(chunk)))
+            else:
+                # Last segment may change its length, everything after it is rewritten
+                if tail_start is None:
+                    tail_start = chunk_start
+                    del blob[chunk_start:]
+                blob += chunk
+        if tail_start is None:
+            tail_start = manifest.manifest_start
+            del blob[tail_start:]
+        self._write_manifest(blob, _Manifest(segment_size, data_length, segment_ids, manifest.segments_start,
+                                             manifest.slot, None, manifest.mode, manifest.padding))
+        ranges.append((tail_start, len(blob)))
+        return _merge(ranges)
+
+    def _segment(self, blob_view, manifest, index):
+        start = manifest.segments_start + index * manifest.slot
+        end = min(start + manifest.slot, manifest.manifest_start)
+        chunk = blob_view[start:end]
+        if chunk[:_segment_id_length] != manifest.segment_ids[index]:
+            raise MalformedChunkException("Could not decrypt blob: segment {} doesn't match the manifest.", index)
+        data = self.cipher._decrypt(chunk)[1]
+        segment_length = min(manifest.segment_size, manifest.data_length - index * manifest.segment_size)
+        if len(data) != segment_length:
+            raise MalformedChunkException("Could not decrypt blob: segment {} doesn't match the manifest.", index)
+        return data
+
+    def _write_manifest(self, blob, manifest):
+        padding_flags = _padding_flags.get(manifest.padding, _custom_padding_flags)
+        buckets = manifest.padding if padding_flags == _custom_padding_flags else ()
+        manifest = _manifest_header.pack(manifest.segment_size, manifest.slot, manifest.data_length,
+                                         _mode_flags[manifest.mode], padding_flags, len(buckets)) + \
+            b"".join(_bucket.pack(bucket) for bucket in buckets) + b"".join(manifest.segment_ids)
+        chunk = self.cipher.encrypt(manifest, compression=False)
+        blob += chunk
+        blob += _trailer.pack(len(chunk), blob_magic)
+
+    def _read_manifest(self, blob_view):
+        if len(blob_view) < _blob_header.size + _trailer.size or \
+                _blob_header.unpack_from(blob_view) != (blob_magic, blob_version):
+            raise MalformedChunkException("Could not decrypt blob: not a LocSec segmented blob "
+                                          "(or unsupported blob version).")
+        manifest_length, magic = _trailer.unpack_from(blob_view, len(blob_view) - _trailer.size)
+        manifest_start = len(blob_view) - _trailer.size - manifest_length
+        if magic != blob_magic or not 0 < manifest_length <= chunk_length_max or \
+                manifest_start < _blob_header.size:
+            raise MalformedChunkException("Could not decrypt blob: blob is truncated.")
+        manifest = self.cipher._decrypt(blob_view[manifest_start:manifest_start + manifest_length])[1]
+        if len(manifest) < _manifest_header.size:
+            raise MalformedChunkException("Could not decrypt blob: manifest is damaged.")
+        segment_size, slot, data_length, mode_flags, padding_flags, bucket_count = \
+            _manifest_header.unpack_from(manifest)
+        ids_start = _manifest_header.size + bucket_count * _bucket.size
+        # Custom padding has buckets, policies don't
+        known_padding = padding_flags == _custom_padding_flags if bucket_count else padding_flags in _flags_paddings
+        if mode_flags not in _flags_modes or not known_padding or ids_start > len(manifest) or \
+                (len(manifest) - ids_start) % _segment_id_length:
+            raise MalformedChunkException("Could not decrypt blob: manifest is damaged.")
+        padding = _flags_paddings.get(padding_flags)
+        if bucket_count:
+            try:
+                padding = _check_padding([_bucket.unpack_from(manifest, _manifest_header.size + i * _bucket.size)[0]
+                                          for i in range(bucket_count)])
+            except EncryptionException:
+                raise MalformedChunkException("Could not decrypt blob: manifest is damaged.")
+        segment_ids = [bytes(manifest[start:start + _segment_id_length])
+                       for start in range(ids_start, len(manifest), _segment_id_length)]
+        segments = -(-data_length // segment_size) if segment_size else -1
+        # Every segment but the last one fills its slot, the last one takes up to a slot
+        last_length = manifest_start - _blob_header.size - (segments - 1) * slot
+        if segments != len(segment_ids) or not 0 < slot <= chunk_length_max or \
+                (not 0 < last_length <= slot if segments else manifest_start != _blob_header.size):
+            raise MalformedChunkException("Could not decrypt blob: blob doesn't match its manifest.")
+        return _Manifest(segment_size, data_length, segment_ids, _blob_header.size, slot, manifest_start,
+                         _flags_modes[mode_flags], padding)
+
+
+class _Manifest:
+    __slots__ = ("segment_size", "data_length", "segment_ids", "segments_start", "slot", "manifest_start", "mode",
+                 "padding")
+
+    def __init__(self, segment_size, data_length, segment_ids, segments_start, slot, manifest_start, mode, padding):
+        self.segment_size = segment_size
+        self.data_length = data_length
+        self.segment_ids = segment_ids
+        self.segments_start = segments_start
+        self.slot = slot
+        self.manifest_start = manifest_start
+        self.mode = mode
+        self.padding = padding
+
+
+def _merge(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def encrypt_blob(data, encryption_key, segment_size=default_segment_size, mode=default_mode):
+    """
+    Encrypting data to a segmented blob (see SegmentedCipher)
+    :return: Segmented blob (bytearray)
+    """
+    return SegmentedCipher(encryption_key, segment_size, mode).encrypt(data)
+
+
+def decrypt_blob(blob, encryption_key):
+    """
+    Decrypting a segmented blob
+    :return: Decrypted data (bytearray)
+    """
+    return SegmentedCipher(encryption_key).decrypt(blob)
+
+
+def update(blob, offset, new_bytes, encryption_key):
+    """
+    Overwriting a part of the data of a segmented blob in place (see SegmentedCipher.update)
+    :return: Sorted list of changed (start, end) byte ranges of the blob
+    """
+    return SegmentedCipher(encryption_key).update(blob, offset, new_bytes)
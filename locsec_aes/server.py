@@ -0,0 +1,253 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import asyncio
+import os
+import socket
+import stat
+from concurrent.futures import ThreadPoolExecutor
+
+from locsec_aes import protocol
+from locsec_aes.encryption import LocSecCipher, _failure
+from locsec_aes.EncryptionException import EncryptionException, BadKeyException, OversizeException
+
+'''
+LocSec daemon: holds keys in one process and serves encrypt/decrypt requests of many processes
+ over a Unix domain socket (see locsec_aes.protocol, locsec_aes.client).
+Small requests are queued and processed in batches (one thread hop for many of them, whatever connections
+ they came from), big ones go to the thread pool one by one.
+Each connection has a limit of requests (and payload bytes) in flight and of responses buffered for the client:
+ its socket isn't read while one of them is hit.
+'''
+
+# Requests with payloads up to this size (in bytes) are batched
+default_inline_length = 65536
+default_batch_max = 256
+# Limits of requests in flight per connection (a request over the byte limit is allowed if it's the only one).
+# The byte limit also applies to responses that the client hasn't read yet
+default_connection_requests = protocol.max_in_flight
+default_connection_bytes = 2 * protocol.max_payload_length
+
+
+class LocSecServer:
+    """
+    Encryption daemon on a Unix domain socket
+    """
+
+    def __init__(self, path, keys, workers=None, inline_length=default_inline_length, batch_max=default_batch_max,
+                 connection_requests=default_connection_requests, connection_bytes=default_connection_bytes):
+        """
+        :param path: Path of the Unix domain socket (created with 0600 permissions)
+        :param keys: Dict {key ID: encryption key} (or a single encryption key, served with key ID 0)
+        :param workers: Amount of threads processing requests (CPU count if not specified)
+        :param inline_length: Requests with payloads up to this size (in bytes) are batched
+        :param batch_max: Max amount of requests in one batch
+        :param connection_requests: Max amount of requests in flight per connection
+        :param connection_bytes: Max size of payloads (and of unread responses, in bytes) in flight per connection
+        """
+        if not isinstance(keys, dict):
+            keys = {0: keys}
+        self.path = path
+        self._ciphers = {key_id: LocSecCipher(key) for key_id, key in keys.items()}
+        self.workers = workers or os.cpu_count() or 1
+        self.inline_length = inline_length
+        self.batch_max = batch_max
+        self.connection_requests = connection_requests
+        self.connection_bytes = connection_bytes
+        self.executor = ThreadPoolExecutor(self.workers)
+        self._server = None
+        self._pending = []
+        self._flush_scheduled = False
+        self._running_batches = 0
+        self._tasks = set()
+        self._connections = set()
+
+    async def start(self):
+        """
+        Starting to accept connections
+        """
+        # Only a stale socket is replaced, anything else at the path makes bind fail
+        try:
+            if stat.S_ISSOCK(os.lstat(self.path).st_mode):
+                os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # The socket is created with 0600 permissions: it's never open to other users, even for a moment
+            umask = os.umask(0o177)
+            try:
+                listener.bind(self.path)
+            finally:
+                os.umask(umask)
+            self._server = await asyncio.start_unix_server(self._handle, sock=listener)
+        except BaseException:
+            listener.close()
+            raise
+
+    async def serve_forever(self):
+        """
+        Serving until cancelled (starting first if needed)
+        """
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            self.close()
+
+    def run(self):
+        """
+        Serving in a new event loop until interrupted
+        """
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+
+    def close(self):
+        """
+        Stopping the server (dropping its connections) and removing its socket
+        """
+        for connection in self._connections:
+            connection.cancel()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        self.executor.shutdown(wait=False)
+
+    async def wait_closed(self):
+        """
+        Waiting for connections to be closed after close()
+        """
+        await asyncio.gather(*self._connections, *self._tasks, return_exceptions=True)
+
+    async def _handle(self, reader, writer):
+        connection = asyncio.current_task()
+        self._connections.add(connection)
+        peer = _Peer(writer)
+        writer.transport.set_write_buffer_limits(self.connection_bytes)
+        try:
+            while True:
+                # Not reading more while the client has too much in flight...
+                while (peer.requests >= self.connection_requests
+                       or peer.requests and peer.bytes >= self.connection_bytes):
+                    peer.freed.clear()
+                    await peer.freed.wait()
+                # ...or doesn't read its responses (waits only while the write buffer is over the limit)
+                await writer.drain()
+                header = await reader.readexactly(protocol.request_header.size)
+                length, request_id, operation, flags, key_id = protocol.request_header.unpack(header)
+                peer.requests += 1
+                if length > protocol.max_payload_length:
+                    # Payload can't be skipped safely, the connection is closed after the error
+                    peer.respond(((request_id, protocol.error_status(OversizeException()),
+                                         "Request is too big ({} bytes).".format(length).encode(), 0),))
+                    break
+                peer.bytes += length
+                request = (peer, request_id, operation, flags, key_id, await reader.readexactly(length))
+                if length <= self.inline_length:
+                    self._pending.append(request)
+                    if not self._flush_scheduled:
+                        self._flush_scheduled = True
+                        asyncio.get_running_loop().call_soon(self._flush)
+                else:
+                    self._spawn(self._run_batch([request]))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+
+    def _flush(self):
+        # Requests that came in the same loop iteration (or while the workers were busy) go in one batch
+        self._flush_scheduled = False
+        while self._pending and self._running_batches < self.workers:
+            batch = self._pending[:self.batch_max]
+            del self._pending[:self.batch_max]
+            self._running_batches += 1
+            self._spawn(self._run_batch(batch, True))
+
+    async def _run_batch(self, batch, small=False):
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, self._process_batch, batch)
+        finally:
+            if small:
+                self._running_batches -= 1
+                self._flush()
+        responses = {}
+        for (peer, request_id, *_, request_payload), (status, payload) in zip(batch, results):
+            responses.setdefault(peer, []).append((request_id, status, payload, len(request_payload)))
+        for peer, peer_responses in responses.items():
+            peer.respond(peer_responses)
+
+    def _spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _process_batch(self, batch):
+        return [self._process(operation, flags, key_id, payload) for _, _, operation, flags, key_id, payload in batch]
+
+    def _process(self, operation, flags, key_id, payload):
+        """
+        :return: Response status and payload
+        """
+        try:
+            cipher = self._ciphers.get(key_id)
+            if cipher is None:
+                raise BadKeyException("No key with ID {} on the server.", key_id)
+            if operation == protocol.operation_encrypt:
+                return protocol.status_ok, cipher.encrypt(payload, mode="gcm" if flags & protocol.flag_gcm else None)
+            if operation == protocol.operation_decrypt:
+                return protocol.status_ok, cipher._decrypt(memoryview(payload))[1]
+            raise EncryptionException("Unknown operation: {}.", operation)
+        except Exception as e:
+            error = _failure("serving", e)
+            return protocol.error_status(error), str(error).encode()
+
+
+class _Peer:
+    """
+    Writing side of a connection with its requests in flight
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.requests = 0
+        self.bytes = 0
+        self.freed = asyncio.Event()
+
+    def respond(self, responses):
+        """
+        Writing responses (buffered by the transport), their requests aren't in flight after that
+        :param responses: Request ID, status, payload and request payload length of each response
+        """
+        if not self.writer.is_closing():
+            for request_id, status, payload, _ in responses:
+                header = protocol.response_header.pack(len(payload), request_id, status)
+                if len(payload) <= default_inline_length:
+                    self.writer.write(header + payload)
+                else:
+                    self.writer.writelines((header, payload))
+        for *_, request_length in responses:
+            self.requests -= 1
+            self.bytes -= request_length
+        self.freed.set()
@@ -0,0 +1,214 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import struct
+
+from locsec_aes.encryption import LocSecCipher, data_size_max, chunk_length_max, default_mode, _failure
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException, OversizeException
+
+'''
+LocSec AES stream:
+
+ size       4        1         16          4               (frame length)                4                  4
+(bytes)  |======|=========|===========|=============|##############################|=============|  ...  |===========|
+            ^        ^          ^            ^                      ^                     ^                   ^
+          magic   stream     stream    frame length          LocSec chunk         next frame length   0 (end of stream)
+                  version      ID                     (one segment of the input)
+
+Every segment of the input is encrypted as a separate LocSec chunk (with its own IV and sha256),
+ so only one segment has to be held in memory at a time.
+Segments are encrypted with a prefix: stream ID (16 bytes), segment index (u64) and flags (u8, 0x01: final segment).
+ It is authenticated with the chunk, so frames can't be reordered, taken from another stream or cut off
+ (a stream has at least one segment, the last one is marked final).
+'''
+
+stream_magic = b"LSAS"
+stream_version = 2
+default_segment_size = 1048576  # 1 MiB
+
+_stream_header = struct.Struct(">4sB16s")
+_frame_header = struct.Struct(">I")
+_segment_prefix = struct.Struct(">16sQB")
+_final_segment = 0x01
+
+# Biggest segment size (a segment goes to a chunk with its prefix)
+segment_size_max = data_size_max - _segment_prefix.size
+
+# Biggest chunk encrypt_data can produce (used to reject garbage frame lengths before reading them)
+max_frame_length = chunk_length_max
+
+
+def encrypt_stream(src, dst, encryption_key, segment_size=default_segment_size, mode=default_mode, compression=None):
+    """
+    Encrypting a stream of any length segment by segment.
+    :param src: Readable binary file-like object with data to encrypt
+    :param dst: Writable binary file-like object for the encrypted stream
+    :param encryption_key: Encryption key
+    :param segment_size: Amount of data (in bytes) that goes to one LocSec chunk
+    :param mode: Encryption mode ("cbc" or "gcm")
+    :param compression: Compression method for segments before encryption ("zlib", "lzma", "bz2" or None)
+    :return: Amount of data (in bytes) read from src
+    """
+    _check_segment_size(segment_size)
+    cipher = LocSecCipher(encryption_key, mode, compression=compression)
+    stream_id, header = _new_stream_header()
+    dst.write(header)
+    total = 0
+    index = 0
+    segment = _read_exact(src, segment_size)
+    while True:
+        # Reading one segment ahead: the last one is marked final
+        next_segment = _read_exact(src, segment_size) if len(segment) == segment_size else b""
+        chunk = cipher.encrypt(_segment_data(stream_id, index, not next_segment, segment))
+        dst.write(_frame_header.pack(len(chunk)))
+        dst.write(chunk)
+        total += len(segment)
+        if not next_segment:
+            break
+        segment = next_segment
+        index += 1
+    dst.write(_frame_header.pack(0))
+    return total
+
+
+def decrypt_stream(src, dst, encryption_key):
+    """
+    Decrypting a stream created by encrypt_stream segment by segment.
+    :param src: Readable binary file-like object with the encrypted stream
+    :param dst: Writable binary file-like object for decrypted data
+    :param encryption_key: Encryption key
+    :return: Amount of data (in bytes) written to dst
+    """
+    stream_id = _parse_stream_header(_read_exact(src, _stream_header.size))
+    cipher = LocSecCipher(encryption_key)
+    total = 0
+    index = 0
+    final = False
+    while True:
+        frame_length = _parse_frame_header(_read_exact(src, _frame_header.size), final)
+        if frame_length == 0:
+            return total
+        chunk = _read_exact(src, frame_length, bytearray)
+        if len(chunk) < frame_length:
+            raise MalformedChunkException("Could not decrypt stream: stream is truncated.")
+        try:
+            segment = cipher.decrypt(chunk, return_raw=True)
+        except Exception as e:
+            raise _failure("decrypting stream", e)
+        final = _check_segment(segment, stream_id, index)
+        index += 1
+        total += len(segment)
+        dst.write(segment)
+
+
+def _check_segment_size(segment_size):
+    if not 0 < segment_size <= segment_size_max:
+        raise EncryptionException("Bad segment size: should be between 1 and {} bytes.".format(segment_size_max))
+
+
+def _new_stream_header():
+    """
+    :return: ID of a new stream and its header
+    """
+    stream_id = os.urandom(16)
+    return stream_id, _stream_header.pack(stream_magic, stream_version, stream_id)
+
+
+def _parse_stream_header(header):
+    """
+    :param header: Beginning of a stream (_stream_header.size bytes, less if the stream is shorter)
+    :return: Stream ID
+    """
+    if len(header) < _stream_header.size:
+        raise MalformedChunkException("Could not decrypt stream: stream header is missing.")
+    magic, version, stream_id = _stream_header.unpack(header)
+    if magic != stream_magic or version != stream_version:
+        raise MalformedChunkException("Could not decrypt stream: not a LocSec stream (or unsupported stream version).")
+    return stream_id
+
+
+def _parse_frame_header(frame_header, final):
+    """
+    :param frame_header: Frame header (_frame_header.size bytes, less if the stream is shorter)
+    :param final: Whether the final segment has been decrypted already
+    :return: Frame length (0 for the end of the stream)
+    """
+    if len(frame_header) < _frame_header.size:
+        raise MalformedChunkException("Could not decrypt stream: stream is truncated.")
+    (frame_length,) = _frame_header.unpack(frame_header)
+    if frame_length == 0:
+        if not final:
+            raise MalformedChunkException("Could not decrypt stream: stream is truncated (final segment is missing).")
+    elif final:
+        raise MalformedChunkException("Could not decrypt stream: frames after the final segment.")
+    elif frame_length > max_frame_length:
+        raise OversizeException("Could not decrypt stream: bad frame length ({} bytes).", frame_length)
+    return frame_length
+
+
+def _segment_data(stream_id, index, final, segment):
+    """
+    :param segment: Segment of the input (any object supporting buffer protocol)
+    :return: Segment with its prefix (data for a chunk)
+    """
+    data = bytearray(_segment_prefix.size + len(segment))
+    _segment_prefix.pack_into(data, 0, stream_id, index, _final_segment if final else 0)
+    data[_segment_prefix.size:] = segment
+    return data
+
+
+def _check_segment(data, stream_id, index):
+    """
+    Checking the prefix of a decrypted segment and removing it
+    :param data: Decrypted chunk of a frame (bytearray, the prefix is removed in place)
+    :param stream_id: ID of the stream
+    :param index: Index the segment should have
+    :return: Whether the segment is the final one
+    """
+    if len(data) < _segment_prefix.size:
+        raise MalformedChunkException("Could not decrypt stream: frame {} is not a stream segment.", index)
+    segment_stream_id, segment_index, flags = _segment_prefix.unpack_from(data)
+    if segment_stream_id != stream_id:
+        raise MalformedChunkException("Could not decrypt stream: frame {} is from another stream.", index)
+    if segment_index != index:
+        raise MalformedChunkException("Could not decrypt stream: frame {} is out of order (segment {}).",
+                                      index, segment_index)
+    del data[:_segment_prefix.size]
+    return bool(flags & _final_segment)
+
+
+def _read_exact(src, size, container=bytes):
+    """
+    Reading exactly size bytes from src (less only if the stream has ended)
+    :param src: Readable binary file-like object
+    :param size: Amount of data to read
+    :param container: Type of returned data (bytes or bytearray)
+    :return: Data read
+    """
+    data = src.read(size)
+    if data is None:
+        data = b""
+    if len(data) == size:
+        return container(data) if type(data) is not container else data
+    # Short read (pipes, sockets): collecting the rest
+    buffer = bytearray(data)
+    while len(buffer) < size:
+        data = src.read(size - len(buffer))
+        if not data:
+            break
+        buffer.extend(data)
+    return container(buffer) if container is not bytearray else buffer
@@ -0,0 +1,211 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import asyncio
+import io
+import os
+import socket
+import threading
+import time
+import pytest
+
+from locsec_aes import aio
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException
+from locsec_aes.encryption import encrypt_data, decrypt_data, data_size_max
+from locsec_aes.streaming import encrypt_stream, decrypt_stream, _stream_header, _frame_header
+
+enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+
+
+def test_aio_roundtrip():
+    async def main():
+        for data in ["small", bytearray(os.urandom(100)), bytearray(os.urandom(data_size_max))]:
+            encrypted = await aio.encrypt(data, enc_key)
+            assert decrypt_data(encrypted, enc_key, return_raw=not isinstance(data, str)) == data
+            assert await aio.decrypt(encrypted, enc_key, return_raw=not isinstance(data, str)) == data
+        assert await aio.decrypt(await aio.encrypt({"a": [1]}, enc_key, typed=True, mode="gcm"), enc_key) == {"a": [1]}
+        with pytest.raises(EncryptionException):
+            await aio.decrypt(encrypt_data("data", enc_key), "some other key")
+    asyncio.run(main())
+
+
+def test_aio_max_in_flight():
+    cipher = aio.AsyncCipher(enc_key, max_in_flight=2, inline_length=1000)
+    lock = threading.Lock()
+    counts = {"now": 0, "max": 0}
+    encrypt = cipher.cipher.encrypt
+
+    def counting_encrypt(*args, **kwargs):
+        with lock:
+            counts["now"] += 1
+            counts["max"] = max(counts["max"], counts["now"])
+        time.sleep(0.01)
+        try:
+            return encrypt(*args, **kwargs)
+        finally:
+            with lock:
+                counts["now"] -= 1
+
+    cipher.cipher.encrypt = counting_encrypt
+
+    async def main():
+        chunks = await asyncio.gather(*(cipher.encrypt(bytearray(2000)) for _ in range(10)))
+        assert all(decrypt_data(chunk, enc_key, return_raw=True) == bytearray(2000) for chunk in chunks)
+        # Small data doesn't go through the semaphore (or the executor)
+        await cipher.encrypt(bytearray(100))
+
+    # Every event loop gets its own semaphore
+    asyncio.run(main())
+    asyncio.run(main())
+    assert counts["max"] == 2
+    with pytest.raises(EncryptionException):
+        aio.AsyncCipher(enc_key, max_in_flight=0)
+
+
+_unused_stream_ends = []
+
+
+async def _stream_pair():
+    # Connected writer -> reader (unused ends are kept alive, their writers close the sockets when collected)
+    left, right = socket.socketpair()
+    left_reader, writer = await asyncio.open_connection(sock=left)
+    reader, right_writer = await asyncio.open_connection(sock=right)
+    _unused_stream_ends.append((left_reader, right_writer))
+    return reader, writer
+
+
+def _reader_with(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+@pytest.mark.parametrize("size", [0, 100, 3 * 1048576 + 5])
+def test_aio_streams(size):
+    data = os.urandom(size)
+
+    async def main():
+        encrypted_reader, encrypted_writer = await _stream_pair()
+        decrypted_reader, decrypted_writer = await _stream_pair()
+
+        async def encrypt_side():
+            assert await aio.encrypt_stream(_reader_with(data), encrypted_writer, enc_key, mode="gcm") == size
+            encrypted_writer.close()
+
+        async def decrypt_side():
+            cipher = aio.AsyncCipher(enc_key)
+            assert await aio.decrypt_stream(encrypted_reader, decrypted_writer, cipher) == size
+            decrypted_writer.close()
+
+        results = await asyncio.gather(encrypt_side(), decrypt_side(), decrypted_reader.read())
+        assert results[2] == data
+    asyncio.run(main())
+
+
+def test_aio_streams_compatible():
+    data = os.urandom(1048576 + 5)
+    encrypted = io.BytesIO()
+    encrypt_stream(io.BytesIO(data), encrypted, enc_key)
+
+    async def main():
+        reader, writer = await _stream_pair()
+        decrypted = asyncio.ensure_future(reader.read())
+        await aio.decrypt_stream(_reader_with(encrypted.getvalue()), writer, enc_key)
+        writer.close()
+        return await decrypted
+    assert asyncio.run(main()) == data
+
+    async def main():
+        reader, writer = await _stream_pair()
+        encrypted = asyncio.ensure_future(reader.read())
+        await aio.encrypt_stream(_reader_with(data), writer, enc_key, compression="zlib")
+        writer.close()
+        return await encrypted
+    decrypted = io.BytesIO()
+    decrypt_stream(io.BytesIO(asyncio.run(main())), decrypted, enc_key)
+    assert decrypted.getvalue() == data
+
+
+def test_aio_stream_truncated():
+    encrypted = io.BytesIO()
+    encrypt_stream(io.BytesIO(os.urandom(1000)), encrypted, enc_key)
+
+    async def main():
+        reader, writer = await _stream_pair()
+        await aio.decrypt_stream(_reader_with(encrypted.getvalue()[:-10]), writer, enc_key)
+    with pytest.raises(EncryptionException):
+        asyncio.run(main())
+
+
+def test_aio_stream_cut_at_frame_boundary():
+    encrypted = io.BytesIO()
+    encrypt_stream(io.BytesIO(os.urandom(10000)), encrypted, enc_key, 4096)
+    stream = encrypted.getvalue()
+    (first_frame_length,) = _frame_header.unpack_from(stream, _stream_header.size)
+    first_frame_end = _stream_header.size + _frame_header.size + first_frame_length
+
+    async def main():
+        reader, writer = await _stream_pair()
+        await aio.decrypt_stream(_reader_with(stream[:first_frame_end] + _frame_header.pack(0)), writer, enc_key)
+    with pytest.raises(MalformedChunkException):
+        asyncio.run(main())
+
+
+def _max_loop_lag(workload):
+    # Longest delay of a 1 ms ticker while workload runs on the same event loop
+    async def main():
+        lags = []
+        done = asyncio.Event()
+
+        async def ticker():
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lags.append(time.perf_counter() - started - 0.001)
+
+        ticking = asyncio.ensure_future(ticker())
+        await asyncio.sleep(0.01)
+        await workload()
+        done.set()
+        await ticking
+        return max(lags)
+    return asyncio.run(main())
+
+
+def test_aio_event_loop_lag():
+    big = bytearray(os.urandom(data_size_max))
+    # Not a buffer: its size isn't known before encoding
+    big_list = list(range(500000))
+    small = [bytearray(os.urandom(200)) for _ in range(200)]
+
+    async def blocking():
+        for _ in range(4):
+            decrypt_data(encrypt_data(big, enc_key), enc_key, return_raw=True)
+        for typed in (False, True):
+            encrypt_data(big_list, enc_key, typed=typed)
+        for item in small:
+            decrypt_data(encrypt_data(item, enc_key), enc_key, return_raw=True)
+
+    async def non_blocking():
+        async def one(data):
+            return await aio.decrypt(await aio.encrypt(data, enc_key), enc_key, return_raw=True)
+        await asyncio.gather(*(one(big) for _ in range(4)), *(one(item) for item in small),
+                             *(aio.encrypt(big_list, enc_key, typed=typed) for typed in (False, True)))
+
+    blocking_lag = _max_loop_lag(blocking)
+    non_blocking_lag = _max_loop_lag(non_blocking)
+    assert non_blocking_lag < blocking_lag / 3
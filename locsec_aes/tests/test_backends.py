@@ -0,0 +1,91 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import pickle
+import pytest
+
+from locsec_aes import backends
+from locsec_aes.EncryptionException import EncryptionException
+from locsec_aes.encryption import LocSecCipher, data_size_max
+
+enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+available = backends.available_backends()
+cross_backend = pytest.mark.skipif(len(available) < 2, reason="only one AES backend is installed")
+
+
+@pytest.fixture
+def restore_backend():
+    selected = backends._selected
+    yield
+    backends._selected = selected
+
+
+@pytest.mark.parametrize("backend", available)
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+def test_backend_roundtrip(backend, mode):
+    cipher = LocSecCipher(enc_key, mode, backend=backend)
+    assert cipher.backend.name == backend
+    for size in [0, 1, 4096, 70000]:
+        data = bytearray(os.urandom(size))
+        encrypted = cipher.encrypt(data)
+        assert cipher.decrypt(encrypted, return_raw=True) == data
+        assert cipher.inspect(encrypted).data_length == size
+        assert cipher.verify(encrypted)
+        encrypted[-1] ^= 1
+        assert cipher.verify(encrypted) == (mode == "cbc")
+
+
+@cross_backend
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+@pytest.mark.parametrize("size", [0, 15, 16, 4097, 3000000])
+def test_cross_backend_identical(mode, size):
+    data = bytearray(os.urandom(size))
+    initial_vector = os.urandom(16 if mode == "cbc" else 12)
+    ciphers = [LocSecCipher(enc_key, mode, backend=backend) for backend in available]
+    chunks = [cipher.encrypt(data, initial_vector) for cipher in ciphers]
+    assert all(chunk == chunks[0] for chunk in chunks)
+    # Second chunk goes through an already used (chained) CBC encryptor
+    chunks = [cipher.encrypt(data, initial_vector) for cipher in ciphers]
+    assert all(chunk == chunks[0] for chunk in chunks)
+    for cipher in ciphers:
+        assert cipher.decrypt(chunks[0], return_raw=True) == data
+
+
+def test_set_backend(restore_backend, monkeypatch):
+    backends.set_backend("pycryptodomex")
+    assert LocSecCipher(enc_key).backend.name == "pycryptodomex"
+    backends.set_backend(None)
+    monkeypatch.setenv(backends.backend_env_var, "pycryptodomex")
+    assert LocSecCipher(enc_key).backend.name == "pycryptodomex"
+    monkeypatch.delenv(backends.backend_env_var)
+    assert backends.get_backend().name in available
+    with pytest.raises(EncryptionException):
+        backends.set_backend("openssl")
+    with pytest.raises(EncryptionException):
+        LocSecCipher(enc_key, backend="openssl")
+
+
+def test_backend_pickled():
+    for backend in available:
+        assert pickle.loads(pickle.dumps(LocSecCipher(enc_key, backend=backend))).backend.name == backend
+
+
+@cross_backend
+def test_backend_big_data():
+    data = bytearray(os.urandom(data_size_max))
+    chunks = [LocSecCipher(enc_key, backend=backend).encrypt(data, bytes(16)) for backend in available]
+    assert chunks[0] == chunks[1]
@@ -0,0 +1,77 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+from locsec_aes.EncryptionException import EncryptionException
+from locsec_aes.batch import encrypt_many, decrypt_many
+from locsec_aes.encryption import decrypt_data, data_size_max
+
+enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+test_items = ["item {}".format(i) for i in range(100)]
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_many_order(executor):
+    encrypted = encrypt_many(test_items, enc_key, workers=4, executor=executor)
+    assert [decrypt_data(chunk, enc_key) for chunk in encrypted] == test_items
+    assert decrypt_many(encrypted, enc_key, workers=4, executor=executor) == test_items
+
+
+def test_many_serial():
+    encrypted = encrypt_many(test_items, enc_key, workers=1)
+    assert decrypt_many(encrypted, enc_key, workers=1) == test_items
+
+
+def test_many_existing_executor():
+    with ThreadPoolExecutor(2) as pool:
+        encrypted = encrypt_many(iter(test_items), enc_key, executor=pool, chunksize=7)
+        assert decrypt_many(encrypted, enc_key, return_raw=True, executor=pool) == \
+            [bytearray(item, "utf-8") for item in test_items]
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_many_item_errors(executor):
+    items = list(test_items)
+    items[3] = {1, 2}
+    items[50] = bytearray(data_size_max + 1)
+    encrypted = encrypt_many(items, enc_key, workers=4, executor=executor)
+    assert isinstance(encrypted[3], EncryptionException)
+    assert isinstance(encrypted[50], EncryptionException)
+    encrypted[3] = bytearray(os.urandom(272))
+    encrypted[50] = bytearray(encrypted[51])
+    encrypted[50][40] ^= 1
+    decrypted = decrypt_many(encrypted, enc_key, workers=4, executor=executor)
+    assert isinstance(decrypted[3], EncryptionException)
+    assert isinstance(decrypted[50], EncryptionException)
+    assert [item for i, item in enumerate(decrypted) if i not in (3, 50)] == \
+        [item for i, item in enumerate(test_items) if i not in (3, 50)]
+
+
+def test_many_empty():
+    assert encrypt_many([], enc_key) == []
+
+
+def test_many_bad_executor():
+    with pytest.raises(EncryptionException):
+        encrypt_many(test_items, enc_key, workers=2, executor="fiber")
+
+
+def test_many_bad_key():
+    with pytest.raises(EncryptionException):
+        encrypt_many(test_items, "short")
@@ -0,0 +1,54 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import json
+
+from locsec_aes.benchmarks import suite
+from locsec_aes.benchmarks.__main__ import main
+from locsec_aes.benchmarks.timing import print_table
+
+
+def test_suite_case():
+    results = suite.run_suite("encrypt/size/100", min_time=0.01)
+    assert list(results) == ["encrypt/size/100"]
+    result = results["encrypt/size/100"]
+    assert result.ops_s > 0 and result.p50_us <= result.p99_us and result.peak_kib > 0
+
+
+def test_suite_baseline(tmp_path):
+    baseline_path = str(tmp_path / "baseline.json")
+    assert main(["-k", "decrypt/type/int", "-t", "0.01", "--save", baseline_path]) == 0
+    assert main(["-k", "decrypt/type/int", "-t", "0.01", "--compare", baseline_path, "--threshold", "0.9"]) == 0
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    baseline["results"]["decrypt/type/int"]["ops_s"] *= 100
+    with open(baseline_path, "w") as baseline_file:
+        json.dump(baseline, baseline_file)
+    assert main(["-k", "decrypt/type/int", "-t", "0.01", "--compare", baseline_path]) == 1
+
+
+def test_suite_no_match(capsys):
+    assert main(["-k", "no such case"]) == 2
+    assert "No cases matched" in capsys.readouterr().err
+    print_table(["case", "ops/s"], [])
+    assert capsys.readouterr().out.strip() == "case  ops/s"
+
+
+def test_suite_compare():
+    baseline = {"a": suite.Result(1000, 1, 10, 20, 100), "b": suite.Result(1000, 1, 10, 20, 100)}
+    results = {"a": suite.Result(900, 1, 10, 20, 100), "b": suite.Result(800, 1, 10, 20, 200),
+               "c": suite.Result(1, 1, 1, 1, 1)}
+    assert suite.compare(results, baseline, 0.15) == [("b", "ops_s", 1000, 800), ("b", "peak_kib", 100, 200)]
@@ -0,0 +1,118 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import io
+import os
+import pytest
+
+from locsec_aes import cli
+from locsec_aes.EncryptionException import EncryptionException, HashMismatchException
+from locsec_aes.encryption import data_size_max
+from locsec_aes.streaming import decrypt_stream, _stream_header, _frame_header
+
+enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+
+
+def _make_tree(root):
+    files = {"a.bin": os.urandom(100000), "empty": b"", os.path.join("sub", "b.txt"): b"hello\n",
+             os.path.join("sub", "deeper", "c.bin"): os.urandom(5000)}
+    for name, data in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return files
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+def test_tree_roundtrip(tmp_path, workers, mode):
+    files = _make_tree(tmp_path / "src")
+    stats = cli.encrypt_path(str(tmp_path / "src"), str(tmp_path / "enc"), enc_key, mode, "zlib", 4096, workers)
+    assert stats.files == 4 and stats.bytes == sum(len(data) for data in files.values())
+    assert sorted(os.listdir(tmp_path / "enc" / "sub")) == ["b.txt.lsa", "deeper"]
+    # Encrypted files are LocSec streams
+    output = io.BytesIO()
+    with open(tmp_path / "enc" / "a.bin.lsa", "rb") as src:
+        decrypt_stream(src, output, enc_key)
+    assert output.getvalue() == files["a.bin"]
+    cli.decrypt_path(str(tmp_path / "enc"), str(tmp_path / "dec"), enc_key, workers)
+    for name, data in files.items():
+        assert (tmp_path / "dec" / name).read_bytes() == data
+
+
+def test_file_bigger_than_data_size_max(tmp_path):
+    data = os.urandom(data_size_max + 12345)
+    (tmp_path / "big").write_bytes(data)
+    os.mkdir(tmp_path / "out")
+    cli.encrypt_path(str(tmp_path / "big"), str(tmp_path / "out"), enc_key, workers=1)
+    cli.decrypt_path(str(tmp_path / "out" / "big.lsa"), str(tmp_path / "big.dec"), enc_key, workers=1)
+    assert (tmp_path / "big.dec").read_bytes() == data
+
+
+def test_truncated_file(tmp_path):
+    (tmp_path / "data").write_bytes(os.urandom(3 * 4096))
+    cli.encrypt_path(str(tmp_path / "data"), str(tmp_path / "data.lsa"), enc_key, segment_size=4096, workers=1)
+    stream = (tmp_path / "data.lsa").read_bytes()
+    # Cut after the first frame, with a proper end of the stream
+    (first_frame_length,) = _frame_header.unpack_from(stream, _stream_header.size)
+    first_frame_end = _stream_header.size + _frame_header.size + first_frame_length
+    (tmp_path / "cut.lsa").write_bytes(stream[:first_frame_end] + _frame_header.pack(0))
+    with pytest.raises(EncryptionException):
+        cli.decrypt_path(str(tmp_path / "cut.lsa"), str(tmp_path / "cut"), enc_key, workers=1)
+    assert not (tmp_path / "cut").exists()
+
+
+def test_resume(tmp_path):
+    _make_tree(tmp_path / "src")
+    cli.encrypt_path(str(tmp_path / "src"), str(tmp_path / "enc"), enc_key, workers=1)
+    # Interrupted run: one output is missing, another input has changed since, a partial file is left
+    os.remove(tmp_path / "enc" / "empty.lsa")
+    (tmp_path / "src" / "a.bin").write_bytes(b"changed")
+    os.utime(tmp_path / "src" / "a.bin", ns=(0, 10 ** 18))
+    (tmp_path / "enc" / "sub" / "b.txt.lsa.part").write_bytes(b"partial")
+    stats = cli.encrypt_path(str(tmp_path / "src"), str(tmp_path / "enc"), enc_key, workers=1, resume=True)
+    assert (stats.files, stats.skipped) == (2, 2)
+    cli.decrypt_path(str(tmp_path / "enc"), str(tmp_path / "dec"), enc_key, workers=1)
+    assert (tmp_path / "dec" / "a.bin").read_bytes() == b"changed"
+    assert not os.path.exists(tmp_path / "dec" / "sub" / "b.txt.lsa")
+
+
+def test_failed_file_leaves_no_output(tmp_path):
+    (tmp_path / "file").write_bytes(os.urandom(10000))
+    cli.encrypt_path(str(tmp_path / "file"), str(tmp_path / "file.lsa"), enc_key, workers=1)
+    tampered = bytearray((tmp_path / "file.lsa").read_bytes())
+    tampered[1000] ^= 1
+    (tmp_path / "file.lsa").write_bytes(tampered)
+    with pytest.raises(HashMismatchException):
+        cli.decrypt_path(str(tmp_path / "file.lsa"), str(tmp_path / "file.dec"), enc_key, workers=1)
+    assert not os.path.exists(tmp_path / "file.dec") and not os.path.exists(tmp_path / "file.dec.part")
+    with pytest.raises(EncryptionException):
+        cli.decrypt_path(str(tmp_path / "file"), str(tmp_path / "file.dec"), enc_key, workers=1)
+
+
+def test_main(tmp_path, monkeypatch, capsys):
+    (tmp_path / "file").write_bytes(b"data")
+    key_file = tmp_path / "key"
+    key_file.write_text(enc_key + "\n")
+    assert cli.main(["encrypt", str(tmp_path / "file"), str(tmp_path / "file.lsa"), "-k", str(key_file),
+                     "-m", "gcm", "-j", "1"]) == 0
+    assert "Encrypted 1 files" in capsys.readouterr().err
+    monkeypatch.setenv(cli.key_env, enc_key)
+    assert cli.main(["decrypt", str(tmp_path / "file.lsa"), str(tmp_path / "out"), "-q"]) == 0
+    assert (tmp_path / "out").read_bytes() == b"data"
+    monkeypatch.setenv(cli.key_env, enc_key + "x")
+    assert cli.main(["decrypt", str(tmp_path / "file.lsa"), str(tmp_path / "out2"), "-q"]) == 1
+    assert "locsec-aes:" in capsys.readouterr().err
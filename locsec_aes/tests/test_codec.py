@@ -0,0 +1,140 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import collections
+import json
+import pickle
+import pytest
+
+from locsec_aes import codec
+from locsec_aes.EncryptionException import EncryptionException
+from locsec_aes.batch import encrypt_many, decrypt_many
+from locsec_aes.encryption import LocSecCipher, encrypt_data, decrypt_data
+
+enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+@pytest.mark.parametrize("data", [b"bytes \x00\xff", bytearray(b"bytearray"), "string", "", True, False,
+                                  0, -1, 2 ** 63 - 1, -2 ** 63, 2 ** 100, -2 ** 200, 0.1, float("inf"), None,
+                                  [1, "two", [3.0, None]], {"key": {"nested": [1, 2]}, "flag": True},
+                                  {1: (b"\x00", 2 ** 70), (1, 2): {"set"}}, (1, "2"), {1, 2}, frozenset("ab"),
+                                  [bytearray(b"x"), float("-inf")]])
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+@pytest.mark.parametrize("pickled", [True, False])
+def test_typed_roundtrip(data, mode, pickled, monkeypatch):
+    monkeypatch.setattr(codec, "pickle_containers", pickled)
+    decrypted = decrypt_data(encrypt_data(data, enc_key, mode=mode, typed=True), enc_key)
+    assert type(decrypted) is type(data)
+    assert decrypted == data
+
+
+def test_typed_raw():
+    chunk = encrypt_data(1, enc_key, typed=True)
+    assert decrypt_data(chunk, enc_key, return_raw=True) == bytearray(b"\x00" * 7 + b"\x01")
+
+
+def test_untyped_unchanged():
+    assert decrypt_data(encrypt_data(5, enc_key), enc_key) == "5"
+    assert decrypt_data(encrypt_data({"a": 1}, enc_key), enc_key) == json.dumps({"a": 1})
+
+
+def test_typed_cipher():
+    cipher = LocSecCipher(enc_key, typed=True)
+    assert cipher.decrypt(cipher.encrypt(1.5)) == 1.5
+    assert cipher.decrypt(cipher.encrypt(15, typed=False)) == "15"
+    assert decrypt_many(encrypt_many([1, "1", [1]], enc_key, typed=True), enc_key) == [1, "1", [1]]
+
+
+def _register_point(tag):
+    codec.register_codec(Point, tag, lambda point: codec._float64.pack(point.x) + codec._float64.pack(point.y),
+                         lambda data: Point(*(codec._float64.unpack_from(data, offset)[0] for offset in (0, 8))))
+
+
+def test_custom_codec():
+    _register_point(200)
+    try:
+        point = decrypt_data(encrypt_data(Point(1.0, -2.5), enc_key, typed=True), enc_key)
+        assert (type(point), point.x, point.y) == (Point, 1.0, -2.5)
+        # Custom types inside containers
+        decrypted = decrypt_data(encrypt_data({"points": [Point(1.0, 2.0), (Point(3.0, 4.0),)]}, enc_key, typed=True),
+                                 enc_key)
+        inner = decrypted["points"]
+        assert [(point.x, point.y) for point in (inner[0], inner[1][0])] == [(1.0, 2.0), (3.0, 4.0)]
+        with pytest.raises(EncryptionException):
+            codec.register_codec(Point, 201, bytes, bytes)
+    finally:
+        codec.unregister_codec(200)
+    with pytest.raises(EncryptionException):
+        encrypt_data(Point(1, 2), enc_key, typed=True)
+
+
+def test_container_without_codec():
+    with pytest.raises(EncryptionException):
+        encrypt_data([1, Point(1, 2)], enc_key, typed=True)
+
+
+def test_container_format(monkeypatch):
+    # Built-in types only: pickled (with no globals)
+    encoded = codec.encode([1, "a", (None, {2.5}), {1: b"x"}])[1]
+    assert encoded[0] == codec.container_pickled and pickle.loads(encoded[1:]) == [1, "a", (None, {2.5}), {1: b"x"}]
+    bad_pickles = [pickle.dumps(collections.OrderedDict()), pickle.dumps([1], 0)[:-2], pickle.dumps([1]) + b"\x00",
+                   pickle.dumps((1,)), b"\x80\x04cos\nsystem\n(S'true'\ntR."]
+    for bad in bad_pickles:
+        with pytest.raises(EncryptionException):
+            codec.decode(8, bytearray(b"\x02" + bad))
+    # Other types: header, then tag, length and encoding of every item, containers inside can be pickled
+    _register_point(200)
+    try:
+        encoded = codec.encode([Point(1.0, 2.0), [3, (4,)]])[1]
+        assert encoded[0] == codec.container_itemized and codec.decode(8, bytearray(encoded))[1] == [3, (4,)]
+        # Inner list of built-in types is pickled
+        assert encoded.endswith(codec.encode([3, (4,)])[1])
+    finally:
+        codec.unregister_codec(200)
+    monkeypatch.setattr(codec, "pickle_containers", False)
+    assert codec.encode([1, "a"]) == (8, b"\x01\x00\x00\x00\x02" + b"\x05\x00\x00\x00\x08" + b"\x00" * 7 + b"\x01" +
+                                      b"\x03\x00\x00\x00\x01a")
+    assert codec.encode({"k": None})[1] == b"\x01\x00\x00\x00\x02\x03\x00\x00\x00\x01k\x07\x00\x00\x00\x00"
+    encoded = bytearray(codec.encode([1, [2], {"a": {3}}])[1])
+    for bad in (encoded[:-1], encoded + b"\x00", b"\x03" + encoded[1:], b"\x01\x00\x00\x00\x01\x08\x00\x00"):
+        with pytest.raises(EncryptionException):
+            codec.decode(8, bytearray(bad))
+    with pytest.raises(EncryptionException):
+        codec.decode(11, bytearray(codec.encode([[1]])[1]))
+
+
+def test_custom_codec_bad_tag():
+    with pytest.raises(EncryptionException):
+        codec.register_codec(Point, 5, bytes, bytes)
+    with pytest.raises(EncryptionException):
+        codec.register_codec(Point, 256, bytes, bytes)
+    with pytest.raises(EncryptionException):
+        codec.unregister_codec(5)
+
+
+def test_unknown_tag():
+    codec.register_codec(Point, 250, lambda point: b"point", lambda data: Point(0, 0))
+    chunk = encrypt_data(Point(0, 0), enc_key, typed=True)
+    codec.unregister_codec(250)
+    with pytest.raises(EncryptionException):
+        decrypt_data(chunk, enc_key)
+    assert decrypt_data(chunk, enc_key, return_raw=True) == bytearray(b"point")
@@ -0,0 +1,103 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import io
+import json
+import os
+import pytest
+
+from locsec_aes import compression
+from locsec_aes.EncryptionException import EncryptionException
+from locsec_aes.encryption import LocSecCipher, encrypt_data, decrypt_data, decrypt_into, decrypted_size, \
+    encrypted_size, data_size_max
+from locsec_aes.streaming import encrypt_stream, decrypt_stream
+
+enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+log_data = "".join("2022-05-{:02} INFO request {} from 10.0.0.{} took {} ms\n".format(i % 28 + 1, i, i % 256, i % 97)
+                   for i in range(5000))
+
+
+@pytest.mark.parametrize("method", compression.methods)
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+def test_compressed_roundtrip(method, mode):
+    encrypted = encrypt_data(log_data, enc_key, mode=mode, compression=method)
+    assert len(encrypted) < encrypted_size(len(log_data), mode) / 5
+    assert decrypt_data(encrypted, enc_key) == log_data
+    assert decrypted_size(encrypted, enc_key) == len(log_data)
+
+
+def test_compressed_levels():
+    cipher = LocSecCipher(enc_key, compression="zlib", compression_level=1)
+    fast = cipher.encrypt(log_data)
+    best = cipher.encrypt(log_data, compression_level=9)
+    assert len(best) <= len(fast)
+    assert cipher.decrypt(fast) == cipher.decrypt(best) == log_data
+    assert len(cipher.encrypt(log_data, compression=False)) == encrypted_size(len(log_data))
+
+
+def test_compressed_typed():
+    data = {"records": [{"id": i, "name": "record"} for i in range(1000)]}
+    encrypted = encrypt_data(data, enc_key, typed=True, compression="lzma")
+    assert decrypt_data(encrypted, enc_key) == data
+
+
+def test_compressed_decrypt_into():
+    encrypted = encrypt_data(log_data, enc_key, compression="zlib")
+    output = bytearray(len(log_data))
+    assert decrypt_into(encrypted, output, enc_key) == len(log_data)
+    assert output.decode() == log_data
+    with pytest.raises(EncryptionException):
+        decrypt_into(encrypted, bytearray(len(log_data) - 1), enc_key)
+
+
+@pytest.mark.parametrize("size", [10, 4096, data_size_max])
+def test_incompressible_skipped(size):
+    data = bytearray(os.urandom(size))
+    encrypted = encrypt_data(data, enc_key, compression="lzma")
+    assert len(encrypted) == encrypted_size(size)
+    assert decrypt_data(encrypted, enc_key, return_raw=True) == data
+
+
+def test_compressed_stream():
+    data = log_data.encode() * 100
+    encrypted = io.BytesIO()
+    encrypt_stream(io.BytesIO(data), encrypted, enc_key, compression="zlib")
+    assert len(encrypted.getvalue()) < len(data) / 5
+    decrypted = io.BytesIO()
+    decrypt_stream(io.BytesIO(encrypted.getvalue()), decrypted, enc_key)
+    assert decrypted.getvalue() == data
+
+
+def test_compressed_tampered():
+    encrypted = encrypt_data(log_data, enc_key, compression="zlib")
+    encrypted[300] ^= 1
+    with pytest.raises(EncryptionException):
+        decrypt_data(encrypted, enc_key)
+
+
+def test_decompression_length_mismatch():
+    data = json.dumps(list(range(1000))).encode()
+    flags, compressed = compression.compress(memoryview(data), "bz2")
+    assert compression.decompress(flags, compressed, len(data)) == data
+    with pytest.raises(EncryptionException):
+        compression.decompress(flags, compressed, len(data) - 1)
+    with pytest.raises(EncryptionException):
+        compression.decompress(flags, compressed, len(data) + 1)
+
+
+def test_unknown_method():
+    with pytest.raises(EncryptionException):
+        encrypt_data(log_data, enc_key, compression="zstd")
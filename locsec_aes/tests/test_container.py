@@ -0,0 +1,142 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import io
+import os
+import random
+import pytest
+
+from locsec_aes import container as container_module
+from locsec_aes.container import ContainerWriter, ContainerReader, _container_header, _trailer
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException
+from locsec_aes.encryption import encrypted_size
+
+enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+
+
+def _container(data, chunk_size=1000, **options):
+    file = io.BytesIO()
+    with ContainerWriter(file, enc_key, chunk_size, **options) as writer:
+        # Writes of all sizes: smaller and bigger than a chunk
+        position = 0
+        for length in (1, 999, 1, 2500, 7):
+            writer.write(data[position:position + length])
+            position += length
+        writer.write(data[position:])
+    file.seek(0)
+    return file
+
+
+@pytest.mark.parametrize("options", [{}, {"mode": "gcm"}, {"compression": "zlib"}])
+def test_random_reads(options):
+    data = os.urandom(23456) if not options.get("compression") else bytes(range(256)) * 100
+    reader = ContainerReader(_container(data, **options), enc_key, cache_chunks=4)
+    assert reader.size == len(data)
+    assert reader.read() == data
+    rng = random.Random(1)
+    for _ in range(200):
+        start = rng.randrange(len(data) + 10)
+        length = rng.randrange(3000)
+        reader.seek(start)
+        assert reader.read(length) == data[start:start + length]
+        assert reader.tell() == min(start + length, len(data)) if start <= len(data) else start
+    reader.seek(-5, io.SEEK_END)
+    assert reader.read() == data[-5:]
+    assert reader.cache_hits > 0 and len(reader._cache) <= 4
+
+
+def test_reads_decrypt_only_needed_chunks():
+    data = os.urandom(100000)
+    reader = ContainerReader(_container(data), enc_key)
+    reader.seek(50500)
+    assert reader.read(1000) == data[50500:51500]
+    assert reader.cache_misses == 2
+    reader.seek(50600)
+    reader.read(100)
+    assert reader.cache_misses == 2
+
+
+def test_empty_and_file_path(tmp_path):
+    path = str(tmp_path / "container")
+    with ContainerWriter(path, enc_key):
+        pass
+    with ContainerReader(path, enc_key) as reader:
+        assert reader.size == 0 and reader.read() == b""
+    with ContainerWriter(path, enc_key) as writer:
+        writer.write(b"data")
+    with ContainerReader(path, enc_key) as reader:
+        assert reader.read(100) == b"data"
+
+
+def test_damaged_containers():
+    data = os.urandom(5000)
+    container = _container(data).getvalue()
+    with pytest.raises(MalformedChunkException):
+        ContainerReader(io.BytesIO(container[:-3]), enc_key)
+    with pytest.raises(MalformedChunkException):
+        ContainerReader(io.BytesIO(b"garbage" + container[7:]), enc_key)
+    with pytest.raises(EncryptionException):
+        ContainerReader(io.BytesIO(container), enc_key + "x")
+    # Chunks swapped: the index doesn't match them
+    chunk_length = encrypted_size(1000)
+    start = _container_header.size
+    first, second = slice(start, start + chunk_length), slice(start + chunk_length, start + 2 * chunk_length)
+    swapped = bytearray(container)
+    swapped[first], swapped[second] = container[second], container[first]
+    reader = ContainerReader(io.BytesIO(bytes(swapped)), enc_key)
+    with pytest.raises(MalformedChunkException):
+        reader.read(100)
+
+
+def test_trailer_is_checked(monkeypatch):
+    data = os.urandom(10000)
+    container = _container(data).getvalue()
+    trailer_start = len(container) - _trailer.size - 4
+    index_offset, frames = _trailer.unpack_from(container, trailer_start)
+    for bad_frames in (0, frames + 1):
+        rewritten = container[:trailer_start] + _trailer.pack(index_offset, bad_frames) + container[-4:]
+        with pytest.raises(MalformedChunkException):
+            ContainerReader(io.BytesIO(rewritten), enc_key)
+    # Index of another container with the same key
+    other = _container(data).getvalue()
+    other_index_offset = _trailer.unpack_from(other, len(other) - _trailer.size - 4)[0]
+    with pytest.raises(MalformedChunkException):
+        ContainerReader(io.BytesIO(container[:index_offset] + other[other_index_offset:]), enc_key)
+    # Several index frames: dropping the last one
+    monkeypatch.setattr(container_module, "_index_entries_per_chunk", 3)
+    container = _container(data).getvalue()
+    trailer_start = len(container) - _trailer.size - 4
+    index_offset, frames = _trailer.unpack_from(container, trailer_start)
+    assert frames == 4
+    assert ContainerReader(io.BytesIO(container), enc_key).read() == data
+    last_frame = index_offset
+    for _ in range(frames - 1):
+        last_frame += 4 + int.from_bytes(container[last_frame:last_frame + 4], "big")
+    rewritten = container[:last_frame] + _trailer.pack(index_offset, frames - 1) + container[-4:]
+    with pytest.raises(MalformedChunkException):
+        ContainerReader(io.BytesIO(rewritten), enc_key)
+
+
+def test_failed_writer_leaves_no_trailer():
+    file = io.BytesIO()
+    with pytest.raises(RuntimeError):
+        with ContainerWriter(file, enc_key, 1000) as writer:
+            writer.write(os.urandom(2500))
+            raise RuntimeError("interrupted")
+    assert writer.closed
+    file.seek(0)
+    with pytest.raises(MalformedChunkException):
+        ContainerReader(file, enc_key)
@@ -15,18 +15,33 @@
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import json
+import mmap
 import os
 import sys
+import pickle
 import random
+import signal
 import string
+import threading
+import tracemalloc
 import pytest
 
-from locsec_aes.EncryptionException import EncryptionException
-from locsec_aes.encryption import encrypt_data, decrypt_data, data_size_max
+from locsec_aes import encryption, logger as logger_settings
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException, HashMismatchException, \
+    BadKeyException, OversizeException
+from locsec_aes.encryption import encrypt_data, decrypt_data, data_size_max, LocSecCipher, encrypt_into, \
+    decrypt_into, encrypted_size, decrypted_size
 
 default_encoding = sys.getdefaultencoding()
 enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
 test_data_default = "abcdef_)1245%#@!()&%"
+# "LocSec v1 chunk" encrypted by version 1 of the format (with IV 00 01 02 ... 0f)
+v1_chunk = bytearray.fromhex(
+    "000102030405060708090a0b0c0d0e0f19159c11c5ffd609143c2f0effdcd8641e5565c7b8ed5e79879c0b5c39979dfc47bebdc401e6d27a"
+    "ab86bbe640649b684a3923ed427f0f58d1c6dfd209c192e55d7f201ab68ba73e7f8e56fb71425503ef5806e9d3a69335970a346de01244f9"
+    "7074a1ba4e783cd52663a54c095d4fc5f1ab8518d1dcfb5b1af3b7c67686868b71283c32fe8f9c8090d05cb09277feca88749f4392885aa5"
+    "beeb6553f82bef311e4531544c073a5bfb8d34d407052d2876db7fbc41aa89110d742c23d65dbf5052da73c2f3e76786c21b4d0c81610dd2"
+    "8d6c1288a7df9b385684569a9d8b1cced139a1398641aee30309407fb1399b36")
 
 
 def test_int_1():
@@ -224,3 +239,427 @@ def test_no_data():
     test_data = ""
     encrypted = encrypt_data(test_data, enc_key)
     assert decrypt_data(encrypted, enc_key) == test_data
+
+
+def test_cipher_1():
+    cipher = LocSecCipher(enc_key)
+    for test_data in ["", test_data_default, "a" * 1000]:
+        assert cipher.decrypt(cipher.encrypt(test_data)) == test_data
+
+
+def test_cipher_compatible():
+    cipher = LocSecCipher(enc_key)
+    assert decrypt_data(cipher.encrypt(test_data_default), enc_key) == test_data_default
+    assert cipher.decrypt(encrypt_data(test_data_default, enc_key)) == test_data_default
+
+
+def test_cipher_same_iv_same_chunk():
+    # Reusing the AES state must give the same result as a fresh cipher with the same IV
+    initial_vector = os.urandom(16)
+    cipher = LocSecCipher(enc_key)
+    first = cipher.encrypt(test_data_default, initial_vector)
+    cipher.encrypt("something in between")
+    assert cipher.encrypt(test_data_default, initial_vector) == first
+    assert LocSecCipher(enc_key).encrypt(test_data_default, initial_vector) == first
+
+
+def test_cipher_bad_key():
+    with pytest.raises(EncryptionException):
+        LocSecCipher("fdsfds")
+
+
+def test_cipher_wrong_key():
+    with pytest.raises(EncryptionException):
+        LocSecCipher(enc_key + "1").decrypt(LocSecCipher(enc_key).encrypt(test_data_default))
+
+
+def test_cipher_pickle():
+    cipher = pickle.loads(pickle.dumps(LocSecCipher(enc_key)))
+    assert cipher.decrypt(cipher.encrypt(test_data_default)) == test_data_default
+
+
+def test_cipher_threads():
+    cipher = LocSecCipher(enc_key)
+    errors = []
+
+    def worker():
+        for i in range(200):
+            test_data = "{}-{}".format(threading.get_ident(), i)
+            if cipher.decrypt(cipher.encrypt(test_data)) != test_data:
+                errors.append(test_data)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+
+def test_encrypted_size():
+    for size in [0, 1, 15, 16, 175, 176, 177, 4095, 4096, 4097, 100000]:
+        assert encrypted_size(size) == len(encrypt_data(bytearray(size), enc_key))
+    # Bucket tuples don't have to be sorted, bad policies and modes are rejected
+    assert encrypted_size(10, padding=(1024, 64)) == len(encrypt_data(bytearray(10), enc_key, padding=(1024, 64)))
+    for padding, mode in (("unknown", "cbc"), ((15,), "cbc"), ("block", "ecb")):
+        with pytest.raises(EncryptionException):
+            encrypted_size(10, mode, padding)
+
+
+def test_into_1():
+    test_data = os.urandom(100000)
+    output = bytearray(encrypted_size(len(test_data)) + 100)
+    written = encrypt_into(memoryview(test_data), output, enc_key)
+    assert written == encrypted_size(len(test_data))
+    assert decrypt_data(output[:written], enc_key, return_raw=True) == test_data
+    assert decrypted_size(bytes(output[:written]), enc_key) == len(test_data)
+    decrypted = bytearray(len(test_data))
+    assert decrypt_into(memoryview(output)[:written], decrypted, enc_key) == len(test_data)
+    assert decrypted == test_data
+
+
+def test_into_small():
+    for test_data in [b"", b"a", os.urandom(17)]:
+        output = bytearray(encrypted_size(len(test_data)))
+        encrypt_into(test_data, output, enc_key)
+        decrypted = bytearray(len(test_data))
+        assert decrypt_into(output, decrypted, enc_key) == len(test_data)
+        assert decrypted == test_data
+
+
+def test_into_mmap():
+    test_data = os.urandom(70000)
+    with mmap.mmap(-1, len(test_data)) as source:
+        source.write(test_data)
+        with mmap.mmap(-1, encrypted_size(len(test_data))) as destination:
+            encrypt_into(source, destination, enc_key)
+            assert decrypt_data(bytearray(destination), enc_key, return_raw=True) == test_data
+
+
+def test_into_output_too_small():
+    with pytest.raises(EncryptionException):
+        encrypt_into(b"data", bytearray(100), enc_key)
+    chunk = encrypt_data(b"data", enc_key)
+    with pytest.raises(EncryptionException):
+        decrypt_into(chunk, bytearray(3), enc_key)
+    with pytest.raises(EncryptionException):
+        decrypt_into(chunk, bytes(100), enc_key)
+
+
+def test_into_broken_data():
+    chunk = encrypt_data(os.urandom(10000), enc_key)
+    chunk[5000] ^= 1
+    with pytest.raises(EncryptionException):
+        decrypt_into(chunk, bytearray(10000), enc_key)
+    with pytest.raises(EncryptionException):
+        decrypt_into(chunk[:-1], bytearray(10000), enc_key)
+
+
+def test_into_peak_memory():
+    test_data = os.urandom(8 * 1024 * 1024)
+    cipher = LocSecCipher(enc_key)
+    output = bytearray(encrypted_size(len(test_data)))
+    decrypted = bytearray(len(test_data))
+    tracemalloc.start()
+    try:
+        cipher.encrypt_into(test_data, output)
+        cipher.decrypt_into(output, decrypted)
+        into_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        cipher.decrypt(cipher.encrypt(test_data), return_raw=True)
+        allocating_peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    assert decrypted == test_data
+    # Nothing but a few blocks besides input and output buffers
+    assert into_peak < 64 * 1024
+    # Only the encrypted chunk and the decrypted data are allocated
+    assert allocating_peak < 2.1 * len(test_data)
+
+
+def test_v1_chunk():
+    assert decrypt_data(v1_chunk, enc_key) == "LocSec v1 chunk"
+    assert LocSecCipher(enc_key).decrypted_size(v1_chunk) == len("LocSec v1 chunk")
+    decrypted = bytearray(15)
+    assert decrypt_into(v1_chunk, decrypted, enc_key) == 15
+    broken_chunk = bytearray(v1_chunk)
+    broken_chunk[90] ^= 1
+    with pytest.raises(EncryptionException):
+        decrypt_data(broken_chunk, enc_key)
+
+
+def test_v2_chunk():
+    encrypted = encrypt_data(test_data_default, enc_key)
+    assert encrypted[:4] == b"LSA\x02"
+    # Version 2 chunks are never AES-block aligned (so they can't be confused with version 1 chunks)
+    assert len(encrypted) % 16 == 5
+
+
+def test_v2_header_tampered():
+    encrypted = encrypt_data(test_data_default, enc_key)
+    for position in [0, 3, 4]:
+        broken_chunk = bytearray(encrypted)
+        broken_chunk[position] ^= 1
+        with pytest.raises(EncryptionException):
+            decrypt_data(broken_chunk, enc_key)
+
+
+def test_v2_wrong_key_headers_only():
+    encrypted = encrypt_data(os.urandom(100000), enc_key)
+    with pytest.raises(EncryptionException):
+        LocSecCipher(enc_key + "1").decrypted_size(encrypted)
+
+
+def test_gcm_1():
+    for test_data in [b"", b"a", os.urandom(1000), os.urandom(100000)]:
+        encrypted = encrypt_data(test_data, enc_key, mode="gcm")
+        assert len(encrypted) == encrypted_size(len(test_data), "gcm")
+        assert len(encrypted) % 16 != 0
+        assert decrypt_data(encrypted, enc_key, return_raw=True) == test_data
+        assert decrypted_size(encrypted, enc_key) == len(test_data)
+        decrypted = bytearray(len(test_data))
+        assert decrypt_into(encrypted, decrypted, enc_key) == len(test_data)
+        assert decrypted == test_data
+
+
+def test_gcm_cipher_mode():
+    cipher = LocSecCipher(enc_key, mode="gcm")
+    encrypted = cipher.encrypt(test_data_default)
+    assert encrypted[4] == 1
+    assert LocSecCipher(enc_key).decrypt(encrypted) == test_data_default
+    assert cipher.encrypt(test_data_default, mode="cbc")[4] == 0
+
+
+def test_gcm_tampered():
+    for size in [100, 100000]:
+        encrypted = encrypt_data(os.urandom(size), enc_key, mode="gcm")
+        for position in [4, 10, 20, 40, len(encrypted) - 20, len(encrypted) - 1]:
+            broken_chunk = bytearray(encrypted)
+            broken_chunk[position] ^= 1
+            with pytest.raises(EncryptionException):
+                decrypt_data(broken_chunk, enc_key)
+
+
+def test_gcm_wrong_key():
+    with pytest.raises(EncryptionException):
+        LocSecCipher(enc_key + "1").decrypt(encrypt_data(test_data_default, enc_key, mode="gcm"))
+
+
+def test_gcm_bad_nonce():
+    with pytest.raises(EncryptionException):
+        encrypt_data(test_data_default, enc_key, initial_vector=os.urandom(16), mode="gcm")
+
+
+def test_unknown_mode():
+    with pytest.raises(EncryptionException):
+        encrypt_data(test_data_default, enc_key, mode="ecb")
+    with pytest.raises(EncryptionException):
+        LocSecCipher(enc_key, mode="ecb")
+
+
+@pytest.fixture
+def parallel_decrypt(monkeypatch):
+    monkeypatch.setattr(encryption, "parallel_decrypt_workers", 4)
+    monkeypatch.setattr(encryption, "parallel_decrypt_threshold", 65536)
+    monkeypatch.setattr(encryption, "parallel_decrypt_segment_min", 16384)
+    monkeypatch.setattr(encryption, "_parallel_decrypt_pool", None)
+    yield
+    encryption._parallel_decrypt_pool.shutdown()
+
+
+def test_parallel_decrypt(parallel_decrypt):
+    cipher = LocSecCipher(enc_key)
+    for size in [65536, 65537, 100000, 1000003, data_size_max]:
+        test_data = os.urandom(size)
+        encrypted = cipher.encrypt(test_data)
+        assert encryption._parallel_decrypt_segments(size - size % 16)
+        assert cipher.decrypt(encrypted, return_raw=True) == test_data
+        decrypted = bytearray(size)
+        assert cipher.decrypt_into(encrypted, decrypted) == size
+        assert decrypted == test_data
+    # Chained decryptor is still fine after parallel decryption
+    assert cipher.decrypt(cipher.encrypt(test_data_default)) == test_data_default
+
+
+def test_parallel_decrypt_tampered(parallel_decrypt):
+    encrypted = encrypt_data(os.urandom(1000000), enc_key)
+    for position in [200, 500000, 999990]:
+        broken_chunk = bytearray(encrypted)
+        broken_chunk[position] ^= 1
+        with pytest.raises(EncryptionException):
+            decrypt_data(broken_chunk, enc_key)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="no fork")
+def test_parallel_decrypt_fork(parallel_decrypt):
+    cipher = LocSecCipher(enc_key)
+    test_data = os.urandom(1000000)
+    encrypted = cipher.encrypt(test_data)
+    # All workers of the parent's pool are started before the fork
+    threads = [threading.Thread(target=cipher.decrypt, args=(encrypted,), kwargs={"return_raw": True})
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            signal.alarm(10)
+            os.write(write_end, b"1" if cipher.decrypt(encrypted, return_raw=True) == test_data else b"0")
+        finally:
+            os._exit(0)
+    os.close(write_end)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status)
+    assert os.read(read_end, 1) == b"1"
+    os.close(read_end)
+
+
+@pytest.mark.parametrize("padding,lengths", [("bucket256", [277, 277, 533]), ("pow2", [85, 149, 533]),
+                                             ("block", [85, 133, 373]), ([64, 128, 1024], [85, 149, 1045])])
+def test_padding_lengths(padding, lengths):
+    for data_length, chunk_length in zip([1, 60, 300], lengths):
+        assert encrypted_size(data_length, padding=padding) == chunk_length
+        encrypted = encrypt_data(bytearray(data_length), enc_key, padding=padding)
+        assert len(encrypted) == chunk_length
+        assert decrypt_data(encrypted, enc_key, return_raw=True) == bytearray(data_length)
+
+
+@pytest.mark.parametrize("padding", ["pow2", "block", [32, 48, 64]])
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+def test_padding_roundtrip(padding, mode):
+    cipher = LocSecCipher(enc_key, mode, padding=padding)
+    for data_length in [0, 1, 15, 16, 17, 4096, 70000]:
+        data = bytearray(os.urandom(data_length))
+        encrypted = cipher.encrypt(data)
+        assert len(encrypted) == encrypted_size(data_length, mode, padding)
+        assert LocSecCipher(enc_key).decrypt(encrypted, return_raw=True) == data
+        output = bytearray(len(encrypted))
+        assert encrypt_into(data, output, enc_key, mode=mode, padding=padding) == len(encrypted)
+        assert decrypt_data(output, enc_key, return_raw=True) == data
+
+
+def test_padding_recorded():
+    for padding, flags in [("bucket256", 0x00), ("pow2", 0x04), ("block", 0x08), ([1024], 0x0c)]:
+        headers = LocSecCipher(enc_key)._decrypt_headers(memoryview(encrypt_data("a", enc_key, padding=padding)))
+        assert headers.data_flags & encryption.padding_flags_mask == flags
+
+
+def test_padding_max():
+    for padding in ["pow2", [encryption.padded_length_max]]:
+        assert encrypted_size(data_size_max, "gcm", padding) <= encryption.chunk_length_max
+
+
+@pytest.mark.parametrize("padding", ["bucket16", [], [100], [0], [16, "32"], 5])
+def test_bad_padding(padding):
+    with pytest.raises(EncryptionException):
+        LocSecCipher(enc_key, padding=padding)
+
+
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+def test_inspect_chunk(mode):
+    encrypted = encrypt_data("data " * 1000, enc_key, mode=mode, compression="zlib", padding="pow2")
+    info = encryption.inspect_chunk(encrypted, enc_key)
+    assert (info.version, info.mode, info.key_id, info.data_length, info.compression, info.padding) == \
+        (2, mode, None, 5000, "zlib", "pow2")
+    assert info.stored_length < info.data_length
+    assert (info.data_hash is None) == (mode == "gcm")
+    info = encryption.inspect_chunk(LocSecCipher(enc_key, mode, typed=True, key_id=7, padding=[1024]).encrypt(1),
+                                    enc_key)
+    assert (info.key_id, info.data_length, info.data_type, info.compression, info.padding) == (7, 8, 5, None, "custom")
+    info = encryption.inspect_chunk(v1_chunk, enc_key)
+    assert (info.version, info.mode, info.data_length) == (1, "cbc", len("LocSec v1 chunk"))
+
+
+def test_inspect_chunk_foreign():
+    with pytest.raises(EncryptionException):
+        encryption.inspect_chunk(encrypt_data("data", enc_key), "some other key")
+    with pytest.raises(EncryptionException):
+        encryption.inspect_chunk(bytearray(os.urandom(277)), enc_key)
+
+
+@pytest.mark.parametrize("size", [0, 15, 4096, 200000, data_size_max])
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+def test_verify_chunk(size, mode):
+    encrypted = encrypt_data(bytearray(os.urandom(size)), enc_key, mode=mode)
+    assert encryption.verify_chunk(encrypted, enc_key)
+    assert encryption.verify_chunk(bytes(encrypted), enc_key)
+    assert not encryption.verify_chunk(encrypted, "some other key")
+    encrypted[len(encrypted) // 2] ^= 1
+    # Padding of CBC chunks isn't covered by the hash
+    assert encryption.verify_chunk(encrypted, enc_key) == (mode == "cbc" and len(encrypted) // 2 >= 69 + size)
+
+
+def test_verify_chunk_v1():
+    assert encryption.verify_chunk(v1_chunk, enc_key)
+    tampered = bytearray(v1_chunk)
+    tampered[90] ^= 1
+    assert not encryption.verify_chunk(tampered, enc_key)
+    assert not encryption.verify_chunk(bytearray(os.urandom(277)), enc_key)
+    assert not encryption.verify_chunk(bytearray(), enc_key)
+
+
+def test_verify_chunk_memory():
+    encrypted = encrypt_data(bytearray(data_size_max), enc_key)
+    tracemalloc.start()
+    try:
+        assert encryption.verify_chunk(encrypted, enc_key)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 1048576
+
+
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+def test_rejection_types(mode):
+    chunk = encrypt_data(test_data_default, enc_key, mode=mode)
+    tampered = bytearray(chunk)
+    tampered[70] ^= 1
+    with pytest.raises(HashMismatchException):
+        decrypt_data(tampered, enc_key)
+    with pytest.raises(BadKeyException):
+        decrypt_data(chunk, enc_key + "x")
+    with pytest.raises(MalformedChunkException):
+        decrypt_data(bytearray(b"garbage"), enc_key)
+    with pytest.raises(BadKeyException):
+        LocSecCipher("short")
+    with pytest.raises(OversizeException):
+        LocSecCipher(enc_key).encrypt(bytearray(data_size_max + 1))
+
+
+def test_lazy_exception_message():
+    assert str(EncryptionException("Plain {} message")) == "Plain {} message"
+    assert str(MalformedChunkException("Bad {} ({})", "flags", 3)) == "Bad flags (3)"
+
+
+def test_rejections_quiet(caplog):
+    garbage = bytearray(b"LSA" + bytes(100))
+    logger_settings.set_quiet_rejections()
+    try:
+        with caplog.at_level("ERROR", logger="LocSec-AES"):
+            with pytest.raises(MalformedChunkException) as error:
+                decrypt_data(garbage, enc_key)
+        # The original exception is raised as is, nothing is logged
+        assert "LocSec chunk version" in str(error.value)
+        assert not caplog.records
+    finally:
+        logger_settings.set_quiet_rejections(False)
+
+
+def test_rejections_rate_limited(caplog, monkeypatch):
+    monkeypatch.setattr(logger_settings, "rate_limit", 3)
+    monkeypatch.setattr(logger_settings, "_limits", {})
+    with caplog.at_level("ERROR", logger="LocSec-AES"):
+        for _ in range(10):
+            with pytest.raises(MalformedChunkException, match="Check logs"):
+                decrypt_data(bytearray(b"garbage"), enc_key)
+    assert len(caplog.records) == 3
+    assert caplog.records[0].exc_info is not None
+    monkeypatch.setattr(logger_settings, "rate_limit_interval", 0)
+    with caplog.at_level("ERROR", logger="LocSec-AES"):
+        with pytest.raises(MalformedChunkException):
+            decrypt_data(bytearray(b"garbage"), enc_key)
+    assert caplog.records[-2].getMessage() == "7 more messages like the next one were suppressed"
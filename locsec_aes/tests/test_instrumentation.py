@@ -0,0 +1,98 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import pytest
+
+from locsec_aes import instrumentation
+from locsec_aes.EncryptionException import EncryptionException
+from locsec_aes.encryption import LocSecCipher, encrypt_data, decrypt_data, decrypted_size
+
+enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+
+
+@pytest.fixture
+def measurements():
+    result = []
+    instrumentation.enable(result.append)
+    yield result
+    instrumentation.disable()
+
+
+def test_disabled_by_default():
+    assert not instrumentation.enabled
+    assert decrypt_data(encrypt_data("data", enc_key), enc_key) == "data"
+
+
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+def test_phases(measurements, mode):
+    chunk = encrypt_data(bytearray(1000), enc_key, mode=mode, compression="zlib")
+    decrypt_data(chunk, enc_key, return_raw=True)
+    encrypted, decrypted = measurements
+    assert encrypted.operation == "encrypt" and decrypted.operation == "decrypt"
+    assert {"key", "encode", "compress", "pad", "aes", "other"} <= set(encrypted.phases)
+    assert {"key", "headers", "aes", "decompress", "other"} <= set(decrypted.phases)
+    assert ("hash" in encrypted.phases) == (mode == "cbc")
+    assert ("verify" if mode == "gcm" else "hash") in decrypted.phases
+    assert encrypted.data_length == len(chunk) and decrypted.data_length == 1000
+    for measurement in measurements:
+        assert not measurement.error
+        assert sum(measurement.phases.values()) == pytest.approx(measurement.total)
+
+
+def test_nested_and_failed_calls(measurements):
+    cipher = LocSecCipher(enc_key)
+    # Cipher method called from a module function is a part of one measurement
+    cipher.decrypt_into(cipher.encrypt(b"abc"), bytearray(3))
+    assert [m.operation for m in measurements] == ["encrypt", "decrypt"]
+    assert measurements[1].data_length == 3
+    with pytest.raises(EncryptionException):
+        decrypt_data(bytearray(64), enc_key)
+    assert measurements[-1].error
+    # Measurement state is not left behind after an error
+    cipher.encrypt(b"abc")
+    assert len(measurements) == 4 and not measurements[-1].error
+
+
+def test_data_length_in_bytes(measurements):
+    # Counted from chunks, not guessed from decoded results
+    for data, length in ((10 ** 12, 8), ({"a": 1, "b": 2}, None), ("\u00e9" * 10, 20)):
+        chunk = encrypt_data(data, enc_key, typed=True)
+        assert decrypt_data(chunk, enc_key) == data
+        encrypted, decrypted = measurements[-2:]
+        assert encrypted.data_length == len(chunk)
+        assert decrypted.data_length == (length or decrypted_size(chunk, enc_key))
+    sink = instrumentation.HistogramSink()
+    instrumentation.enable(sink)
+    decrypt_data(encrypt_data(10 ** 12, enc_key, typed=True), enc_key)
+    assert sink.counters["decrypt"]["bytes"] == 8
+
+
+def test_histogram_sink():
+    sink = instrumentation.HistogramSink(buckets=[0.001, 1])
+    instrumentation.enable(sink, instrumentation.CallbackSink(lambda measurement: None))
+    try:
+        for _ in range(3):
+            decrypt_data(encrypt_data(b"data", enc_key), enc_key)
+    finally:
+        instrumentation.disable()
+    assert sink.counters["encrypt"]["calls"] == 3
+    assert sink.counters["decrypt"]["bytes"] == 12
+    assert sink.percentile("encrypt", "total", 50) in (0.001, 1)
+    assert sink.percentile("encrypt", "missing", 50) is None
+    text = sink.prometheus()
+    assert 'locsec_aes_calls_total{operation="decrypt"} 3' in text
+    assert 'locsec_aes_phase_seconds_bucket{operation="encrypt",phase="aes",le="+Inf"} 3' in text
+    assert 'locsec_aes_phase_seconds_count{operation="decrypt",phase="total"} 3' in text
@@ -0,0 +1,84 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from locsec_aes import iv
+from locsec_aes.encryption import LocSecCipher
+
+enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+
+
+@pytest.fixture
+def provider():
+    previous = iv.provider
+    yield
+    iv.set_provider(previous)
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_buffered_unique(background):
+    provider = iv.BufferedProvider(256, background)
+    values = [provider(16) for _ in range(1000)] + [provider(12) for _ in range(1000)]
+    assert all(len(value) == 16 for value in values[:1000]) and all(len(value) == 12 for value in values[1000:])
+    assert len(set(values)) == len(values)
+    assert len(provider(1000)) == 1000
+
+    with ThreadPoolExecutor(4) as executor:
+        values = [value for values in executor.map(lambda _: [provider(16) for _ in range(500)], range(8))
+                  for value in values]
+    assert len(set(values)) == len(values)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="no fork")
+def test_buffered_fork():
+    provider = iv.BufferedProvider()
+    provider(16)
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_end, provider(16))
+        os._exit(0)
+    os.waitpid(pid, 0)
+    # Child didn't take the next IV of the parent's pool
+    assert os.read(read_end, 16) != provider(16)
+    os.close(read_end)
+    os.close(write_end)
+
+
+def test_deterministic(provider):
+    assert iv.DeterministicProvider(1)(16) == iv.DeterministicProvider(1)(16) != iv.DeterministicProvider(2)(16)
+    assert len(iv.DeterministicProvider()(100)) == 100
+    cipher = LocSecCipher(enc_key)
+    chunks = []
+    for _ in range(2):
+        iv.set_provider(iv.DeterministicProvider(5))
+        chunks.append([cipher.encrypt(b"data", mode=mode) for mode in ("cbc", "gcm")])
+    assert chunks[0] == chunks[1]
+    assert cipher.decrypt(chunks[0][1], return_raw=True) == b"data"
+
+
+def test_set_provider(provider):
+    previous = iv.set_provider(iv.SystemProvider())
+    assert isinstance(previous, iv.BufferedProvider)
+    cipher = LocSecCipher(enc_key)
+    assert cipher.decrypt(cipher.encrypt(b"data"), return_raw=True) == b"data"
+    assert cipher.encrypt(b"data") != cipher.encrypt(b"data")
+    with pytest.raises(TypeError):
+        iv.set_provider(b"not callable")
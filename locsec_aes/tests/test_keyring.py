@@ -0,0 +1,131 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import pickle
+import pytest
+
+from locsec_aes.EncryptionException import EncryptionException
+from locsec_aes.encryption import LocSecCipher, encrypt_data, decrypt_data, chunk_key_id, encrypted_size, \
+    encrypt_into
+from locsec_aes.keyring import KeyRing
+
+old_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+new_key = "Xk2#9fLq!pW7zR0m@vB4nT8s"
+test_items = ["item {}".format(i) for i in range(50)]
+
+
+@pytest.fixture
+def key_ring():
+    key_ring = KeyRing()
+    key_ring.add_key(old_key, key_id=1)
+    key_ring.add_key(new_key, key_id=2)
+    return key_ring
+
+
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+def test_key_ring_roundtrip(key_ring, mode):
+    encrypted = key_ring.encrypt("data", mode=mode)
+    assert chunk_key_id(encrypted) == 1
+    assert len(encrypted) == encrypted_size(4, mode, with_key_id=True)
+    assert key_ring.decrypt(encrypted) == "data"
+    key_ring.set_current(2)
+    assert chunk_key_id(key_ring.encrypt("data")) == 2
+    assert key_ring.decrypt(encrypted) == "data"
+    # Key ID doesn't stop the key from decrypting its chunks on its own
+    assert decrypt_data(encrypted, old_key) == "data"
+
+
+def test_key_ring_lookup(key_ring):
+    encrypted = LocSecCipher(new_key, key_id=1).encrypt("data")
+    # Key is picked by ID only: key 1 doesn't fit
+    with pytest.raises(EncryptionException):
+        key_ring.decrypt(encrypted)
+    with pytest.raises(EncryptionException):
+        key_ring.decrypt(LocSecCipher(new_key, key_id=3).encrypt("data"))
+
+
+def test_key_ring_without_key_id(key_ring):
+    assert chunk_key_id(encrypt_data("data", new_key)) is None
+    assert key_ring.decrypt(encrypt_data("data", new_key)) == "data"
+    assert key_ring.decrypt(encrypt_data("data", old_key, mode="gcm")) == "data"
+    with pytest.raises(EncryptionException):
+        key_ring.decrypt(encrypt_data("data", "some other key"))
+
+
+def test_key_ring_derived_ids():
+    key_ring = KeyRing(mode="gcm", typed=True)
+    old_id = key_ring.add_key(old_key)
+    new_id = key_ring.add_key(new_key, current=True)
+    assert old_id != new_id
+    assert KeyRing().add_key(old_key) == old_id
+    assert key_ring.current_key_id == new_id
+    assert key_ring.decrypt(key_ring.encrypt({"a": 1})) == {"a": 1}
+    with pytest.raises(EncryptionException):
+        key_ring.add_key(new_key)
+    with pytest.raises(EncryptionException):
+        key_ring.remove_key(new_id)
+    key_ring.remove_key(old_id)
+    assert key_ring.key_ids == [new_id]
+
+
+def test_key_ring_empty():
+    with pytest.raises(EncryptionException):
+        KeyRing().encrypt("data")
+    with pytest.raises(EncryptionException):
+        KeyRing().decrypt(encrypt_data("data", old_key))
+    with pytest.raises(EncryptionException):
+        KeyRing(padding="bucket16")
+
+
+def test_reencrypt(key_ring):
+    chunks = [key_ring.encrypt("data"), encrypt_data("data", old_key, padding="block"),
+              key_ring.encrypt({"a": [1, 2]}, typed=True, mode="gcm"),
+              key_ring.encrypt("data " * 1000, compression="zlib")]
+    key_ring.set_current(2)
+    reencrypted = [key_ring.reencrypt(chunk) for chunk in chunks]
+    assert [chunk_key_id(chunk) for chunk in reencrypted] == [2] * 4
+    assert len(reencrypted[1]) == encrypted_size(4, padding="block", with_key_id=True)
+    assert len(reencrypted[3]) == len(chunks[3])
+    key_ring.remove_key(1)
+    assert [key_ring.decrypt(chunk) for chunk in reencrypted] == ["data", "data", {"a": [1, 2]}, "data " * 1000]
+    assert key_ring.reencrypt(reencrypted[0]) == reencrypted[0]
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_reencrypt_many(key_ring, executor):
+    chunks = [key_ring.encrypt(item) for item in test_items]
+    chunks[7] = encrypt_data("item 7", "some other key")
+    key_ring.set_current(2)
+    reencrypted = key_ring.reencrypt_many(chunks, workers=4, executor=executor)
+    assert isinstance(reencrypted[7], EncryptionException)
+    assert all(chunk_key_id(chunk) == 2 for i, chunk in enumerate(reencrypted) if i != 7)
+    assert [decrypt_data(chunk, new_key) for i, chunk in enumerate(reencrypted) if i != 7] == \
+        [item for i, item in enumerate(test_items) if i != 7]
+
+
+def test_key_id_cipher():
+    cipher = pickle.loads(pickle.dumps(LocSecCipher(old_key, key_id=0xffffffff)))
+    output = bytearray(encrypted_size(10, with_key_id=True))
+    assert encrypt_into(bytearray(10), output, old_key) < len(output)
+    cipher.encrypt_into(bytearray(10), output)
+    assert chunk_key_id(output) == 0xffffffff
+    assert decrypt_data(output, old_key, return_raw=True) == bytearray(10)
+    output[6] ^= 1
+    with pytest.raises(EncryptionException):
+        decrypt_data(output, old_key)
+    for key_id in [-1, 1 << 32, "1"]:
+        with pytest.raises(EncryptionException):
+            LocSecCipher(old_key, key_id=key_id)
@@ -0,0 +1,79 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import pytest
+
+from locsec_aes.EncryptionException import MalformedChunkException, OversizeException
+from locsec_aes.encryption import encrypt_data, decrypt_data, data_size_max, LocSecCipher
+from locsec_aes.packed import PackedRecords, pack_records, pack_many, unpack_records, unpack_record
+
+enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+
+
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+def test_roundtrip(mode):
+    records = [b"first", bytearray(b"second"), "third", b"", memoryview(b"fifth")]
+    chunk = pack_records(records, enc_key, mode=mode)
+    unpacked = unpack_records(chunk, enc_key)
+    assert len(unpacked) == 5
+    assert list(unpacked) == [b"first", b"second", b"third", b"", b"fifth"]
+    assert unpacked[-1] == b"fifth" and unpacked[1:3] == [b"second", b"third"]
+    assert unpack_record(chunk, enc_key, 2) == b"third"
+    with pytest.raises(IndexError):
+        unpacked[5]
+
+
+def test_typed():
+    records = [1, "two", 3.0, None, [4], {"five": b"5"}, b"six"]
+    chunk = pack_records(records, enc_key, typed=True, compression="zlib")
+    assert list(unpack_records(chunk, enc_key)) == records
+    # decrypt_data knows packed chunks too
+    decrypted = decrypt_data(chunk, enc_key)
+    assert isinstance(decrypted, PackedRecords) and decrypted[5] == {"five": b"5"}
+
+
+def test_single_record_is_decoded_alone():
+    records = PackedRecords.pack([{"a": 1}, "b"], typed=True)
+    record, tag = records.raw(1)
+    assert bytes(record) == b"b" and tag == 3
+    # Damaged first record doesn't affect the second one
+    broken = bytearray(records.data)
+    broken[records._records_start] ^= 0xff
+    assert PackedRecords(broken)[1] == "b"
+
+
+def test_size_per_record():
+    records = [bytes(50) for _ in range(1000)]
+    packed_length = len(pack_records(records, enc_key))
+    separate_length = sum(len(encrypt_data(record, enc_key)) for record in records[:10]) * 100
+    assert packed_length * 4 < separate_length
+
+
+def test_pack_many():
+    records = [i.to_bytes(4, "big") * 25 for i in range(10000)]
+    chunks = pack_many(records, enc_key, chunk_data_size=65536)
+    assert len(chunks) > 1
+    assert [record for chunk in chunks for record in unpack_records(chunk, enc_key)] == records
+    assert len(pack_many([], enc_key)) == 1
+    with pytest.raises(OversizeException):
+        pack_records([bytes(data_size_max)], enc_key)
+
+
+def test_not_packed():
+    with pytest.raises(MalformedChunkException):
+        unpack_records(LocSecCipher(enc_key).encrypt(b"plain"), enc_key)
+    with pytest.raises(MalformedChunkException):
+        PackedRecords(b"\x00\x00\x00\x00\x05")
@@ -0,0 +1,147 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import random
+import pytest
+
+from locsec_aes.encryption import LocSecCipher
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException
+from locsec_aes.segmented import SegmentedCipher, encrypt_blob, decrypt_blob, update
+
+enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+
+
+def _check_update(cipher, blob, data, offset, new_bytes):
+    before = bytes(blob)
+    ranges = cipher.update(blob, offset, new_bytes)
+    if offset > len(data):
+        data.extend(bytes(offset - len(data)))
+    data[offset:offset + len(new_bytes)] = new_bytes
+    assert cipher.decrypt(blob) == data
+    # Bytes outside of the reported ranges didn't change
+    changed = bytearray(len(blob))
+    for start, end in ranges:
+        changed[start:end] = b"\x01" * (end - start)
+    for position in range(min(len(before), len(blob))):
+        if not changed[position]:
+            assert before[position] == blob[position]
+    return ranges
+
+
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+def test_roundtrip_and_read(mode):
+    data = bytearray(os.urandom(10000))
+    cipher = SegmentedCipher(enc_key, 1024, mode)
+    blob = cipher.encrypt(data)
+    assert decrypt_blob(blob, enc_key) == data
+    assert cipher.read(blob, 1000, 100) == data[1000:1100]
+    assert cipher.read(blob, 9990, 100) == data[9990:]
+    assert cipher.read(blob, 20000, 10) == b""
+    assert decrypt_blob(encrypt_blob(b"", enc_key), enc_key) == b""
+
+
+@pytest.mark.parametrize("mode", ["cbc", "gcm"])
+def test_updates(mode):
+    data = bytearray(os.urandom(10000))
+    cipher = SegmentedCipher(enc_key, 1024, mode)
+    blob = cipher.encrypt(data)
+    # Inside one segment: that segment and the manifest change
+    ranges = _check_update(cipher, blob, data, 2100, b"x" * 10)
+    assert len(ranges) == 2 and ranges[1][1] == len(blob)
+    # Across segments, at the very end, past the end (zeros in between)
+    _check_update(cipher, blob, data, 1000, b"y" * 3000)
+    _check_update(cipher, blob, data, 9990, b"z" * 100)
+    _check_update(cipher, blob, data, 12000, b"tail")
+    _check_update(cipher, blob, data, len(data), b"more" * 300)
+    rng = random.Random(1)
+    for _ in range(30):
+        offset = rng.randrange(len(data) + 2000)
+        _check_update(cipher, blob, data, offset, os.urandom(rng.randrange(1, 3000)))
+    # Blob made by another cipher (default segment size and mode) can be updated with the module function
+    update(blob, 5, b"module", enc_key)
+    data[5:11] = b"module"
+    assert decrypt_blob(blob, enc_key) == data
+
+
+def test_update_empty_blob():
+    blob = encrypt_blob(b"", enc_key, 100)
+    assert update(blob, 0, b"", enc_key) == []
+    update(blob, 150, b"abc", enc_key)
+    assert decrypt_blob(blob, enc_key) == bytes(150) + b"abc"
+
+
+def test_small_edit_touches_little():
+    cipher = SegmentedCipher(enc_key, 4096)
+    blob = cipher.encrypt(os.urandom(1048576))
+    ranges = cipher.update(blob, 500000, b"edit")
+    # One segment and the manifest (32 bytes per segment)
+    assert sum(end - start for start, end in ranges) < 16384
+
+
+def test_damaged_blobs():
+    cipher = SegmentedCipher(enc_key, 1000)
+    blob = cipher.encrypt(os.urandom(5000))
+    with pytest.raises(MalformedChunkException):
+        cipher.decrypt(blob[:-1])
+    with pytest.raises(EncryptionException):
+        SegmentedCipher(enc_key + "x").decrypt(blob)
+    # Old version of a segment is not accepted
+    old = bytes(blob)
+    cipher.update(blob, 10, b"new")
+    replayed = bytearray(blob)
+    replayed[5:1000] = old[5:1000]
+    with pytest.raises(MalformedChunkException):
+        cipher.decrypt(replayed)
+    with pytest.raises(EncryptionException):
+        cipher.update(bytes(blob), 0, b"x")
+
+
+def test_update_keeps_blob_settings():
+    # Updated by ciphers with other defaults, the blob keeps the mode and padding it was made with
+    blob = encrypt_blob(b"", enc_key, segment_size=4096, mode="gcm")
+    data = bytearray(os.urandom(10000))
+    update(blob, 0, data, enc_key)
+    assert decrypt_blob(blob, enc_key) == data
+    update(blob, 5000, b"xyz", enc_key)
+    data[5000:5003] = b"xyz"
+    assert decrypt_blob(blob, enc_key) == data
+    data = bytearray(os.urandom(10000))
+    blob = SegmentedCipher(enc_key, 4096, padding=[16]).encrypt(data)
+    for offset in [5000, 9998, 15000]:
+        update(blob, offset, b"xyz", enc_key)
+        data.extend(bytes(max(0, offset - len(data))))
+        data[offset:offset + 3] = b"xyz"
+        assert decrypt_blob(blob, enc_key) == data
+
+
+def test_update_checks_segments_first(monkeypatch):
+    cipher = SegmentedCipher(enc_key, 1024)
+    blob = cipher.encrypt(os.urandom(5000))
+    before = bytes(blob)
+    encrypt = LocSecCipher.encrypt
+    calls = []
+
+    def second_too_long(self, *args, **kwargs):
+        chunk = encrypt(self, *args, **kwargs)
+        calls.append(chunk)
+        return chunk + bytes(16) if len(calls) == 2 else chunk
+    monkeypatch.setattr(LocSecCipher, "encrypt", second_too_long)
+    with pytest.raises(EncryptionException):
+        cipher.update(blob, 1000, b"x" * 100)
+    # First segment was re-encrypted but not written
+    assert len(calls) == 2
+    assert blob == before
@@ -0,0 +1,209 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import asyncio
+import os
+import socket
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from locsec_aes import cli, protocol
+from locsec_aes.client import LocSecClient
+from locsec_aes.encryption import LocSecCipher
+from locsec_aes.EncryptionException import EncryptionException, BadKeyException, HashMismatchException, \
+    OversizeException
+from locsec_aes.server import LocSecServer
+
+enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+other_key = "Zn2!yQ0p#Lr8uWv5sT7&kX1mB4cD6fG9"
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = LocSecServer(str(tmp_path / "locsec.sock"), {0: enc_key, 7: other_key}, workers=2, inline_length=1024)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield server
+
+    async def stop():
+        server.close()
+        await server.wait_closed()
+    asyncio.run_coroutine_threadsafe(stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+@pytest.mark.parametrize("mode", [None, "gcm"])
+@pytest.mark.parametrize("length", [0, 100, 200000])
+def test_roundtrip(server, mode, length):
+    data = os.urandom(length)
+    cipher = LocSecCipher(enc_key)
+    with LocSecClient(server.path) as client:
+        chunk = client.encrypt(data, mode=mode)
+        assert cipher.decrypt(chunk, return_raw=True) == data
+        assert client.decrypt(chunk) == data
+        assert client.decrypt(cipher.encrypt(data)) == data
+        assert client.decrypt(client.encrypt(data, 7, mode), 7) == data
+
+
+def test_many_pipelined(server):
+    items = [os.urandom(i * 37 % 3000) for i in range(500)]
+    with LocSecClient(server.path) as client:
+        chunks = client.encrypt_many(items, window=16)
+        assert client.decrypt_many(chunks) == items
+        # Errors are returned in place of failed items
+        tampered = bytearray(chunks[3])
+        tampered[70] ^= 1
+        results = client.decrypt_many([chunks[0], tampered, b"junk", chunks[1]])
+        assert results[0] == items[0] and results[3] == items[1]
+        assert isinstance(results[1], HashMismatchException)
+        assert isinstance(results[2], EncryptionException)
+        assert client.encrypt_many([]) == []
+
+
+@pytest.mark.parametrize("count, length", [(2000, 10000), (200, 70000), (64, 1 << 20)])
+def test_many_default_window(server, count, length):
+    # Responses have to be read while requests are sent, or both sides wait for each other with full buffers
+    items = [os.urandom(length)] * count
+    with LocSecClient(server.path, timeout=10) as client:
+        chunks = client.encrypt_many(items)
+        assert client.decrypt_many(chunks) == items
+
+
+def test_many_unsendable_items(server):
+    big = bytearray(protocol.max_payload_length + 1)
+    with LocSecClient(server.path) as client:
+        results = client.encrypt_many([b"first", big, "text", b"last"], window=1)
+        assert isinstance(results[1], OversizeException)
+        assert isinstance(results[2], EncryptionException)
+        assert client.decrypt_many([results[0], results[3]]) == [b"first", b"last"]
+        assert all(isinstance(result, EncryptionException) for result in client.encrypt_many([big, big]))
+        with pytest.raises(OversizeException):
+            client.encrypt(big)
+        # Nothing was sent, the connection is reused
+        assert len(client._idle) == 1
+        assert client.decrypt(client.encrypt(b"data")) == b"data"
+
+
+def test_errors(server):
+    with LocSecClient(server.path) as client:
+        with pytest.raises(BadKeyException):
+            client.encrypt(b"data", key_id=3)
+        with pytest.raises(BadKeyException):
+            client.decrypt(client.encrypt(b"data"), key_id=7)
+        with pytest.raises(EncryptionException):
+            client.encrypt(b"data", mode="ecb")
+        # Connection is still usable after errors
+        assert client.decrypt(client.encrypt(b"data")) == b"data"
+
+
+def test_concurrent_clients(server):
+    with LocSecClient(server.path, pool_size=3) as client:
+        def work(seed):
+            items = [bytes([seed]) * (seed + i) for i in range(50)]
+            assert client.decrypt_many(client.encrypt_many(items)) == items
+            data = os.urandom(5000)
+            assert client.decrypt(client.encrypt(data)) == data
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(work, range(32)))
+        assert len(client._idle) <= 3
+
+
+def test_slow_reader(server):
+    # A client that pipelines big requests without reading responses stops being read
+    server.connection_bytes = 1 << 20
+    processed = []
+    process = server._process
+
+    def counted(*args):
+        processed.append(args[0])
+        return process(*args)
+    server._process = counted
+    count = 50
+    payload = os.urandom(200000)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(server.path)
+
+        def send():
+            for request_id in range(count):
+                connection.sendall(protocol.request_header.pack(len(payload), request_id, protocol.operation_encrypt,
+                                                                0, 0) + payload)
+        sender = threading.Thread(target=send)
+        sender.start()
+        time.sleep(0.5)
+        assert len(processed) < count // 2
+        received = []
+        stream = connection.makefile("rb")
+        for _ in range(count):
+            length, request_id, status = protocol.response_header.unpack(stream.read(protocol.response_header.size))
+            assert status == protocol.status_ok
+            assert LocSecCipher(enc_key).decrypt(stream.read(length), return_raw=True) == payload
+            received.append(request_id)
+        sender.join()
+        assert sorted(received) == list(range(count))
+        assert len(processed) == count
+
+
+def test_server_restart(tmp_path, server):
+    client = LocSecClient(server.path)
+    chunk = client.encrypt(b"data")
+    # Broken connections are dropped, not returned to the pool
+    client._idle[0].socket.close()
+    with pytest.raises(OSError):
+        client.decrypt(chunk)
+    assert client.decrypt(chunk) == b"data"
+    client.close()
+
+
+def test_socket_file(tmp_path):
+    path = str(tmp_path / "locsec.sock")
+
+    async def start():
+        server = LocSecServer(path, enc_key)
+        try:
+            await server.start()
+            return os.stat(path).st_mode
+        finally:
+            server.close()
+    # Permissions don't depend on the umask
+    umask = os.umask(0)
+    try:
+        mode = asyncio.run(start())
+    finally:
+        os.umask(umask)
+    assert stat.S_ISSOCK(mode) and stat.S_IMODE(mode) == 0o600
+    # Stale sockets are replaced, other files are not removed
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(path)
+    asyncio.run(start())
+    with open(path, "wb") as f:
+        f.write(b"data")
+    with pytest.raises(OSError):
+        asyncio.run(start())
+    with open(path, "rb") as f:
+        assert f.read() == b"data"
+
+
+def test_cli_serve_bad_key(tmp_path, capsys):
+    assert cli.main(["serve", str(tmp_path / "locsec.sock"), "--key", "x=file"]) == 1
+    assert "ID=KEY_FILE" in capsys.readouterr().err
@@ -0,0 +1,180 @@
+#  LocSec-AES - Locchan's secure AES encryption
+#  Copyright (C) 2022  Locchan <locchan@protonmail.com>
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  (version 2) as published by the Free Software Foundation.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import io
+import os
+import threading
+import pytest
+
+from locsec_aes.EncryptionException import EncryptionException, MalformedChunkException
+from locsec_aes.streaming import encrypt_stream, decrypt_stream, _stream_header, _frame_header
+
+enc_key = "Ia$&0f^%n2ERUc^beinHU8pXSLR@ir@*h392xdtStpeEy*tJEO"
+segment_size = 1048576
+big_stream_size = 2 * 1024 * 1024 * 1024  # 2 GiB
+rss_growth_max = 32 * 1024 * 1024
+
+
+class PatternReader:
+    # Produces size bytes of a repeating pattern without ever holding them in memory
+    def __init__(self, size):
+        self.left = size
+        self.pattern = os.urandom(segment_size)
+
+    def read(self, size):
+        size = min(size, self.left, len(self.pattern))
+        self.left -= size
+        return self.pattern[:size]
+
+
+class RssSampler:
+    # Counts written bytes and remembers resident set size of the process on every write
+    def __init__(self):
+        self.written = 0
+        self.samples = []
+
+    def write(self, data):
+        self.written += len(data)
+        with open("/proc/self/statm") as statm:
+            self.samples.append(int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE"))
+
+
+def _roundtrip(data, segment=segment_size):
+    encrypted = io.BytesIO()
+    assert encrypt_stream(io.BytesIO(data), encrypted, enc_key, segment) == len(data)
+    decrypted = io.BytesIO()
+    encrypted.seek(0)
+    assert decrypt_stream(encrypted, decrypted, enc_key) == len(data)
+    return decrypted.getvalue()
+
+
+def _encrypted(data, segment=segment_size):
+    encrypted = io.BytesIO()
+    encrypt_stream(io.BytesIO(data), encrypted, enc_key, segment)
+    return encrypted.getvalue()
+
+
+def _frames(stream):
+    # Header and frames (with their frame headers) of an encrypted stream, without the end of the stream
+    position = _stream_header.size
+    frames = []
+    while True:
+        (length,) = _frame_header.unpack_from(stream, position)
+        if not length:
+            return stream[:_stream_header.size], frames
+        frames.append(stream[position:position + _frame_header.size + length])
+        position += _frame_header.size + length
+
+
+def _decrypt_rebuilt(header, frames):
+    decrypt_stream(io.BytesIO(header + b"".join(frames) + _frame_header.pack(0)), io.BytesIO(), enc_key)
+
+
+def test_stream_empty():
+    assert _roundtrip(b"") == b""
+
+
+def test_stream_one_segment():
+    test_data = os.urandom(1000)
+    assert _roundtrip(test_data) == test_data
+
+
+def test_stream_segment_boundaries():
+    for size in (4095, 4096, 4097, 3 * 4096):
+        test_data = os.urandom(size)
+        assert _roundtrip(test_data, 4096) == test_data
+
+
+def test_stream_many_segments():
+    test_data = os.urandom(5 * segment_size + 123)
+    assert _roundtrip(test_data) == test_data
+
+
+def test_stream_truncated():
+    encrypted = io.BytesIO()
+    encrypt_stream(io.BytesIO(os.urandom(10000)), encrypted, enc_key, 4096)
+    with pytest.raises(EncryptionException):
+        decrypt_stream(io.BytesIO(encrypted.getvalue()[:-4]), io.BytesIO(), enc_key)
+
+
+def test_stream_cut_at_frame_boundary():
+    header, frames = _frames(_encrypted(os.urandom(3 * 4096), 4096))
+    assert len(frames) == 3
+    _decrypt_rebuilt(header, frames)
+    for cut in ([], frames[:1], frames[:2]):
+        with pytest.raises(MalformedChunkException):
+            _decrypt_rebuilt(header, cut)
+    # Empty input still has a (final) frame
+    assert len(_frames(_encrypted(b""))[1]) == 1
+
+
+def test_stream_reordered():
+    header, frames = _frames(_encrypted(os.urandom(3 * 4096), 4096))
+    for reordered in ([frames[2], frames[0], frames[1]], [frames[1], frames[0], frames[2]],
+                      [frames[0], frames[0], frames[1], frames[2]], frames + [frames[2]]):
+        with pytest.raises(MalformedChunkException):
+            _decrypt_rebuilt(header, reordered)
+
+
+def test_stream_frame_from_another_stream():
+    data = os.urandom(3 * 4096)
+    header, frames = _frames(_encrypted(data, 4096))
+    other_header, other_frames = _frames(_encrypted(data, 4096))
+    with pytest.raises(MalformedChunkException):
+        _decrypt_rebuilt(header, [frames[0], other_frames[1], frames[2]])
+    with pytest.raises(MalformedChunkException):
+        _decrypt_rebuilt(other_header, frames)
+
+
+def test_stream_not_a_stream():
+    with pytest.raises(EncryptionException):
+        decrypt_stream(io.BytesIO(os.urandom(1000)), io.BytesIO(), enc_key)
+
+
+def test_stream_bad_segment_size():
+    with pytest.raises(EncryptionException):
+        encrypt_stream(io.BytesIO(b"data"), io.BytesIO(), enc_key, 0)
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="needs /proc to measure RSS")
+def test_stream_multi_gb_flat_rss():
+    # Round trip through a pipe: encrypting in a thread, decrypting to the sampler (RSS is of the whole process)
+    read_end, write_end = os.pipe()
+    encrypted_total = []
+
+    def encrypt():
+        with open(write_end, "wb") as encrypted:
+            encrypted_total.append(encrypt_stream(PatternReader(big_stream_size), encrypted, enc_key, segment_size))
+    thread = threading.Thread(target=encrypt)
+    thread.start()
+    sampler = RssSampler()
+    with open(read_end, "rb") as encrypted:
+        assert decrypt_stream(encrypted, sampler, enc_key) == big_stream_size
+    thread.join()
+    assert encrypted_total == [big_stream_size] and sampler.written == big_stream_size
+    # First few writes include warming up the allocator
+    baseline = sampler.samples[10]
+    assert max(sampler.samples[10:]) - baseline < rss_growth_max
+
+
+def test_stream_gcm():
+    test_data = os.urandom(3 * 4096 + 5)
+    encrypted = io.BytesIO()
+    encrypt_stream(io.BytesIO(test_data), encrypted, enc_key, 4096, mode="gcm")
+    decrypted = io.BytesIO()
+    encrypted.seek(0)
+    decrypt_stream(encrypted, decrypted, enc_key)
+    assert decrypted.getvalue() == test_data
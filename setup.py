@@ -3,7 +3,7 @@ from setuptools import setup
 setup(
     name='locsec-aes',
     version='0.1.3.4',
-    packages=['locsec_aes.tests', 'locsec_aes'],
+    packages=['locsec_aes.tests', 'locsec_aes.benchmarks', 'locsec_aes'],
     url='',
     license='GPLv3',
     author='locchan',
@@ -11,5 +11,11 @@ setup(
     install_requires=[
         'pycryptodomex'
     ],
+    extras_require={
+        'cryptography': ['cryptography']
+    },
+    entry_points={
+        'console_scripts': ['locsec-aes = locsec_aes.cli:main']
+    },
     description='LocSec AES. AES Encryptor for LocSec'
 )